@@ -4,6 +4,19 @@ possible.
 __version__ = '1.0.0'
 
 # flake8 doesn't like these imports, but they are needed for other repos
+from addml.archive import *  # noqa: F401,F403
 from addml.base import *  # noqa: F401,F403
+from addml.builder import *  # noqa: F401,F403
+from addml.cache import *  # noqa: F401,F403
 from addml.flatfiles import *  # noqa: F401,F403
+from addml.formats import *  # noqa: F401,F403
+from addml.inference import *  # noqa: F401,F403
+from addml.integrity import *  # noqa: F401,F403
+from addml.merge import *  # noqa: F401,F403
+from addml.model import *  # noqa: F401,F403
+from addml.reader import *  # noqa: F401,F403
+from addml.sniffer import *  # noqa: F401,F403
 from addml.split_addml import *  # noqa: F401,F403
+from addml.split_writer import *  # noqa: F401,F403
+from addml.statistics import *  # noqa: F401,F403
+from addml.validator import *  # noqa: F401,F403
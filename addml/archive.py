@@ -0,0 +1,314 @@
+"""Persistent index of the flat files described in many ADDML data files.
+
+The formats of the flat files are resolved with
+:func:`addml.formats.resolve_flatfile_formats`, the same chain of
+sections that :func:`addml.split_addml.get_charset_with_filename`
+follows, and stored in an SQLite database. Once indexed, the charset and
+delimiters of a flat file are looked up without parsing its ADDML data::
+
+    with ArchiveIndex('archive.sqlite') as index:
+        index.update(addml_paths)
+        index.lookup(addml_path, 'file1.csv').charset
+
+The index is updated incrementally: ADDML data files whose modification
+time and size have not changed are skipped, and files whose contents
+have the same SHA-256 digest as before are not parsed again.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import sqlite3
+from collections.abc import Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from lxml.etree import XMLSyntaxError
+from xml_helpers.utils import readfile
+
+from addml.base import AddmlIndex
+from addml.formats import resolve_flatfile_formats
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS addml_files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flatfiles (
+    addml_id INTEGER NOT NULL REFERENCES addml_files (id),
+    name TEXT NOT NULL,
+    definition TEXT,
+    flatfiletype TEXT,
+    charset TEXT,
+    record_separator TEXT,
+    field_separator TEXT,
+    quoting_char TEXT,
+    error TEXT,
+    PRIMARY KEY (addml_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS flatfiles_name ON flatfiles (name);
+"""
+
+_ENTRY_COLUMNS = ('addml_files.path, name, definition, flatfiletype, '
+                  'charset, record_separator, field_separator, '
+                  'quoting_char, error')
+
+
+class FlatFileEntry(NamedTuple):
+    """Indexed format of a flat file. The error is the message of a
+    broken reference, in which case the format is unknown.
+    """
+    addml_path: str
+    name: str
+    definition: str | None
+    flatfiletype: str | None
+    charset: str | None
+    record_separator: str | None
+    field_separator: str | None
+    quoting_char: str | None
+    error: str | None
+
+
+class UpdateResult(NamedTuple):
+    """Paths of the ADDML data files handled by
+    :meth:`ArchiveIndex.update`. The errors map the paths of the files
+    that could not be read or parsed to error messages.
+    """
+    added: list[str]
+    updated: list[str]
+    unchanged: list[str]
+    errors: dict[str, str]
+
+
+class _Scanned(NamedTuple):
+    """ADDML data file read in a worker thread. The rows are None if the
+    contents have the digest that is already in the index.
+    """
+    path: str
+    mtime_ns: int
+    size: int
+    sha256: str
+    rows: list[tuple] | None
+
+
+class ArchiveIndex:
+    """SQLite index of the flat files of many ADDML data files.
+
+    The ADDML data files are identified by their absolute paths. The
+    index can be used as a context manager that closes the database.
+    """
+
+    def __init__(self, database: str) -> None:
+        """Open or create the index.
+
+        :param database: Path of the SQLite database file, or ':memory:'
+        """
+        self._connection = sqlite3.connect(database)
+        with self._connection:
+            self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self._connection.close()
+
+    def __enter__(self) -> ArchiveIndex:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def update(
+        self,
+        paths: Iterable[str],
+        batch_size: int = 1000,
+        max_workers: int | None = None,
+    ) -> UpdateResult:
+        """Add or update the flat files of ADDML data files in the index.
+
+        The files are read and parsed in a pool of threads, and the
+        results are written in one transaction for each batch of files.
+
+        :param paths: Paths of the ADDML data files
+        :param batch_size: Number of ADDML data files in a transaction
+        :param max_workers: Number of threads reading the files
+        :returns: The paths of the added, updated and unchanged files
+                  and the errors
+        """
+        result = UpdateResult([], [], [], {})
+        known = {
+            path: (addml_id, mtime_ns, size, sha256)
+            for addml_id, path, mtime_ns, size, sha256
+            in self._connection.execute(
+                'SELECT id, path, mtime_ns, size, sha256 FROM addml_files')}
+
+        pending = []
+        for path in dict.fromkeys(map(os.path.abspath, paths)):
+            try:
+                stat = os.stat(path)
+            except OSError as exception:
+                result.errors[path] = str(exception)
+                continue
+            entry = known.get(path)
+            if entry is not None and \
+                    entry[1:3] == (stat.st_mtime_ns, stat.st_size):
+                result.unchanged.append(path)
+            else:
+                pending.append(path)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            scanned = executor.map(
+                lambda path: _scan(path, known.get(path)), pending)
+            batch = []
+            for path, outcome in zip(pending, scanned):
+                if isinstance(outcome, str):
+                    result.errors[path] = outcome
+                    continue
+                batch.append(outcome)
+                if len(batch) >= batch_size:
+                    self._write(batch, known, result)
+                    batch = []
+            self._write(batch, known, result)
+        return result
+
+    def _write(
+        self,
+        batch: list[_Scanned],
+        known: dict[str, tuple[int, int, int, str]],
+        result: UpdateResult,
+    ) -> None:
+        """Write a batch of scanned ADDML data files in a transaction."""
+        if not batch:
+            return
+        with self._connection:
+            for scanned in batch:
+                entry = known.get(scanned.path)
+                if entry is None:
+                    addml_id = self._connection.execute(
+                        'INSERT INTO addml_files (path, mtime_ns, size, '
+                        'sha256) VALUES (?, ?, ?, ?)',
+                        scanned[:4]).lastrowid
+                    result.added.append(scanned.path)
+                else:
+                    addml_id = entry[0]
+                    self._connection.execute(
+                        'UPDATE addml_files SET mtime_ns = ?, size = ?, '
+                        'sha256 = ? WHERE id = ?',
+                        (*scanned[1:4], addml_id))
+                    if scanned.rows is None:
+                        # Only the modification time has changed
+                        result.unchanged.append(scanned.path)
+                        continue
+                    self._connection.execute(
+                        'DELETE FROM flatfiles WHERE addml_id = ?',
+                        (addml_id,))
+                    result.updated.append(scanned.path)
+                self._connection.executemany(
+                    'INSERT INTO flatfiles VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    [(addml_id, *row) for row in scanned.rows])
+
+    def remove(self, paths: Iterable[str]) -> None:
+        """Remove ADDML data files and their flat files from the index.
+        """
+        with self._connection:
+            for path in paths:
+                row = self._connection.execute(
+                    'SELECT id FROM addml_files WHERE path = ?',
+                    (os.path.abspath(path),)).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        'DELETE FROM flatfiles WHERE addml_id = ?', row)
+                    self._connection.execute(
+                        'DELETE FROM addml_files WHERE id = ?', row)
+
+    def lookup(self, addml_path: str, filename: str) -> FlatFileEntry | None:
+        """Return the indexed format of a flat file, or None if the
+        ADDML data file is not indexed or has no flatFile with the
+        filename.
+
+        :param addml_path: Path of the ADDML data file
+        :param filename: @name of the flatFile
+        """
+        row = self._connection.execute(
+            f'SELECT {_ENTRY_COLUMNS} FROM flatfiles JOIN addml_files '
+            f'ON addml_id = addml_files.id '
+            f'WHERE addml_files.path = ? AND name = ?',
+            (os.path.abspath(addml_path), filename)).fetchone()
+        return None if row is None else FlatFileEntry._make(row)
+
+    def get_charset_with_filename(
+        self, addml_path: str, filename: str
+    ) -> str | None:
+        """Return the charset of a flat file in the form returned by
+        :func:`addml.split_addml.get_charset_with_filename`, or None if
+        the flat file is not indexed or its charset is unknown.
+        """
+        entry = self.lookup(addml_path, filename)
+        if entry is None or entry.charset is None:
+            return None
+        return f'charset={entry.charset}'
+
+    def find(self, filename: str) -> list[FlatFileEntry]:
+        """Return the indexed formats of the flat files with the given
+        @name in all ADDML data files.
+        """
+        return [FlatFileEntry._make(row) for row in self._connection.execute(
+            f'SELECT {_ENTRY_COLUMNS} FROM flatfiles JOIN addml_files '
+            f'ON addml_id = addml_files.id WHERE name = ? '
+            f'ORDER BY addml_files.path', (filename,))]
+
+    def iter_entries(
+        self, addml_path: str | None = None
+    ) -> Generator[FlatFileEntry]:
+        """Iterate the indexed flat files, or the flat files of one ADDML
+        data file.
+        """
+        query = (f'SELECT {_ENTRY_COLUMNS} FROM flatfiles JOIN addml_files '
+                 f'ON addml_id = addml_files.id')
+        if addml_path is None:
+            rows = self._connection.execute(
+                query + ' ORDER BY addml_files.path, name')
+        else:
+            rows = self._connection.execute(
+                query + ' WHERE addml_files.path = ? ORDER BY name',
+                (os.path.abspath(addml_path),))
+        yield from map(FlatFileEntry._make, rows)
+
+    def addml_paths(self) -> list[str]:
+        """Return the paths of the indexed ADDML data files."""
+        return [path for path, in self._connection.execute(
+            'SELECT path FROM addml_files ORDER BY path')]
+
+
+def _scan(
+    path: str, entry: tuple[int, int, int, str] | None
+) -> _Scanned | str:
+    """Read and resolve an ADDML data file, or return the error message.
+    Run in a worker thread.
+    """
+    try:
+        with open(path, 'rb') as infile:
+            stat = os.fstat(infile.fileno())
+            data = infile.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        if entry is not None and entry[3] == sha256:
+            return _Scanned(path, stat.st_mtime_ns, stat.st_size, sha256,
+                            None)
+        index = AddmlIndex(readfile(io.BytesIO(data)).getroot())
+        formats, errors = resolve_flatfile_formats(index)
+    except (OSError, XMLSyntaxError, ValueError) as exception:
+        return str(exception)
+
+    rows = [(name, flatfile_format.definition,
+             flatfile_format.flatfiletype, flatfile_format.charset,
+             flatfile_format.record_separator,
+             flatfile_format.field_separator, flatfile_format.quoting_char,
+             None)
+            for name, flatfile_format in formats.items()]
+    rows.extend((name, None, None, None, None, None, None, error)
+                for name, error in errors.items())
+    return _Scanned(path, stat.st_mtime_ns, stat.st_size, sha256, rows)
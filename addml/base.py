@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 from collections.abc import Generator, Iterable
+from functools import lru_cache
 
 import lxml.etree as ET
 import xml_helpers.utils as h
@@ -10,10 +11,16 @@ import xml_helpers.utils as h
 ADDML_NS = 'http://www.arkivverket.no/standarder/addml'
 NAMESPACES = {'addml': ADDML_NS,
               'xsi': h.XSI_NS}
+SCHEMA_LOCATION = ('http://www.arkivverket.no/standarder/addml '
+                   'http://schema.arkivverket.no/ADDML/latest/addml.xsd')
 
+# The nsmap of elements is copied by lxml, so a shared dict can be used
+_ADDML_NSMAP = {'addml': ADDML_NS}
 
+
+@lru_cache(maxsize=None)
 def addml_ns(tag: str, prefix: str = "") -> str:
-    """Adds ADDML namespace to tags"""
+    """Adds ADDML namespace to tags. The results are memoized."""
     if prefix:
         tag = tag[0].upper() + tag[1:]
         return f'{{{ADDML_NS}}}{prefix}{tag}'
@@ -42,8 +49,9 @@ def _element(
 
     """
     if ns is None:
-        ns = {}
-    ns['addml'] = ADDML_NS
+        ns = _ADDML_NSMAP
+    else:
+        ns['addml'] = ADDML_NS
     return ET.Element(addml_ns(tag, prefix), nsmap=ns)
 
 
@@ -67,8 +75,9 @@ def _subelement(
 
     """
     if ns is None:
-        ns = {}
-    ns['addml'] = ADDML_NS
+        ns = _ADDML_NSMAP
+    else:
+        ns['addml'] = ADDML_NS
     return ET.SubElement(parent, addml_ns(tag, prefix), nsmap=ns)
 
 
@@ -87,10 +96,7 @@ def addml(
     if namespaces is None:
         namespaces = NAMESPACES
     addml_ = _element('addml', ns=namespaces)
-    addml_.set(
-        h.xsi_ns('schemaLocation'),
-        'http://www.arkivverket.no/standarder/addml '
-        'http://schema.arkivverket.no/ADDML/latest/addml.xsd')
+    addml_.set(h.xsi_ns('schemaLocation'), SCHEMA_LOCATION)
 
     dataset_ = _subelement(addml_, 'dataset')
 
@@ -113,7 +119,105 @@ def iter_elements(
     :returns: Generator object for iterating all elements
 
     """
-    yield from starting_element.findall('.//' + addml_ns(tag))
+    yield from starting_element.findall(_descendant_path(tag))
+
+
+@lru_cache(maxsize=None)
+def _descendant_path(tag: str) -> str:
+    """Returns the memoized ElementPath expression for finding the
+    descendants with the given tag. lxml caches the compiled expression,
+    which is faster to evaluate than an equivalent XPath.
+    """
+    return './/' + addml_ns(tag)
+
+
+_XPATHS: dict[str, ET.XPath] = {}
+
+
+def register_xpath(
+    name: str,
+    expression: str | ET.XPath,
+    namespaces: dict[str, str] | None = None,
+) -> ET.XPath:
+    """Registers a compiled XPath query of ADDML data with a name, so
+    that it can be shared with :func:`addml_xpath` without compiling it
+    again::
+
+        register_xpath('names', './/addml:flatFile/@name')
+        addml_xpath('names')(root)
+        ['csvfile1.csv', 'csvfile2.csv', ...]
+
+    :param name: Name of the query
+    :param expression: XPath expression, or an already compiled
+                       :class:`lxml.etree.XPath` or
+                       :class:`lxml.etree.ETXPath` object
+    :param namespaces: Namespace prefixes used in the expression
+                       (default=NAMESPACES)
+    :returns: The compiled query
+    """
+    if isinstance(expression, str):
+        if namespaces is None:
+            namespaces = NAMESPACES
+        expression = ET.XPath(expression, namespaces=namespaces)
+    _XPATHS[name] = expression
+    return expression
+
+
+def addml_xpath(name: str) -> ET.XPath:
+    """Returns the compiled XPath query registered with the name.
+
+    :raises KeyError: If no query is registered with the name
+    """
+    return _XPATHS[name]
+
+
+register_xpath('charset', './/addml:charset/text()')
+register_xpath('recordSeparator', './/addml:recordSeparator/text()')
+register_xpath('fieldSeparatingChar',
+               './/addml:fieldSeparatingChar/text()')
+register_xpath('quotingChar', './/addml:quotingChar/text()')
+register_xpath('dataType', './/addml:dataType/text()')
+
+
+def iterparse_sections(
+    source: str, sections: Iterable[str]
+) -> Generator[ET._Element]:
+    """Iterate the sections with the given tags from an ADDML file
+    without building the whole tree. Each section is yielded once it
+    has been completely parsed, including its tail text. When the
+    iteration continues, the section and its preceding siblings are
+    removed from the partially built tree, so the caller must copy any
+    data it needs to keep. Because of this the given sections must not
+    be nested within each other.
+
+    :param source: Path or file-like object of the ADDML data
+    :param sections: Tags of the sections to iterate
+    :returns: Generator object for iterating the sections
+    """
+    context = ET.iterparse(
+        source, events=('end',), tag=[addml_ns(tag) for tag in sections])
+    pending = None
+    # The tail text of an element is known only after the parser has
+    # read past it, so each section is yielded when the next one has
+    # been parsed.
+    for _, elem in context:
+        if pending is not None:
+            yield pending
+            _clear_section(pending)
+        pending = elem
+
+    if pending is not None:
+        yield pending
+        _clear_section(pending)
+
+
+def _clear_section(section: ET._Element) -> None:
+    """Remove a section and its preceding siblings from a partially
+    built tree.
+    """
+    section.clear()
+    while section.getprevious() is not None:
+        del section.getparent()[0]
 
 
 def parse_name(section: ET._Element) -> str:
@@ -135,23 +239,133 @@ def parse_reference(section: ET._Element) -> str:
 
 
 def iter_sections(
-    addml_el: ET._Element, section: str
+    addml_el: ET._Element | AddmlIndex, section: str
 ) -> Generator[ET._Element]:
-    """Iterate all addml data sections from starting element."""
-    yield from iter_elements(addml_el, section)
+    """Iterate all addml data sections from starting element. The
+    starting element may also be an :class:`AddmlIndex`.
+    """
+    if isinstance(addml_el, AddmlIndex):
+        yield from addml_el.iter_sections(section)
+    else:
+        yield from iter_elements(addml_el, section)
+
+
+def sections_count(
+    addml_el: ET._Element | AddmlIndex, section: str
+) -> int:
+    """Return number of sections in ADDML data. The sections are counted
+    without collecting them to a list.
+    """
+    if isinstance(addml_el, AddmlIndex):
+        return addml_el.count(section)
+    if isinstance(addml_el, ET._ElementTree):
+        addml_el = addml_el.getroot()
+    return sum(1 for _ in addml_el.iterdescendants(addml_ns(section)))
+
+
+def census(addml_el: ET._Element | AddmlIndex) -> dict[str, int]:
+    """Return the number of sections of each ADDML tag in ADDML data,
+    counted in a single pass like :func:`sections_count` counts them::
+
+        census(root)
+        {'dataset': 1, 'flatFiles': 1, 'flatFile': 6, ...}
 
+    :param addml_el: ADDML element, element tree or AddmlIndex
+    :returns: Dict mapping tags without the namespace to counts, in the
+              order the tags first appear in the data
+    """
+    if isinstance(addml_el, AddmlIndex):
+        return addml_el.census()
+    if isinstance(addml_el, ET._ElementTree):
+        addml_el = addml_el.getroot()
 
-def sections_count(addml_el: ET._Element, section: str) -> int:
-    """Return number of sections in ADDML data."""
-    return len(list(iter_sections(addml_el, section)))
+    namespace_len = len(ADDML_NS) + 2
+    counts = {}
+    for elem in addml_el.iterdescendants(addml_ns('*')):
+        tag = elem.tag[namespace_len:]
+        counts[tag] = counts.get(tag, 0) + 1
+    return counts
 
 
 def find_section_by_name(
-    addml_el: ET._Element, section: str, name: str
+    addml_el: ET._Element | AddmlIndex, section: str, name: str
 ) -> ET._Element | None:
-    """Find an addml section by its @name attribute value."""
+    """Find an addml section by its @name attribute value. If an
+    :class:`AddmlIndex` is given, the lookup is done in constant time.
+    """
+    if isinstance(addml_el, AddmlIndex):
+        return addml_el.find(section, name)
+
     for elem in iter_sections(addml_el, section):
         if elem.get('name') == name:
             return elem
 
     return None
+
+
+class AddmlIndex:
+    """Lookup tables for the sections of an ADDML document.
+
+    The index is built in one pass over the descendants of the given
+    element. Sections are mapped by their tag and @name attribute, and
+    by their tag and reference attribute (see :func:`parse_reference`)
+    to find all sections that point at a given name::
+
+        index = AddmlIndex(root)
+        index.find('flatFileType', 'testtype1')
+        index.referring('flatFile', 'testdef1')
+
+    Tags are given without the ADDML namespace. The index is a snapshot
+    of the document: changes made to the tree after building the index
+    are not reflected in it.
+    """
+
+    def __init__(self, addml_el: ET._Element | ET._ElementTree) -> None:
+        """Build the index.
+
+        :param addml_el: ADDML element or element tree to index
+        """
+        if isinstance(addml_el, ET._ElementTree):
+            addml_el = addml_el.getroot()
+        self.root = addml_el
+        self._sections: dict[str, list[ET._Element]] = {}
+        self._names: dict[tuple[str, str], ET._Element] = {}
+        self._references: dict[tuple[str, str], list[ET._Element]] = {}
+
+        namespace_len = len(ADDML_NS) + 2
+        for elem in addml_el.iterdescendants(addml_ns('*')):
+            tag = elem.tag[namespace_len:]
+            self._sections.setdefault(tag, []).append(elem)
+
+            # Keep the first match like find_section_by_name does
+            self._names.setdefault((tag, parse_name(elem)), elem)
+
+            reference = parse_reference(elem)
+            if reference is not None:
+                self._references.setdefault(
+                    (tag, reference), []).append(elem)
+
+    def iter_sections(self, section: str) -> Generator[ET._Element]:
+        """Iterate all sections with the given tag in document order."""
+        yield from self._sections.get(section, [])
+
+    def count(self, section: str) -> int:
+        """Return number of sections with the given tag."""
+        return len(self._sections.get(section, []))
+
+    def census(self) -> dict[str, int]:
+        """Return number of sections of each tag, see :func:`census`."""
+        return {tag: len(sections) for tag, sections
+                in self._sections.items()}
+
+    def find(self, section: str, name: str | None) -> ET._Element | None:
+        """Return the first section with the given tag and @name
+        attribute value, or None if there is no such section.
+        """
+        return self._names.get((section, name))
+
+    def referring(self, section: str, reference: str) -> list[ET._Element]:
+        """Return the sections with the given tag whose reference
+        attribute has the given value, in document order.
+        """
+        return list(self._references.get((section, reference), []))
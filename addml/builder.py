@@ -0,0 +1,181 @@
+"""Streaming writer for generating large ADDML data.
+"""
+from __future__ import annotations
+
+import itertools
+from collections.abc import Callable, Generator, Iterable
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO
+from uuid import UUID, uuid5
+
+import lxml.etree as ET
+import xml_helpers.utils as h
+
+from addml.base import NAMESPACES, SCHEMA_LOCATION, addml_ns
+from addml.flatfiles import (
+    _REFERENCE_TAGS,
+    _WRAPPER_TAGS,
+    _definition_attrib,
+    addml_basic_elem,
+    definition_elems,
+)
+from addml.split_writer import serialize_section
+
+
+def counter_references(prefix: str = 'ref') -> Callable[[str, str], str]:
+    """Returns a reference factory that numbers the references in the
+    order they are generated: ref1, ref2, ...
+
+    :param prefix: Prefix of the references
+    """
+    counter = itertools.count(1)
+    return lambda tag, name: f'{prefix}{next(counter)}'
+
+
+def uuid5_references(namespace: UUID) -> Callable[[str, str], str]:
+    """Returns a reference factory that derives UUID5 references from
+    the given namespace and the tag and @name of the element, so that
+    the same element always gets the same reference.
+
+    :param namespace: UUID namespace of the references
+    """
+    return lambda tag, name: str(uuid5(namespace, f'{tag}/{name}'))
+
+
+class AddmlWriter:
+    """Writes ADDML data incrementally to a file with
+    :class:`lxml.etree.xmlfile`, so that the data is never held in
+    memory as a whole. The writer is used as a context manager, which
+    writes the addml root and dataset elements::
+
+        with AddmlWriter('addml.xml', counter_references()) as writer:
+            with writer.wrapper('flatFiles'):
+                writer.definition('flatFile', 'file1.csv', 'def1')
+                with writer.wrapper('flatFileDefinitions'):
+                    with writer.open_definition('flatFileDefinition',
+                                                'def1', 'type1'):
+                        ...
+
+    The elements are written in the order the methods are called. The
+    wrapper and definition tags are validated like in
+    :func:`addml.flatfiles.wrapper_elems` and
+    :func:`addml.flatfiles.definition_elems`, and missing mandatory
+    references are generated with the reference factory.
+    """
+
+    def __init__(
+        self,
+        output: str | BinaryIO,
+        reference_factory: Callable[[str, str], str] | None = None,
+    ) -> None:
+        """Create the writer.
+
+        :param output: Path or binary file object to write to
+        :param reference_factory: Function that returns a reference for
+                                  the given tag and @name value
+                                  (default=random UUIDs)
+        """
+        self.output = output
+        self.reference_factory = reference_factory
+        self._stack: ExitStack | None = None
+        self._outfile: BinaryIO | None = None
+        self._xf = None
+
+    def __enter__(self) -> AddmlWriter:
+        stack = ExitStack()
+        try:
+            if isinstance(self.output, str):
+                self._outfile = stack.enter_context(
+                    open(self.output, 'wb'))
+            else:
+                self._outfile = self.output
+            self._xf = stack.enter_context(
+                ET.xmlfile(self._outfile, encoding='UTF-8'))
+            self._xf.write_declaration()
+            stack.enter_context(self._xf.element(
+                addml_ns('addml'),
+                {h.xsi_ns('schemaLocation'): SCHEMA_LOCATION},
+                nsmap=NAMESPACES))
+            stack.enter_context(self._xf.element(addml_ns('dataset')))
+        except BaseException:
+            stack.close()
+            raise
+        self._stack = stack
+        return self
+
+    def __exit__(self, *exc_info) -> bool | None:
+        stack, self._stack = self._stack, None
+        return stack.__exit__(*exc_info)
+
+    @contextmanager
+    def wrapper(self, tag: str) -> Generator[None]:
+        """Write a wrapper element. The elements written within the
+        context are its children.
+
+        :raises ValueError: If the tag is not a wrapper element
+        """
+        if tag not in _WRAPPER_TAGS:
+            raise ValueError(f'Not an ADDML wrapper element: {tag}')
+        with self._xf.element(addml_ns(tag)):
+            yield
+
+    @contextmanager
+    def open_definition(
+        self, tag: str, name: str, reference: str | None = None
+    ) -> Generator[None]:
+        """Write a definition element. The elements written within the
+        context are its children.
+
+        :raises ValueError: If the tag is not a definition element
+        """
+        attrib = _definition_attrib(tag, name, reference,
+                                    self.reference_factory)
+        if attrib is None:
+            raise ValueError(f'Not an ADDML definition element: {tag}')
+        with self._xf.element(addml_ns(tag), attrib):
+            yield
+
+    def definition(
+        self,
+        tag: str,
+        name: str,
+        reference: str | None = None,
+        child_elements: Iterable[ET._Element] | None = None,
+    ) -> None:
+        """Write a complete definition element with the given children.
+
+        :raises ValueError: If the tag is not a definition element
+        """
+        if not reference and tag in _REFERENCE_TAGS and \
+                self.reference_factory is not None:
+            reference = self.reference_factory(tag, name)
+        element = definition_elems(tag, name, reference,
+                                   child_elements=child_elements)
+        if element is None:
+            raise ValueError(f'Not an ADDML definition element: {tag}')
+        self.write(element)
+
+    def basic(self, tag: str, contents: str) -> None:
+        """Write a basic element with text contents, see
+        :func:`addml.flatfiles.addml_basic_elem`.
+
+        :raises ValueError: If the tag is not a basic element
+        """
+        element = addml_basic_elem(tag, contents)
+        if element is None:
+            raise ValueError(f'Not an ADDML basic element: {tag}')
+        self.write(element)
+
+    def write(self, element: ET._Element) -> None:
+        """Write a complete element, such as one created with the
+        element factories of :mod:`addml.flatfiles`.
+        """
+        self.write_serialized(serialize_section(element))
+
+    def write_serialized(self, data: bytes) -> None:
+        """Write elements already serialized with
+        :func:`addml.split_writer.serialize_section`, such as sections
+        spooled to a temporary file.
+        """
+        self._xf.flush()
+        self._outfile.write(data)
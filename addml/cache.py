@@ -0,0 +1,133 @@
+"""Cache of parsed ADDML data files.
+
+The cache is disabled by default. Once enabled with :func:`enable_cache`,
+the path based helpers in :mod:`addml.split_addml` share the parsed
+trees and their indexes instead of parsing the ADDML data file on every
+call. A cached file is parsed again if its modification time or size
+changes. The cached trees are shared between the callers and must not be
+modified.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from xml_helpers.utils import readfile
+
+from addml.base import AddmlIndex
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of the ADDML data file cache."""
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class _DocumentCache:
+    """LRU cache of parsed ADDML data files keyed by path."""
+
+    def __init__(self, maxsize: int) -> None:
+        if maxsize < 1:
+            raise ValueError('Cache size must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[
+            str, tuple[tuple[int, int], AddmlIndex]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> AddmlIndex:
+        """Return the index of the ADDML data file in the given path,
+        parsing the file if it is not cached or has changed.
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Parse outside the lock so that other files can be read
+        # meanwhile. Concurrent misses for the same file may parse it
+        # more than once, but the last result wins.
+        index = AddmlIndex(readfile(key).getroot())
+
+        with self._lock:
+            self._entries[key] = (signature, index)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return index
+
+    def clear(self) -> None:
+        """Remove all cached files and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> CacheInfo:
+        """Return the cache statistics."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.maxsize,
+                             len(self._entries))
+
+
+_CACHE: _DocumentCache | None = None
+
+
+def enable_cache(maxsize: int = 128) -> None:
+    """Enable caching of parsed ADDML data files. If the cache is
+    already enabled, it is cleared and resized.
+
+    :param maxsize: Maximum number of cached files
+    """
+    global _CACHE
+    _CACHE = _DocumentCache(maxsize)
+
+
+def disable_cache() -> None:
+    """Disable caching and release the cached files."""
+    global _CACHE
+    _CACHE = None
+
+
+def cache_enabled() -> bool:
+    """Return True if caching of parsed ADDML data files is enabled."""
+    return _CACHE is not None
+
+
+def clear_cache() -> None:
+    """Remove all files from the cache and reset its statistics."""
+    cache = _CACHE
+    if cache is not None:
+        cache.clear()
+
+
+def cache_info() -> CacheInfo:
+    """Return the statistics of the cache. All values are zero if the
+    cache is disabled.
+    """
+    cache = _CACHE
+    if cache is None:
+        return CacheInfo(0, 0, 0, 0)
+    return cache.info()
+
+
+def read_index(path: str) -> AddmlIndex:
+    """Return an index of the ADDML data file in the given path. The
+    parsed file is taken from the cache if caching is enabled.
+    """
+    cache = _CACHE
+    if cache is None:
+        return AddmlIndex(readfile(path).getroot())
+    return cache.get(path)
@@ -2,13 +2,31 @@
 """
 from __future__ import annotations
 
-from collections.abc import Generator, Iterable
+import copy
+from collections.abc import Callable, Generator, Iterable
 from uuid import uuid4
 
 import lxml.etree as ET
 import xml_helpers.utils as h
 
-from addml.base import NAMESPACES, _element, _subelement, iter_elements
+from addml.base import (
+    _element,
+    _subelement,
+    addml_xpath,
+    iter_elements,
+    sections_count,
+)
+
+
+_WRAPPER_TAGS = ['flatFiles', 'flatFileDefinitions', 'recordDefinitions',
+                 'fieldDefinitions', 'structureTypes', 'flatFileTypes',
+                 'recordTypes', 'fieldTypes', 'properties']
+_DEFINITION_TAGS = ['flatFile', 'flatFileDefinition', 'recordDefinition']
+_REFERENCE_TAGS = ['flatFile', 'fieldDefinition']
+_NOREFERENCE_TAGS = ['flatFileType', 'recordType', 'fieldType', 'property']
+
+# Bytes of the supported ADDML recordSeparator values
+RECORD_SEPARATORS = {'CR+LF': b'\r\n', 'LF': b'\n', 'CR': b'\r'}
 
 
 def wrapper_elems(
@@ -18,10 +36,7 @@ def wrapper_elems(
     a value in the elems list. Appends child_elements if they are
     supplied.
     """
-    elems = ['flatFiles', 'flatFileDefinitions', 'recordDefinitions',
-             'fieldDefinitions', 'structureTypes', 'flatFileTypes',
-             'recordTypes', 'fieldTypes', 'properties']
-    if tag in elems:
+    if tag in _WRAPPER_TAGS:
         wrapper_el = _element(tag)
         if child_elements:
             for elem in child_elements:
@@ -43,22 +58,11 @@ def definition_elems(
     to an other definition element's @name. Appends child_elements if
     they are supplied.
     """
-    elems = ['flatFile', 'flatFileDefinition', 'recordDefinition']
-    ref_elems = ['flatFile', 'fieldDefinition']
-    noref_elems = ['flatFileType', 'recordType', 'fieldType', 'property']
-    if tag in elems or tag in ref_elems or tag in noref_elems:
+    attrib = _definition_attrib(tag, attname, reference)
+    if attrib is not None:
         definition_el_ = _element(tag)
-        definition_el_.set('name', attname)
-
-        if tag in ref_elems and not reference:
-            reference = str(uuid4())
-        if tag in noref_elems:
-            reference = None
-
-        if tag == 'flatFile':
-            definition_el_.set('definitionReference', reference)
-        elif reference:
-            definition_el_.set('typeReference', reference)
+        for key, value in attrib.items():
+            definition_el_.set(key, value)
 
         if child_elements:
             for elem in child_elements:
@@ -69,12 +73,158 @@ def definition_elems(
     return None
 
 
+def _definition_attrib(
+    tag: str,
+    attname: str,
+    reference: str | None = None,
+    reference_factory: Callable[[str, str], str] | None = None,
+) -> dict[str, str] | None:
+    """Returns the attributes of an addml definition element, or None
+    if the tag is not a definition element. A reference is generated
+    with the reference_factory, called with the tag and @name value,
+    if the element must have a reference and none is supplied. By
+    default a random UUID is used.
+    """
+    if tag not in _DEFINITION_TAGS and tag not in _REFERENCE_TAGS \
+            and tag not in _NOREFERENCE_TAGS:
+        return None
+
+    attrib = {'name': attname}
+
+    if tag in _REFERENCE_TAGS and not reference:
+        if reference_factory is None:
+            reference = str(uuid4())
+        else:
+            reference = reference_factory(tag, attname)
+    if tag in _NOREFERENCE_TAGS:
+        reference = None
+
+    if tag == 'flatFile' or reference:
+        attrib[_reference_attribute(tag)] = reference
+
+    return attrib
+
+
+class DefinitionTemplate:
+    """Factory for addml definition elements that share the same
+    structure and differ only in the @name and reference attributes and
+    the texts of their child elements.
+
+    The prototype element is built once with :func:`definition_elems`,
+    and each new element is a copy of it with the attributes and texts
+    patched in. This pays off for definitions with child elements, like
+    flatFileTypes with a charset and a delimFileFormat, which are built
+    about three times faster than with the element factories. Elements
+    without children, like flatFiles and fieldDefinitions, are built
+    about as fast with :func:`definition_elems`::
+
+        template = DefinitionTemplate('fieldType', child_elements=[
+            addml_basic_elem('dataType', 'string')])
+        fieldtypes = [template(name, dataType=datatype)
+                      for name, datatype in ...]
+
+    The texts are patched by the local name of the child element. If the
+    prototype has several child elements with the same local name, the
+    first one in document order is patched.
+    """
+
+    def __init__(
+        self,
+        tag: str,
+        child_elements: Iterable[ET._Element] | None = None,
+        reference_factory: Callable[[str, str], str] | None = None,
+    ) -> None:
+        """Compile the prototype element.
+
+        :param tag: Tag of the definition element
+        :param child_elements: Child elements of the prototype
+        :param reference_factory: Function that returns a reference for
+                                  the given tag and @name value, if the
+                                  element must have a reference and none
+                                  is given (default=random UUIDs)
+        :raises ValueError: If the tag is not a definition element
+        """
+        # Build the prototype without a reference, so that the reference
+        # is set after the @name attribute like in definition_elems.
+        prototype = definition_elems(tag, '', child_elements=child_elements)
+        if prototype is None:
+            raise ValueError(f'Not an ADDML definition element: {tag}')
+        if tag in _REFERENCE_TAGS:
+            del prototype.attrib[_reference_attribute(tag)]
+
+        self.tag = tag
+        self.reference_factory = reference_factory
+        self._prototype = prototype
+        self._reference_required = tag in _REFERENCE_TAGS
+        self._reference_attribute = None if tag in _NOREFERENCE_TAGS \
+            else _reference_attribute(tag)
+        self._paths: dict[str, tuple[int, ...]] = {}
+        self._index_children(prototype, ())
+
+    def _index_children(
+        self, element: ET._Element, path: tuple[int, ...]
+    ) -> None:
+        """Record the child index paths of the elements in the
+        prototype by their local names.
+        """
+        for position, child in enumerate(element):
+            if not isinstance(child.tag, str):
+                continue
+            child_path = path + (position,)
+            self._paths.setdefault(ET.QName(child).localname, child_path)
+            self._index_children(child, child_path)
+
+    def __call__(
+        self, attname: str, reference: str | None = None, **texts: str
+    ) -> ET._Element:
+        """Create a new definition element from the prototype.
+
+        :param attname: Value of the @name attribute
+        :param reference: Value of the reference attribute
+        :param texts: Texts of the child elements by their local names
+        :returns: New definition element
+        :raises ValueError: If the prototype has no child element with
+                            the local name of a given text
+        """
+        definition_el = copy.deepcopy(self._prototype)
+        definition_el.set('name', attname)
+        if self._reference_required and not reference:
+            if self.reference_factory is None:
+                reference = str(uuid4())
+            else:
+                reference = self.reference_factory(self.tag, attname)
+        if reference and self._reference_attribute is not None:
+            definition_el.set(self._reference_attribute, reference)
+
+        for name, text in texts.items():
+            path = self._paths.get(name)
+            if path is None:
+                raise ValueError(
+                    f'Not a child element of the template: {name}')
+            child = definition_el
+            for position in path:
+                child = child[position]
+            child.text = h.decode_utf8(text)
+
+        return definition_el
+
+
+def _reference_attribute(tag: str) -> str:
+    """Returns the name of the reference attribute of an addml definition
+    element.
+    """
+    if tag == 'flatFile':
+        return 'definitionReference'
+    return 'typeReference'
+
+
 def addml_basic_elem(tag: str, contents: str) -> ET._Element | None:
     """Creates ADDML basic elems that are elements which
     contain text as values. Only create elements if the supplied tag
     value is inlcuded in the tags list.
     """
-    tags = ['charset', 'dataType']
+    tags = ['charset', 'dataType', 'maxLength', 'value', 'startPos',
+            'fixedLength']
     if tag in tags:
         addml_el = _element(tag)
         addml_el.text = h.decode_utf8(contents)
@@ -119,6 +269,48 @@ def delimfileformat(
     return delimfileformat_el
 
 
+def fixedfileformat(recordseparator: str | None = None) -> ET._Element:
+    """Creates the ADDML fixedFileFormat section of fixed-width flat
+    files.
+
+    :param recordseparator: the character separating the records, or
+    None if the records only have a fixed length (default=None)
+
+    :returns:
+    The following lxml.etree strucure::
+
+        <addml:fixedFileFormat>
+            <addml:recordSeparator>CR+LF</addml:recordSeparator>
+        </addml:fixedFileFormat>
+    """
+    fixedfileformat_el = _element('fixedFileFormat')
+
+    if recordseparator:
+        recordseparator_el = _subelement(fixedfileformat_el,
+                                         'recordSeparator')
+        recordseparator_el.text = h.decode_utf8(recordseparator)
+
+    return fixedfileformat_el
+
+
+def fixedwidth_fielddefinition(
+    attname: str, reference: str, startpos: int, fixedlength: int
+) -> ET._Element:
+    """Creates a fieldDefinition of a fixed-width flat file with the
+    start position, counted from 1, and the length of the field::
+
+        <addml:fieldDefinition name="field1" typeReference="String">
+            <addml:startPos>1</addml:startPos>
+            <addml:fixedLength>10</addml:fixedLength>
+        </addml:fieldDefinition>
+    """
+    return definition_elems('fieldDefinition', attname, reference,
+                            child_elements=[
+                                addml_basic_elem('startPos', str(startpos)),
+                                addml_basic_elem('fixedLength',
+                                                 str(fixedlength))])
+
+
 def iter_flatfiles(addml_el: ET._Element) -> Generator[ET._Element]:
     """Iterates all flatFiles from starting element."""
     yield from iter_elements(addml_el, 'flatFile')
@@ -131,15 +323,22 @@ def iter_flatfiledefinitions(addml_el: ET._Element) -> Generator[ET._Element]:
 
 def flatfile_count(addml_el: ET._Element) -> int:
     """Returns number of flatFiles in addml data."""
-    return len(list(iter_flatfiles(addml_el)))
+    return sections_count(addml_el, 'flatFile')
 
 
 def flatfiledefinition_count(addml_el: ET._Element) -> int:
     """Returns number of flatFileDefinitions in addml data."""
-    return len(list(iter_flatfiledefinitions(addml_el)))
+    return sections_count(addml_el, 'flatFileDefinition')
 
 
 def parse_charset(section: ET._Element) -> str:
-    """Returns the value of the charset within a given section."""
-    return h.decode_utf8(section.xpath(".//addml:charset/text()",
-                                       namespaces=NAMESPACES)[0])
+    """Returns the value of the charset within a given section. Other
+    objects than elements, like the flatFileTypes of :mod:`addml.model`,
+    must have the charset as their charset attribute.
+    """
+    if not isinstance(section, ET._Element):
+        charset = getattr(section, 'charset', None)
+        if charset is None:
+            raise IndexError(f'{section!r} has no charset')
+        return charset
+    return h.decode_utf8(addml_xpath('charset')(section)[0])
@@ -0,0 +1,266 @@
+"""Resolution of the formats of flat files described in ADDML data.
+
+The format of a flatFile is described by a chain of sections: the
+flatFile refers to a flatFileDefinition, which refers to a flatFileType
+with the charset and the delimFileFormat, and contains the
+recordDefinitions with their fieldDefinitions, which refer to
+fieldTypes. The functions in this module follow the chain once and
+return the result as plain tuples.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from typing import NamedTuple, TypeVar
+
+import lxml.etree as ET
+import xml_helpers.utils as h
+
+from addml.base import (
+    AddmlIndex,
+    addml_ns,
+    addml_xpath,
+    find_section_by_name,
+    iter_sections,
+    parse_name,
+    parse_reference,
+)
+from addml.cache import read_index
+
+_T = TypeVar('_T')
+
+
+class FieldFormat(NamedTuple):
+    """Format of a field, from a fieldDefinition and its fieldType. The
+    start position, counted from 1, and the length are given for the
+    fields of fixed-width flat files.
+    """
+    name: str
+    datatype: str | None
+    start_pos: int | None = None
+    fixed_length: int | None = None
+
+
+class RecordFormat(NamedTuple):
+    """Format of a record, from a recordDefinition."""
+    name: str
+    fields: tuple[FieldFormat, ...]
+    fixed_length: int | None = None
+
+
+class FlatFileFormat(NamedTuple):
+    """Format of a flat file, resolved from its flatFile section. The
+    flat file is fixed-width if its flatFileType has a fixedFileFormat
+    instead of a delimFileFormat.
+    """
+    name: str
+    definition: str
+    flatfiletype: str
+    charset: str
+    record_separator: str | None
+    field_separator: str | None
+    quoting_char: str | None
+    records: tuple[RecordFormat, ...]
+    fixed_width: bool = False
+
+
+def resolve_flatfile_format(
+    path: str | AddmlIndex, filename: str
+) -> FlatFileFormat | None:
+    """Resolves the format of a flat file from the ADDML data.
+
+    :param path: Path of the ADDML data file or an AddmlIndex of it
+    :param filename: @name of the flatFile
+    :returns: The format, or None if the ADDML data has no flatFile
+              with the filename
+    :raises ValueError: If the references of the flatFile can not be
+                        resolved
+    """
+    formats, errors = resolve_flatfile_formats(path, [filename])
+    if filename in errors:
+        raise ValueError(errors[filename])
+    return formats[filename]
+
+
+def resolve_flatfile_formats(
+    path: str | AddmlIndex, filenames: Iterable[str] | None = None
+) -> tuple[dict[str, FlatFileFormat | None], dict[str, str]]:
+    """Resolves the formats of all flat files, or of the given
+    filenames, from the ADDML data. The sections shared by many flat
+    files are resolved only once.
+
+    Broken references are reported like in
+    :func:`addml.split_addml.get_charsets_with_filenames`.
+
+    :param path: Path of the ADDML data file or an AddmlIndex of it
+    :param filenames: Filenames to resolve (default=all flatFiles)
+    :returns: A tuple of two dicts. The first maps filenames to formats,
+              or to None for the given filenames that have no flatFile.
+              The second maps filenames to an error message for the
+              files whose references could not be resolved.
+    """
+    index = path if isinstance(path, AddmlIndex) else read_index(path)
+    fieldtypes = {}
+    formats, errors = resolve_flatfiles(
+        index, filenames,
+        lambda def_reference: _resolve_definition(index, def_reference,
+                                                  fieldtypes))
+    return {filename: None if flatfile_format is None
+            else flatfile_format._replace(name=filename)
+            for filename, flatfile_format in formats.items()}, errors
+
+
+def resolve_flatfiles(
+    index: AddmlIndex,
+    filenames: Iterable[str] | None,
+    resolve: Callable[[str], tuple[_T | None, str | None]],
+) -> tuple[dict[str, _T | None], dict[str, str]]:
+    """Resolves a value for all flat files, or for the given filenames,
+    from the flatFileDefinitions they refer to. Each flatFileDefinition
+    is resolved only once, and the first flatFile of each name is used.
+
+    :param index: AddmlIndex of the ADDML data
+    :param filenames: Filenames to resolve (default=all flatFiles)
+    :param resolve: Function that returns a tuple of the value and an
+                    error message, one of which is None, for the @name
+                    of a flatFileDefinition
+    :returns: A tuple of two dicts. The first maps filenames to values,
+              or to None for the given filenames that have no flatFile.
+              The second maps filenames to an error message for the
+              files whose references could not be resolved.
+    """
+    if filenames is None:
+        flatfiles = {}
+        for flatfile in index.iter_sections('flatFile'):
+            flatfiles.setdefault(parse_name(flatfile), flatfile)
+    else:
+        flatfiles = {filename: find_section_by_name(index, 'flatFile',
+                                                    filename)
+                     for filename in filenames}
+
+    values = {}
+    errors = {}
+    resolved = {}
+    for filename, flatfile in flatfiles.items():
+        if flatfile is None:
+            values[filename] = None
+            continue
+
+        def_reference = parse_reference(flatfile)
+        if def_reference not in resolved:
+            resolved[def_reference] = resolve(def_reference)
+        value, error = resolved[def_reference]
+        if error:
+            errors[filename] = error
+        else:
+            values[filename] = value
+
+    return values, errors
+
+
+def resolve_flatfiletype(
+    index: AddmlIndex, def_reference: str
+) -> tuple[tuple[ET._Element, ET._Element, str] | None, str | None]:
+    """Resolves the flatFileDefinition with the given @name and its
+    flatFileType and charset.
+
+    :returns: A tuple of the resolved sections and an error message,
+              one of which is None. The sections are a tuple of the
+              flatFileDefinition, the flatFileType and the charset.
+    """
+    definition = find_section_by_name(index, 'flatFileDefinition',
+                                      def_reference)
+    if definition is None:
+        return None, f'flatFileDefinition {def_reference!r} not found'
+
+    type_reference = parse_reference(definition)
+    flatfiletype = find_section_by_name(index, 'flatFileType',
+                                        type_reference)
+    if flatfiletype is None:
+        return None, f'flatFileType {type_reference!r} not found'
+
+    charset = _first_text(flatfiletype, 'charset')
+    if charset is None:
+        return None, f'flatFileType {type_reference!r} has no charset'
+    return (definition, flatfiletype, charset), None
+
+
+def _resolve_definition(
+    index: AddmlIndex,
+    def_reference: str,
+    fieldtypes: dict[str, str | None],
+) -> tuple[FlatFileFormat | None, str | None]:
+    """Resolves the format described by the flatFileDefinition with the
+    given name. Returns a tuple of the format, without the name of the
+    flat file, and an error message, one of which is None. The dataTypes
+    of the fieldTypes are collected to the given dict.
+    """
+    sections, error = resolve_flatfiletype(index, def_reference)
+    if error:
+        return None, error
+    definition, flatfiletype, charset = sections
+
+    records = []
+    for recorddefinition in iter_sections(definition, 'recordDefinition'):
+        fields = []
+        for fielddefinition in iter_sections(recorddefinition,
+                                             'fieldDefinition'):
+            fieldtype_reference = parse_reference(fielddefinition)
+            if fieldtype_reference not in fieldtypes:
+                fieldtype = find_section_by_name(index, 'fieldType',
+                                                 fieldtype_reference)
+                fieldtypes[fieldtype_reference] = None \
+                    if fieldtype is None \
+                    else _first_text(fieldtype, 'dataType')
+            try:
+                fields.append(FieldFormat(
+                    parse_name(fielddefinition),
+                    fieldtypes[fieldtype_reference],
+                    _child_int(fielddefinition, 'startPos'),
+                    _child_int(fielddefinition, 'fixedLength')))
+            except ValueError as exception:
+                return None, (f'fieldDefinition '
+                              f'{parse_name(fielddefinition)!r} {exception}')
+        try:
+            fixed_length = _child_int(recorddefinition, 'fixedLength')
+        except ValueError as exception:
+            return None, (f'recordDefinition '
+                          f'{parse_name(recorddefinition)!r} {exception}')
+        records.append(RecordFormat(parse_name(recorddefinition),
+                                    tuple(fields), fixed_length))
+
+    return FlatFileFormat(
+        name='',
+        definition=def_reference,
+        flatfiletype=parse_reference(definition),
+        charset=charset,
+        record_separator=_first_text(flatfiletype, 'recordSeparator'),
+        field_separator=_first_text(flatfiletype, 'fieldSeparatingChar'),
+        quoting_char=_first_text(flatfiletype, 'quotingChar'),
+        records=tuple(records),
+        fixed_width=flatfiletype.find(
+            addml_ns('fixedFileFormat')) is not None), None
+
+
+def _child_int(section: ET._Element, tag: str) -> int | None:
+    """Returns the integer value of the child element of the section
+    with the given tag, or None if there is none.
+
+    :raises ValueError: If the value is not an integer
+    """
+    text = section.findtext(addml_ns(tag))
+    if text is None:
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f'has an invalid {tag}: {text!r}') from None
+
+
+def _first_text(section: ET._Element, query: str) -> str | None:
+    """Returns the first text found with the registered XPath query, or
+    None if there is none.
+    """
+    texts = addml_xpath(query)(section)
+    if not texts:
+        return None
+    return h.decode_utf8(texts[0])
@@ -0,0 +1,225 @@
+"""Inference of the fieldDefinitions of delimited flat files.
+
+The records are parsed with the csv module and classified column by
+column in blocks of records, so that the values of a whole column are
+matched in one loop run by :func:`map` instead of value by value in
+Python code.
+"""
+from __future__ import annotations
+
+import csv
+import itertools
+import re
+from collections.abc import Generator, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import lxml.etree as ET
+
+from addml.flatfiles import (
+    addml_basic_elem,
+    definition_elems,
+    wrapper_elems,
+)
+from addml.formats import FlatFileFormat
+from addml.sniffer import SniffResult, sniff_flatfile
+
+# The dataTypes in the order they are preferred. A column gets the
+# first dataType that matches all of its non-empty values. The patterns
+# match each value in only one way, so that a value that does not match
+# is rejected without backtracking.
+DATATYPES = {
+    'boolean': re.compile(r'(?i:true|false)'),
+    'integer': re.compile(r'[+-]?[0-9]+'),
+    'float': re.compile(
+        r'[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'),
+    'date': re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}'),
+}
+
+_BUFFER_SIZE = 1 << 20
+
+
+class FieldInfo(NamedTuple):
+    """Inferred properties of a field of a delimited flat file."""
+    name: str
+    datatype: str
+    max_length: int
+    nulls: int
+
+
+def infer_fields(
+    path: str,
+    result: SniffResult | None = None,
+    header: bool = False,
+    sample: int | None = None,
+    block_records: int = 2000,
+) -> list[FieldInfo]:
+    """Infers the dataType, maximum length and number of empty values of
+    each field of a delimited flat file.
+
+    The dataType is one of the keys of :data:`DATATYPES`, or 'string'
+    if the column has values that match none of them.
+
+    :param path: Path of the flat file
+    :param result: Format of the flat file (default=detected with
+                   :func:`addml.sniffer.sniff_flatfile`)
+    :param header: Take the field names from the first record instead
+                   of numbering the fields as field1, field2, ...
+    :param sample: Number of records to read, or None to read the whole
+                   file
+    :param block_records: Number of records classified at a time
+    :returns: List of the inferred fields
+    """
+    if result is None:
+        result = sniff_flatfile(path)
+
+    names: list[str] = []
+    candidates: list[list[str]] = []
+    max_lengths: list[int] = []
+    nulls: list[int] = []
+    total = 0
+
+    with open_records(path, result) as records:
+        if header:
+            names = next(records, [])
+        if sample is not None:
+            records = itertools.islice(records, sample)
+
+        while block := list(itertools.islice(records, block_records)):
+            columns = transpose_records(block)
+            for _ in range(len(candidates), len(columns)):
+                # The field was empty in the records before this block
+                candidates.append(list(DATATYPES))
+                max_lengths.append(0)
+                nulls.append(total)
+
+            for position, values in enumerate(columns):
+                nulls[position] += values.count('')
+                max_lengths[position] = max(max_lengths[position],
+                                            max(map(len, values)))
+                if not candidates[position]:
+                    continue
+                present = list(filter(None, values))
+                candidates[position] = [
+                    datatype for datatype in candidates[position]
+                    if all(map(DATATYPES[datatype].fullmatch, present))]
+            total += len(block)
+
+    fields = []
+    for position, datatypes in enumerate(candidates):
+        if position < len(names) and names[position]:
+            name = names[position]
+        else:
+            name = f'field{position + 1}'
+        if datatypes and nulls[position] < total:
+            datatype = datatypes[0]
+        else:
+            datatype = 'string'
+        fields.append(FieldInfo(name, datatype, max_lengths[position],
+                                nulls[position]))
+    return fields
+
+
+def transpose_records(block: list[list[str]]) -> list[Sequence[str]]:
+    """Transposes a block of records to columns of field values. Missing
+    values of short records are empty.
+
+    :param block: Records as lists of field values
+    :returns: Values of each field of the records
+    """
+    lengths = set(map(len, block))
+    if len(lengths) == 1:
+        # Slicing the flattened block is faster than zip
+        width = lengths.pop()
+        values = list(itertools.chain.from_iterable(block))
+        return [values[position::width] for position in range(width)]
+    return list(itertools.zip_longest(*block, fillvalue=''))
+
+
+@contextmanager
+def open_records(
+    path: str, result: SniffResult | FlatFileFormat
+) -> Generator[Iterator[list[str]]]:
+    """Opens a delimited flat file for reading its records as lists of
+    field values with :func:`csv.reader`.
+
+    :param path: Path of the flat file
+    :param result: Detected format of the flat file, or the format
+                   resolved from ADDML data
+    """
+    if result.quoting_char:
+        dialect = {'quotechar': result.quoting_char}
+    else:
+        dialect = {'quoting': csv.QUOTE_NONE}
+    with open(path, encoding=python_codec(result.charset), newline='',
+              buffering=_BUFFER_SIZE) as infile:
+        yield csv.reader(infile, delimiter=result.field_separator,
+                         **dialect)
+
+
+def python_codec(charset: str) -> str:
+    """Returns the name of the Python codec for an ADDML charset. A
+    UTF-8 byte order mark is skipped when decoding UTF-8.
+    """
+    if charset.upper().replace('_', '-') in ('UTF-8', 'UTF8'):
+        return 'utf-8-sig'
+    return charset
+
+
+def fieldtype_name(datatype: str) -> str:
+    """Returns the @name of the fieldType of a dataType, like the
+    names 'String' and 'Integer' of the fieldTypes for 'string' and
+    'integer'.
+    """
+    return datatype[:1].upper() + datatype[1:]
+
+
+def fielddefinitions(
+    fields: Iterable[FieldInfo], max_length: bool = True
+) -> ET._Element:
+    """Creates the fieldDefinitions section for the inferred fields. The
+    fieldDefinitions refer to the fieldTypes created with
+    :func:`fieldtypes`.
+
+    :param fields: Inferred fields
+    :param max_length: Add the maximum lengths of the fields. Leave them
+                       out if they were inferred from a sample only.
+    """
+    return wrapper_elems('fieldDefinitions', [
+        definition_elems(
+            'fieldDefinition', field.name,
+            reference=fieldtype_name(field.datatype),
+            child_elements=[addml_basic_elem(
+                'maxLength', str(field.max_length))] if max_length else None)
+        for field in fields])
+
+
+def recorddefinition(
+    name: str,
+    fields: Iterable[FieldInfo],
+    reference: str | None = None,
+    max_length: bool = True,
+) -> ET._Element:
+    """Creates a recordDefinition section with the fieldDefinitions of
+    the inferred fields.
+
+    :param name: @name of the recordDefinition
+    :param fields: Inferred fields
+    :param reference: @typeReference of the recordDefinition
+    :param max_length: Add the maximum lengths of the fields
+    """
+    return definition_elems('recordDefinition', name, reference=reference,
+                            child_elements=[fielddefinitions(fields,
+                                                             max_length)])
+
+
+def fieldtypes(fields: Iterable[FieldInfo]) -> ET._Element:
+    """Creates the fieldTypes section with a fieldType for each dataType
+    of the inferred fields.
+    """
+    datatypes = dict.fromkeys(field.datatype for field in fields)
+    return wrapper_elems('fieldTypes', [
+        definition_elems('fieldType', fieldtype_name(datatype),
+                         child_elements=[
+                             addml_basic_elem('dataType', datatype)])
+        for datatype in datatypes])
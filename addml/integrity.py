@@ -0,0 +1,151 @@
+"""Checking the integrity of the references in ADDML data.
+
+The names and references of the sections are collected in one pass
+over the ADDML data file with :func:`lxml.etree.iterparse`, and checked
+against each other at the end. Only the start events of the sections
+are handled, and the previous siblings of each section are removed from
+the partially built tree, since they have been completely parsed.
+The references of many sections to the same name are kept as arrays of
+line numbers, so the memory use stays small for large documents.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import IO, NamedTuple
+
+import lxml.etree as ET
+
+from addml.base import addml_ns
+
+# Tags of the sections that refer to other sections and the tags of the
+# sections they refer to
+REFERENCE_TARGETS = {
+    'flatFile': 'flatFileDefinition',
+    'flatFileDefinition': 'flatFileType',
+    'recordDefinition': 'recordType',
+    'fieldDefinition': 'fieldType',
+}
+
+# Tags of the sections that start a new scope for the names of the
+# given child sections, which need to be unique only within the scope
+_SCOPE_PARENTS = {
+    'flatFileDefinition': 'recordDefinition',
+    'recordDefinition': 'fieldDefinition',
+}
+
+_REFERENCE_ATTRIBUTES = {'flatFile': 'definitionReference'}
+
+# Sections that must have a reference, see addml.flatfiles
+_REQUIRED_REFERENCES = ('flatFile', 'fieldDefinition')
+
+_TYPE_TAGS = ('flatFileType', 'recordType', 'fieldType')
+
+
+class IntegrityIssue(NamedTuple):
+    """Problem found in the references of ADDML data.
+
+    The kind is 'dangling_reference', 'missing_reference',
+    'duplicate_name', 'orphan_type' or 'unused_definition'. The tag and
+    name are those of the section the issue concerns, and for dangling
+    references those of the missing section. The line is the source
+    line of the section in the ADDML data file.
+    """
+    kind: str
+    tag: str
+    name: str | None
+    line: int
+    message: str
+
+
+def check_integrity(source: str | IO[bytes]) -> list[IntegrityIssue]:
+    """Checks the references between the sections of ADDML data in one
+    pass over the data file. Reports
+
+    * references to sections that do not exist,
+    * flatFiles and fieldDefinitions without a reference,
+    * sections with the same @name as an earlier section with the same
+      tag; the names of recordDefinitions and fieldDefinitions must be
+      unique only within their flatFileDefinition and recordDefinition,
+    * flatFileTypes, recordTypes and fieldTypes that are not referred
+      to, and
+    * flatFileDefinitions that no flatFile refers to.
+
+    :param source: Path or file-like object of the ADDML data
+    :returns: List of the issues ordered by source line
+    """
+    namespace_len = len(addml_ns(''))
+    tags = list(REFERENCE_TARGETS) + list(_TYPE_TAGS)
+    issues = []
+    names: dict[str, dict[str, int]] = {tag: {} for tag in tags}
+    # Lines of the references by the tag and name of the target section
+    references: dict[str, dict[str, array]] = {
+        tag: {} for tag in REFERENCE_TARGETS.values()}
+
+    context = ET.iterparse(source, events=('start',),
+                           tag=[addml_ns(tag) for tag in tags])
+    for _, elem in context:
+        if elem.getprevious() is not None:
+            parent = elem.getparent()
+            while parent[0] is not elem:
+                del parent[0]
+
+        tag = elem.tag[namespace_len:]
+        line = elem.sourceline
+        name = elem.get('name')
+        if tag in _SCOPE_PARENTS:
+            # Start a new scope for the names of the child sections
+            names[_SCOPE_PARENTS[tag]] = {}
+
+        if name is not None:
+            tag_names = names[tag]
+            first = tag_names.get(name)
+            if first is None:
+                tag_names[name] = line
+            else:
+                issues.append(IntegrityIssue(
+                    'duplicate_name', tag, name, line,
+                    f'{tag} {name!r} on line {line} has the same name as '
+                    f'the {tag} on line {first}'))
+
+        target = REFERENCE_TARGETS.get(tag)
+        if target is None:
+            continue
+        reference = elem.get(_REFERENCE_ATTRIBUTES.get(tag, 'typeReference'))
+        if reference is None:
+            if tag in _REQUIRED_REFERENCES:
+                issues.append(IntegrityIssue(
+                    'missing_reference', tag, name, line,
+                    f'{tag} {name!r} on line {line} has no reference'))
+            continue
+        target_references = references[target]
+        lines = target_references.get(reference)
+        if lines is None:
+            lines = target_references[reference] = array('L')
+        lines.append(line)
+
+    for referrer, target in REFERENCE_TARGETS.items():
+        for reference, lines in references[target].items():
+            if reference not in names[target]:
+                issues.extend(
+                    IntegrityIssue(
+                        'dangling_reference', target, reference, line,
+                        f'{referrer} on line {line} refers to missing '
+                        f'{target} {reference!r}')
+                    for line in lines)
+
+    for tag in _TYPE_TAGS:
+        issues.extend(
+            IntegrityIssue('orphan_type', tag, name, line,
+                           f'{tag} {name!r} on line {line} is not '
+                           f'referred to')
+            for name, line in names[tag].items()
+            if name not in references[tag])
+    issues.extend(
+        IntegrityIssue('unused_definition', 'flatFileDefinition', name, line,
+                       f'flatFileDefinition {name!r} on line {line} is not '
+                       f'referred to by any flatFile')
+        for name, line in names['flatFileDefinition'].items()
+        if name not in references['flatFileDefinition'])
+
+    issues.sort(key=lambda issue: issue.line)
+    return issues
@@ -0,0 +1,304 @@
+"""Merging many ADDML data files into one.
+
+The input files are read incrementally with
+:func:`addml.base.iterparse_sections` and the merged data is written
+incrementally with :class:`addml.builder.AddmlWriter`. The type sections
+are deduplicated by a hash of their canonical form, so only the distinct
+types are kept in memory until they are written at the end of the
+merged data. The flatFileDefinitions are spooled to a temporary file,
+since they follow all flatFiles in ADDML.
+"""
+from __future__ import annotations
+
+import hashlib
+import tempfile
+from collections.abc import Generator, Iterable
+from typing import IO, BinaryIO, NamedTuple
+
+import lxml.etree as ET
+
+from addml.base import (
+    iter_sections,
+    iterparse_sections,
+    parse_name,
+    parse_reference,
+)
+from addml.builder import AddmlWriter
+from addml.split_writer import serialize_section
+
+# Type sections and their wrappers in the order of the ADDML schema
+_TYPE_WRAPPERS = {
+    'flatFileType': 'flatFileTypes',
+    'recordType': 'recordTypes',
+    'fieldType': 'fieldTypes',
+}
+
+_SPOOL_SIZE = 1 << 20
+
+
+class MergeResult(NamedTuple):
+    """Numbers of the sections written to the merged ADDML data. The
+    duplicates are the type sections left out as copies of other types,
+    and the renamed are the sections renamed because of a clash with a
+    different section of the same name. The collisions are the @names of
+    the flatFiles left out because an earlier input file had a flatFile
+    of the same name.
+    """
+    flatfiles: int
+    flatfiledefinitions: int
+    types: int
+    duplicates: int
+    renamed: int
+    collisions: list[str]
+
+
+def type_digest(section: ET._Element) -> bytes:
+    """Returns the SHA-256 digest of the canonical form of a type
+    section without its @name attribute. The digest does not depend on
+    the name, the namespace prefixes, the order of the attributes, the
+    comments or the whitespace around the texts of the section.
+    """
+    attrib = dict(section.attrib)
+    attrib.pop('name', None)
+    canonical = (section.tag, sorted(attrib.items()),
+                 (section.text or '').strip(),
+                 [_canonical(child) for child
+                  in section.iterchildren(ET.Element)])
+    return hashlib.sha256(repr(canonical).encode()).digest()
+
+
+def _canonical(elem: ET._Element) -> tuple:
+    """Returns the canonical form of an element as nested tuples."""
+    return (elem.tag, sorted(elem.attrib.items()),
+            (elem.text or '').strip(), (elem.tail or '').strip(),
+            [_canonical(child) for child in elem.iterchildren(ET.Element)])
+
+
+def _unique_name(name: str, used: dict[str, int]) -> str:
+    """Returns the name, or the name with the first free numeric suffix
+    if it is already used, and marks it as used. The used names are
+    mapped to the next suffix to try, so that renaming many sections of
+    the same name does not try the same suffixes again.
+    """
+    candidate = name
+    number = used.get(name, 1)
+    while candidate in used:
+        number += 1
+        candidate = f'{name}-{number}'
+    used[name] = number
+    used.setdefault(candidate, 1)
+    return candidate
+
+
+def _type_references(
+    definition: ET._Element
+) -> Generator[tuple[str, str | None]]:
+    """Yields the tags and names of the types a flatFileDefinition and
+    its record and fieldDefinitions refer to.
+    """
+    yield 'flatFileType', parse_reference(definition)
+    for tag, type_tag in (('recordDefinition', 'recordType'),
+                          ('fieldDefinition', 'fieldType')):
+        for section in iter_sections(definition, tag):
+            yield type_tag, parse_reference(section)
+
+
+class _Merger:
+    """State of a merge: the distinct types and the used names."""
+
+    def __init__(self) -> None:
+        self.types: dict[tuple[str, bytes], str] = {}
+        self.serialized: dict[str, list[bytes]] = {
+            tag: [] for tag in _TYPE_WRAPPERS}
+        self.type_names: dict[str, dict[str, int]] = {
+            tag: {} for tag in _TYPE_WRAPPERS}
+        self.definition_names: dict[str, int] = {}
+        self.flatfile_names: set[str] = set()
+        self.collisions: list[str] = []
+        self.flatfiles = 0
+        self.definitions = 0
+        self.duplicates = 0
+        self.renamed = 0
+
+    def read_types(
+        self, source: str | IO[bytes]
+    ) -> tuple[dict[tuple[str, str], str], dict[str, str | None]]:
+        """Read the types and the flatFileDefinition names of an input
+        file. Returns the new names of the types by tag and name, and
+        the new names of the flatFileDefinitions, or None for the ones
+        left out.
+
+        The flatFileDefinitions that only colliding flatFiles refer to
+        are left out, and so are the types that only they refer to. The
+        flatFiles precede the flatFileDefinitions, which precede the
+        types, so this is known when each section is read.
+        """
+        type_names = {}
+        definition_names = {}
+        # References of the written and the left out flatFiles, and the
+        # types referred to by the kept and the left out definitions
+        written = set()
+        collided = set()
+        needed = set()
+        unneeded = set()
+        for section in iterparse_sections(
+                source, ['flatFile', 'flatFileDefinition', *_TYPE_WRAPPERS]):
+            tag = ET.QName(section).localname
+            name = parse_name(section)
+            if tag == 'flatFile':
+                if name in self.flatfile_names:
+                    collided.add(parse_reference(section))
+                else:
+                    written.add(parse_reference(section))
+                continue
+            if tag == 'flatFileDefinition':
+                if name in definition_names:
+                    continue
+                keep = name in written or name not in collided
+                (needed if keep else unneeded).update(
+                    _type_references(section))
+                if keep:
+                    new_name = _unique_name(name, self.definition_names)
+                    self.renamed += new_name != name
+                    definition_names[name] = new_name
+                else:
+                    # Only the left out flatFiles refer to it
+                    definition_names[name] = None
+                continue
+            if (tag, name) in type_names:
+                # Only the first section of each name is referred to
+                continue
+            if (tag, name) in unneeded and (tag, name) not in needed:
+                # Only the left out flatFileDefinitions refer to it
+                continue
+
+            key = (tag, type_digest(section))
+            new_name = self.types.get(key)
+            if new_name is None:
+                new_name = _unique_name(name, self.type_names[tag])
+                self.renamed += new_name != name
+                self.types[key] = new_name
+                section.set('name', new_name)
+                section.tail = None
+                self.serialized[tag].append(serialize_section(section))
+            else:
+                self.duplicates += 1
+            type_names[tag, name] = new_name
+        return type_names, definition_names
+
+    def copy_sections(
+        self,
+        source: str | IO[bytes],
+        writer: AddmlWriter,
+        spool: BinaryIO,
+    ) -> None:
+        """Write the flatFiles of an input file and spool its
+        flatFileDefinitions, with the references renamed. The flatFiles
+        whose names were written from an earlier input file are left
+        out as collisions, and so are the flatFileDefinitions that only
+        they refer to.
+        """
+        type_names, definition_names = self.read_types(source)
+        if not isinstance(source, str):
+            source.seek(0)
+
+        def rename(section, tag):
+            reference = parse_reference(section)
+            if (tag, reference) in type_names:
+                section.set('typeReference', type_names[tag, reference])
+
+        flatfile_names = set()
+        for section in iterparse_sections(
+                source, ['flatFile', 'flatFileDefinition']):
+            section.tail = None
+            if ET.QName(section).localname == 'flatFile':
+                name = parse_name(section)
+                if name in self.flatfile_names:
+                    self.collisions.append(name)
+                    continue
+                flatfile_names.add(name)
+                reference = parse_reference(section)
+                if reference in definition_names:
+                    section.set('definitionReference',
+                                definition_names[reference])
+                writer.write(section)
+                self.flatfiles += 1
+                continue
+
+            name = parse_name(section)
+            if name not in definition_names:
+                # Shadowed by an earlier flatFileDefinition of the name
+                continue
+            new_name = definition_names.pop(name)
+            if new_name is None:
+                # Only the left out flatFiles refer to it
+                continue
+            section.set('name', new_name)
+            rename(section, 'flatFileType')
+            for recorddefinition in iter_sections(section,
+                                                  'recordDefinition'):
+                rename(recorddefinition, 'recordType')
+            for fielddefinition in iter_sections(section,
+                                                 'fieldDefinition'):
+                rename(fielddefinition, 'fieldType')
+            spool.write(serialize_section(section))
+            self.definitions += 1
+        self.flatfile_names.update(flatfile_names)
+
+
+def merge_addml(
+    sources: Iterable[str | IO[bytes]],
+    output: str | BinaryIO,
+) -> MergeResult:
+    """Merges ADDML data files into one, which has the flatFiles,
+    flatFileDefinitions and types of all of them. Each input file is
+    read twice, first for its types and then for its flatFiles and
+    flatFileDefinitions. File objects must therefore be seekable.
+
+    Type sections with the same canonical content, see
+    :func:`type_digest`, are written only once, under the name of the
+    first of them. Sections whose names clash with a different section
+    of the same tag in an earlier input file are renamed by adding a
+    numeric suffix, like type-2, and the references to the renamed and
+    deduplicated sections are rewritten. Only the first section of each
+    name within an input file is merged, since the references can only
+    point to it. The other contents of the dataset sections of the input
+    files are not merged.
+
+    flatFiles are not renamed, since their names are the filenames of
+    the flat files. A flatFile with the same @name as a flatFile of an
+    earlier input file is left out and reported in the collisions of the
+    result, so that the merged data describes each flat file once. A
+    flatFileDefinition that only the left out flatFiles refer to is left
+    out too.
+
+    The memory use depends on the number of distinct types and on the
+    names of the flatFiles and flatFileDefinitions, which are kept for
+    detecting clashes.
+
+    :param sources: Paths or file-like objects of the ADDML data files
+    :param output: Path or binary file object to write to
+    :returns: Numbers of the merged sections and the names of the
+              flatFiles left out
+    """
+    merger = _Merger()
+    with tempfile.TemporaryFile() as spool, AddmlWriter(output) as writer:
+        with writer.wrapper('flatFiles'):
+            for source in sources:
+                merger.copy_sections(source, writer, spool)
+
+            with writer.wrapper('flatFileDefinitions'):
+                spool.seek(0)
+                while data := spool.read(_SPOOL_SIZE):
+                    writer.write_serialized(data)
+
+            with writer.wrapper('structureTypes'):
+                for tag, wrapper in _TYPE_WRAPPERS.items():
+                    if merger.serialized[tag]:
+                        with writer.wrapper(wrapper):
+                            writer.write_serialized(
+                                b''.join(merger.serialized[tag]))
+
+    return MergeResult(merger.flatfiles, merger.definitions,
+                       len(merger.types), merger.duplicates, merger.renamed,
+                       merger.collisions)
@@ -0,0 +1,270 @@
+"""Compact read-only model of ADDML data.
+
+The sections are loaded into small objects with ``__slots__`` in one
+pass with :func:`addml.base.iterparse_sections`, which discards the
+parsed elements as it goes, so the whole tree is never kept in memory.
+The names and references are interned, so that the references shared
+by many sections are stored once, and the references are resolved to
+the sections they point at.
+
+The sections have a ``tag`` and a ``get()`` method like lxml elements,
+so :func:`addml.base.parse_name`, :func:`addml.base.parse_reference`
+and :func:`addml.flatfiles.parse_charset` work with them::
+
+    model = load_model('addml.xml')
+    flatfile = model.find('flatFile', 'file1.csv')
+    parse_charset(flatfile.definition.flatfiletype)
+"""
+from __future__ import annotations
+
+import sys
+from collections.abc import Generator
+from typing import IO
+
+import lxml.etree as ET
+
+from addml.base import addml_ns, addml_xpath, iterparse_sections
+
+
+def _intern(value: str | None) -> str | None:
+    """Interns a string, leaving None as it is."""
+    return None if value is None else sys.intern(value)
+
+
+def _first_text(elem: ET._Element, query: str) -> str | None:
+    """Returns the first text of a registered XPath query, or None."""
+    results = addml_xpath(query)(elem)
+    return _intern(str(results[0])) if results else None
+
+
+class Section:
+    """Base class of the sections of the model. The tag of the section
+    is a class attribute with the ADDML namespace, like in lxml.
+    """
+    __slots__ = ('name', 'reference')
+
+    tag = ''
+    reference_attribute = 'typeReference'
+
+    def __init__(self, name: str | None, reference: str | None) -> None:
+        self.name = _intern(name)
+        self.reference = _intern(reference)
+
+    def get(self, key: str, default: str | None = None) -> str | None:
+        """Returns the value of the @name or reference attribute, like
+        :meth:`lxml.etree._Element.get`.
+        """
+        if key == 'name':
+            value = self.name
+        elif key == self.reference_attribute:
+            value = self.reference
+        else:
+            value = None
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        return f'<{type(self).__name__} {self.name!r}>'
+
+
+class FieldType(Section):
+    """fieldType section with its dataType."""
+    __slots__ = ('datatype',)
+
+    tag = addml_ns('fieldType')
+
+    def __init__(self, name: str | None, reference: str | None,
+                 datatype: str | None) -> None:
+        super().__init__(name, reference)
+        self.datatype = datatype
+
+
+class RecordType(Section):
+    """recordType section."""
+    __slots__ = ()
+
+    tag = addml_ns('recordType')
+
+
+class FlatFileType(Section):
+    """flatFileType section with its charset and the separators of its
+    delimFileFormat or fixedFileFormat.
+    """
+    __slots__ = ('charset', 'record_separator', 'field_separator',
+                 'quoting_char', 'fixed_width')
+
+    tag = addml_ns('flatFileType')
+
+    def __init__(self, name: str | None, reference: str | None,
+                 charset: str | None, record_separator: str | None,
+                 field_separator: str | None, quoting_char: str | None,
+                 fixed_width: bool) -> None:
+        super().__init__(name, reference)
+        self.charset = charset
+        self.record_separator = record_separator
+        self.field_separator = field_separator
+        self.quoting_char = quoting_char
+        self.fixed_width = fixed_width
+
+
+class FieldDefinition(Section):
+    """fieldDefinition section, with its fieldType once resolved."""
+    __slots__ = ('fieldtype',)
+
+    tag = addml_ns('fieldDefinition')
+
+    def __init__(self, name: str | None, reference: str | None) -> None:
+        super().__init__(name, reference)
+        self.fieldtype: FieldType | None = None
+
+
+class RecordDefinition(Section):
+    """recordDefinition section with its fieldDefinitions, with its
+    recordType once resolved.
+    """
+    __slots__ = ('fields', 'recordtype')
+
+    tag = addml_ns('recordDefinition')
+
+    def __init__(self, name: str | None, reference: str | None,
+                 fields: tuple[FieldDefinition, ...]) -> None:
+        super().__init__(name, reference)
+        self.fields = fields
+        self.recordtype: RecordType | None = None
+
+
+class FlatFileDefinition(Section):
+    """flatFileDefinition section with its recordDefinitions, with its
+    flatFileType once resolved.
+    """
+    __slots__ = ('records', 'flatfiletype')
+
+    tag = addml_ns('flatFileDefinition')
+
+    def __init__(self, name: str | None, reference: str | None,
+                 records: tuple[RecordDefinition, ...]) -> None:
+        super().__init__(name, reference)
+        self.records = records
+        self.flatfiletype: FlatFileType | None = None
+
+
+class FlatFile(Section):
+    """flatFile section, with its flatFileDefinition once resolved."""
+    __slots__ = ('definition',)
+
+    tag = addml_ns('flatFile')
+    reference_attribute = 'definitionReference'
+
+    def __init__(self, name: str | None, reference: str | None) -> None:
+        super().__init__(name, reference)
+        self.definition: FlatFileDefinition | None = None
+
+
+def _load_flatfiletype(elem: ET._Element) -> FlatFileType:
+    """Loads a flatFileType section."""
+    return FlatFileType(
+        elem.get('name'), elem.get('typeReference'),
+        _first_text(elem, 'charset'), _first_text(elem, 'recordSeparator'),
+        _first_text(elem, 'fieldSeparatingChar'),
+        _first_text(elem, 'quotingChar'),
+        elem.find(addml_ns('fixedFileFormat')) is not None)
+
+
+def _load_flatfiledefinition(elem: ET._Element) -> FlatFileDefinition:
+    """Loads a flatFileDefinition section with its recordDefinitions."""
+    records = tuple(
+        RecordDefinition(
+            record.get('name'), record.get('typeReference'),
+            tuple(FieldDefinition(field.get('name'),
+                                  field.get('typeReference'))
+                  for field in record.iter(addml_ns('fieldDefinition'))))
+        for record in elem.iter(addml_ns('recordDefinition')))
+    return FlatFileDefinition(elem.get('name'), elem.get('typeReference'),
+                              records)
+
+
+# Loaders of the sections by tag
+_LOADERS = {
+    'flatFile': lambda elem: FlatFile(elem.get('name'),
+                                      elem.get('definitionReference')),
+    'flatFileDefinition': _load_flatfiledefinition,
+    'flatFileType': _load_flatfiletype,
+    'recordType': lambda elem: RecordType(elem.get('name'),
+                                          elem.get('typeReference')),
+    'fieldType': lambda elem: FieldType(
+        elem.get('name'), elem.get('typeReference'),
+        _first_text(elem, 'dataType')),
+}
+
+
+class AddmlModel:
+    """Sections of ADDML data loaded with :func:`load_model`. Like
+    :class:`addml.base.AddmlIndex`, the sections are found by their tag
+    and @name attribute, keeping the first one of each name.
+    """
+
+    def __init__(self) -> None:
+        self._sections: dict[str, list[Section]] = {
+            tag: [] for tag in _LOADERS}
+        self._names: dict[tuple[str, str | None], Section] = {}
+
+    def add(self, tag: str, section: Section) -> None:
+        """Add a section with the given tag without the namespace."""
+        self._sections[tag].append(section)
+        self._names.setdefault((tag, section.name), section)
+
+    def resolve(self) -> None:
+        """Resolve the references of the sections to the sections they
+        point at. Broken references are resolved to None.
+        """
+        for flatfile in self._sections['flatFile']:
+            flatfile.definition = self.find('flatFileDefinition',
+                                            flatfile.reference)
+        for definition in self._sections['flatFileDefinition']:
+            definition.flatfiletype = self.find('flatFileType',
+                                                definition.reference)
+            for record in definition.records:
+                record.recordtype = self.find('recordType', record.reference)
+                for field in record.fields:
+                    field.fieldtype = self.find('fieldType', field.reference)
+
+    def iter_sections(self, section: str) -> Generator[Section]:
+        """Iterate the sections with the given tag in document order.
+        Only the tags loaded by :func:`load_model` are available.
+        """
+        yield from self._sections.get(section, [])
+
+    def count(self, section: str) -> int:
+        """Return number of sections with the given tag."""
+        return len(self._sections.get(section, []))
+
+    def find(self, section: str, name: str | None) -> Section | None:
+        """Return the first section with the given tag and @name, or
+        None if there is no such section.
+        """
+        return self._names.get((section, name))
+
+    def flatfiletype(self, filename: str) -> FlatFileType | None:
+        """Return the flatFileType of a flatFile, or None if the flatFile
+        is not found or its references are broken.
+        """
+        flatfile = self.find('flatFile', filename)
+        if flatfile is None or flatfile.definition is None:
+            return None
+        return flatfile.definition.flatfiletype
+
+
+def load_model(source: str | IO[bytes]) -> AddmlModel:
+    """Loads the flatFiles, flatFileDefinitions with their record and
+    fieldDefinitions, and the flatFileTypes, recordTypes and fieldTypes
+    of ADDML data into an :class:`AddmlModel`.
+
+    :param source: Path or file-like object of the ADDML data
+    :returns: Model with the references resolved
+    """
+    namespace_len = len(addml_ns(''))
+    model = AddmlModel()
+    for elem in iterparse_sections(source, _LOADERS):
+        tag = elem.tag[namespace_len:]
+        model.add(tag, _LOADERS[tag](elem))
+    model.resolve()
+    return model
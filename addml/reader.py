@@ -0,0 +1,346 @@
+"""Reading the records of flat files described in ADDML data.
+
+The format of the flat file is resolved from the ADDML data. The records
+of delimited flat files are read in blocks with :func:`csv.reader` over
+a large read buffer. The records of fixed-width flat files are read in
+blocks from the memory-mapped file and sliced into fields at precomputed
+offsets, with a NumPy structured dtype if NumPy is installed. The values
+can be converted to Python types by the dataTypes of the fieldTypes of
+the fields.
+"""
+from __future__ import annotations
+
+import datetime
+import itertools
+import mmap
+import operator
+import os
+from collections.abc import Callable, Generator, Sequence
+
+import lxml.etree as ET
+
+from addml.base import AddmlIndex
+from addml.flatfiles import RECORD_SEPARATORS
+from addml.formats import (
+    FieldFormat,
+    FlatFileFormat,
+    resolve_flatfile_format,
+)
+from addml.inference import open_records, python_codec, transpose_records
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _boolean(value: str) -> bool:
+    """Converts a boolean value, which is either true or false in any
+    case.
+    """
+    lower = value.lower()
+    if lower == 'true':
+        return True
+    if lower == 'false':
+        return False
+    raise ValueError(f'invalid boolean value: {value!r}')
+
+
+# Converters of the values by dataType. Values of unknown dataTypes are
+# strings.
+CONVERTERS: dict[str, Callable[[str], object]] = {
+    'string': str,
+    'integer': int,
+    'float': float,
+    'boolean': _boolean,
+    'date': datetime.date.fromisoformat,
+}
+
+
+class FlatFileReader:
+    """Reader of the records of a delimited or fixed-width flat file
+    described in ADDML data::
+
+        reader = FlatFileReader(root, 'csvfile1.csv', directory)
+        for record in reader.records(typed=True):
+            ...
+
+    The records are expected to have the fields of the first
+    recordDefinition of the flatFileDefinition.
+
+    The fields of fixed-width flat files must have a fixedLength. Their
+    startPos, counted from 1 in bytes, defaults to the end of the
+    previous field, and the length of the records to the end of the last
+    field unless the recordDefinition has a fixedLength. Each record
+    must be followed by the recordSeparator of the fixedFileFormat, if
+    it has one. The padding spaces around the values are stripped.
+    """
+
+    def __init__(
+        self,
+        addml_el: ET._Element | AddmlIndex | str,
+        filename: str,
+        directory: str = os.curdir,
+    ) -> None:
+        """Resolve the format of the flat file.
+
+        :param addml_el: ADDML root element, an AddmlIndex of it or the
+                         path of the ADDML data file
+        :param filename: @name of the flatFile
+        :param directory: Directory of the flat file, which is found by
+                          the filename relative to it
+        :raises ValueError: If the flatFile is not found, its references
+                            can not be resolved or the format of the
+                            records is not described
+        """
+        if isinstance(addml_el, ET._Element):
+            addml_el = AddmlIndex(addml_el)
+        flatfile_format = resolve_flatfile_format(addml_el, filename)
+        if flatfile_format is None:
+            raise ValueError(f'flatFile {filename!r} not found')
+        if not flatfile_format.fixed_width and \
+                not flatfile_format.field_separator:
+            raise ValueError(f'flatFile {filename!r} has no '
+                             f'fieldSeparatingChar')
+
+        self.format = flatfile_format
+        self.path = os.path.join(directory, filename)
+        self.fields: tuple[FieldFormat, ...] = \
+            flatfile_format.records[0].fields \
+            if flatfile_format.records else ()
+        if flatfile_format.fixed_width:
+            self._layout = _FixedWidthLayout(flatfile_format)
+
+    def batches(
+        self, size: int = 10000, typed: bool = False
+    ) -> Generator[list[Sequence[object]]]:
+        """Iterate the records in batches of columns. Each batch is a
+        list with a sequence of the values of each field in at most the
+        given number of records.
+
+        :param size: Number of records in each batch
+        :param typed: Convert the values by the dataTypes of the fields,
+                      see :data:`CONVERTERS`. Empty values of fields
+                      that are not strings are converted to None.
+        :raises ValueError: If a record does not have the fields of the
+                            recordDefinition or a value can not be
+                            converted
+        """
+        width = len(self.fields)
+        converters = [CONVERTERS.get(field.datatype, str)
+                      for field in self.fields]
+        first_record = 0
+        for columns in self._raw_batches(size):
+            if typed and width:
+                columns = [
+                    _convert(values, converter, field, first_record)
+                    for values, converter, field
+                    in zip(columns, converters, self.fields)]
+            first_record += len(columns[0]) if columns else 0
+            yield columns
+
+    def _raw_batches(self, size: int) -> Generator[list[Sequence[str]]]:
+        """Iterate the batches of columns of string values."""
+        if self.format.fixed_width:
+            yield from self._layout.batches(self.path, size)
+            return
+
+        width = len(self.fields)
+        first_record = 0
+        with open_records(self.path, self.format) as records:
+            while block := list(itertools.islice(records, size)):
+                if width and set(map(len, block)) != {width}:
+                    for number, record in enumerate(block, first_record + 1):
+                        if len(record) != width:
+                            raise ValueError(
+                                f'Record {number} has {len(record)} '
+                                f'fields, expected {width}')
+                first_record += len(block)
+                yield transpose_records(block)
+
+    def records(
+        self, typed: bool = False, block_records: int = 2000
+    ) -> Generator[tuple[object, ...]]:
+        """Iterate the records as tuples of values.
+
+        :param typed: Convert the values like in :meth:`batches`
+        :param block_records: Number of records read at a time
+        :raises ValueError: Like :meth:`batches`
+        """
+        for columns in self.batches(block_records, typed):
+            yield from zip(*columns)
+
+
+def _convert(
+    values: Sequence[str],
+    converter: Callable[[str], object],
+    field: FieldFormat,
+    first_record: int,
+) -> Sequence[object]:
+    """Converts the values of a column with the converter of its
+    dataType. Empty values of fields that are not strings are None.
+    """
+    if converter is str:
+        return values
+    try:
+        if '' in values:
+            return [converter(value) if value else None for value in values]
+        return list(map(converter, values))
+    except ValueError:
+        # Find the invalid value for the error message
+        for number, value in enumerate(values, first_record + 1):
+            try:
+                if value:
+                    converter(value)
+            except ValueError:
+                raise ValueError(
+                    f'Record {number} has an invalid {field.datatype} '
+                    f'value {value!r} in field {field.name!r}') from None
+        raise
+
+
+class _FixedWidthLayout:
+    """Offsets of the fields in the records of a fixed-width flat file.
+    """
+
+    def __init__(self, flatfile_format: FlatFileFormat) -> None:
+        self.codec = python_codec(flatfile_format.charset)
+        self.separator = b''
+        if flatfile_format.record_separator:
+            self.separator = RECORD_SEPARATORS.get(
+                flatfile_format.record_separator)
+            if self.separator is None:
+                raise ValueError(f'Unsupported recordSeparator: '
+                                 f'{flatfile_format.record_separator}')
+
+        self.slices = []
+        position = 0
+        fields = flatfile_format.records[0].fields \
+            if flatfile_format.records else ()
+        for field in fields:
+            if field.fixed_length is None:
+                raise ValueError(
+                    f'fieldDefinition {field.name!r} has no fixedLength')
+            if field.start_pos is not None:
+                position = field.start_pos - 1
+            self.slices.append(slice(position, position + field.fixed_length))
+            position += field.fixed_length
+        if not self.slices:
+            raise ValueError('Fixed-width flat file has no fieldDefinitions')
+
+        record_length = flatfile_format.records[0].fixed_length
+        end = max(field.stop for field in self.slices)
+        if record_length is None:
+            record_length = end
+        elif record_length < end:
+            raise ValueError(f'recordDefinition fixedLength {record_length} '
+                             f'is shorter than its fields')
+        self.record_length = record_length
+        self.stride = record_length + len(self.separator)
+
+        self.dtype = None
+        # The bytes strings of NumPy drop trailing NUL bytes, which are
+        # parts of the characters in charsets like UTF-16
+        if numpy is not None and _ascii_bytes(self.codec):
+            names = [f'f{position}' for position in range(len(self.slices))]
+            formats = [f'S{field.stop - field.start}'
+                       for field in self.slices]
+            offsets = [field.start for field in self.slices]
+            if self.separator:
+                names.append('separator')
+                formats.append(f'S{len(self.separator)}')
+                offsets.append(record_length)
+            self.dtype = numpy.dtype({
+                'names': names, 'formats': formats, 'offsets': offsets,
+                'itemsize': self.stride})
+
+    def batches(
+        self, path: str, size: int
+    ) -> Generator[list[Sequence[str]]]:
+        """Iterate the batches of columns of the memory-mapped file."""
+        with open(path, 'rb') as infile:
+            file_size = os.fstat(infile.fileno()).st_size
+            if file_size == 0:
+                return
+            count, remainder = divmod(file_size, self.stride)
+            missing_separator = False
+            if remainder:
+                # The last record may lack the record separator
+                if not self.separator or remainder != self.record_length:
+                    raise ValueError(
+                        f'File size {file_size} is not a multiple of the '
+                        f'record length {self.stride}')
+                count += 1
+                missing_separator = True
+
+            with mmap.mmap(infile.fileno(), 0,
+                           access=mmap.ACCESS_READ) as data:
+                for first in range(0, count, size):
+                    block = data[first * self.stride:
+                                 (first + size) * self.stride]
+                    if missing_separator and first + size >= count:
+                        block += self.separator
+                    yield self._columns(block, first)
+
+    def _columns(self, block: bytes, first: int) -> list[Sequence[str]]:
+        """Slice the fields of the records in a block to columns."""
+        count = len(block) // self.stride
+        if self.dtype is not None:
+            array = numpy.frombuffer(block, dtype=self.dtype, count=count)
+            if self.separator:
+                self._check_separators(numpy.flatnonzero(
+                    array['separator'] != self.separator), first)
+            columns = [array[name].tolist()
+                       for name in self.dtype.names[:len(self.slices)]]
+        else:
+            records = [block[start:start + self.stride]
+                       for start in range(0, len(block), self.stride)]
+            if self.separator:
+                self._check_separators(
+                    [position for position, record in enumerate(records)
+                     if record[self.record_length:] != self.separator],
+                    first)
+            getter = operator.itemgetter(*self.slices, slice(0, 0))
+            values = list(itertools.chain.from_iterable(
+                map(getter, records)))
+            width = len(self.slices) + 1
+            columns = [values[position::width]
+                       for position in range(len(self.slices))]
+        return [_decode_column(values, self.codec) for values in columns]
+
+    def _check_separators(self, invalid: Sequence[int], first: int) -> None:
+        """Raise an error for the first record of the block that is not
+        followed by the record separator.
+        """
+        if len(invalid):
+            raise ValueError(f'Record {first + int(invalid[0]) + 1} is not '
+                             f'followed by the record separator')
+
+
+def _decode_column(values: list[bytes], codec: str) -> list[str]:
+    """Decodes the values of a column and strips their padding of
+    whitespace and trailing NUL characters. The values are decoded at
+    once if the charset encodes newlines as single bytes and none of the
+    values has a newline.
+    """
+    if _ascii_bytes(codec):
+        joined = b'\n'.join(values)
+        if joined.count(b'\n') == len(values) - 1:
+            return list(map(_strip_padding,
+                            joined.decode(codec).split('\n')))
+    return [_strip_padding(value.decode(codec)) for value in values]
+
+
+def _strip_padding(value: str) -> str:
+    """Strips the whitespace and trailing NUL characters of a value."""
+    return value.rstrip('\x00').strip()
+
+
+def _ascii_bytes(codec: str) -> bool:
+    """Returns True if the codec decodes the newline and NUL bytes as
+    the characters on their own, like ASCII.
+    """
+    try:
+        return b'\n\x00'.decode(codec) == '\n\x00'
+    except UnicodeDecodeError:
+        return False
@@ -0,0 +1,312 @@
+"""Detection of the format of delimited flat files for ADDML data.
+
+The files are memory-mapped and only bounded samples of them are read,
+so that the format of large files can be detected quickly.
+"""
+from __future__ import annotations
+
+import codecs
+import fnmatch
+import functools
+import mmap
+import os
+import re
+from collections import Counter
+from collections.abc import Iterable, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import lxml.etree as ET
+
+from addml.base import addml
+from addml.flatfiles import (
+    RECORD_SEPARATORS,
+    addml_basic_elem,
+    definition_elems,
+    delimfileformat,
+    wrapper_elems,
+)
+
+# Candidates in the order of preference for equally good matches
+FIELD_SEPARATORS = (';', ',', '\t', '|', ':')
+QUOTING_CHARS = ('"', "'")
+
+_BOUNDARY = b'\r\n' + ''.join(FIELD_SEPARATORS).encode()
+
+
+class SniffResult(NamedTuple):
+    """Detected format of a delimited flat file."""
+    charset: str
+    record_separator: str
+    field_separator: str
+    quoting_char: str | None
+
+    def delimfileformat(self) -> ET._Element:
+        """Returns the delimFileFormat section of the format, see
+        :func:`addml.flatfiles.delimfileformat`.
+        """
+        return delimfileformat(self.record_separator, self.field_separator,
+                               self.quoting_char)
+
+    def flatfiletype(self, name: str) -> ET._Element:
+        """Returns a flatFileType section with the charset and the
+        delimFileFormat of the format.
+
+        :param name: @name of the flatFileType
+        """
+        return definition_elems('flatFileType', name, child_elements=[
+            addml_basic_elem('charset', self.charset),
+            self.delimfileformat()])
+
+
+def sniff_flatfile(
+    path: str, sample_size: int = 65536, samples: int = 4
+) -> SniffResult:
+    """Detects the format of a delimited flat file.
+
+    The record separator, field separator and quoting character are
+    detected from the first sample_size bytes of the file. The charset
+    is detected from the first and last bytes and from the given number
+    of samples evenly spaced in between: if all of them are valid UTF-8,
+    the charset is UTF-8, otherwise ISO-8859-15. Files with a UTF-16
+    byte order mark are detected as UTF-16.
+
+    :param path: Path of the flat file
+    :param sample_size: Size of each sample in bytes
+    :param samples: Number of samples between the first and last bytes
+    :returns: Detected format
+    :raises ValueError: If the file is empty
+    """
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            raise ValueError(f'Empty file: {path}')
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            charset = _sniff_charset(data, sample_size, samples)
+            sample = data[:sample_size]
+            complete = len(data) <= sample_size
+
+    if charset == 'UTF-16':
+        sample = sample[:len(sample) // 2 * 2].decode(
+            'utf-16', errors='ignore').encode('utf-8')
+    elif sample.startswith(codecs.BOM_UTF8):
+        sample = sample[len(codecs.BOM_UTF8):]
+    if not complete:
+        # Leave out the last record, which is probably incomplete
+        end = max(sample.rfind(b'\n'), sample.rfind(b'\r'))
+        if end > 0:
+            sample = sample[:end + 1]
+
+    quoting_char = _sniff_quoting_char(sample)
+    if quoting_char is not None:
+        # Separators within quoted fields are data, not format
+        quote = re.escape(quoting_char.encode())
+        sample = re.sub(quote + b'(?:[^' + quote + b']|' + quote * 2 +
+                        b')*' + quote, b'', sample)
+
+    record_separator = _sniff_record_separator(sample)
+    records = [record for record
+               in sample.split(RECORD_SEPARATORS[record_separator])
+               if record]
+    return SniffResult(charset, record_separator,
+                       _sniff_field_separator(records), quoting_char)
+
+
+def _sniff_charset(data: mmap.mmap, sample_size: int, samples: int) -> str:
+    """Detects the charset from the samples of the file."""
+    if data[:2] in (codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE):
+        return 'UTF-16'
+
+    size = len(data)
+    if size <= sample_size * (samples + 2):
+        offsets = [0]
+        sample_size = size
+    else:
+        step = (size - sample_size) // (samples + 1)
+        offsets = [step * i for i in range(samples + 1)] + \
+            [size - sample_size]
+
+    for offset in offsets:
+        chunk = data[offset:offset + sample_size]
+        if chunk.isascii():
+            continue
+        if offset > 0:
+            # Skip the end of a character split at the start of the chunk
+            start = 0
+            while start < min(3, len(chunk)) and \
+                    0x80 <= chunk[start] < 0xC0:
+                start += 1
+            chunk = chunk[start:]
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        try:
+            decoder.decode(chunk, final=offset + sample_size >= size)
+        except UnicodeDecodeError:
+            return 'ISO-8859-15'
+    return 'UTF-8'
+
+
+def _sniff_quoting_char(sample: bytes) -> str | None:
+    """Detects the quoting character from the quotes that start a field.
+    """
+    best = None
+    best_count = 0
+    for quoting_char in QUOTING_CHARS:
+        quote = quoting_char.encode()
+        count = len(re.findall(
+            b'(?:^|[' + re.escape(_BOUNDARY) + b'])' + re.escape(quote),
+            sample))
+        if count > best_count:
+            best, best_count = quoting_char, count
+    return best
+
+
+def _sniff_record_separator(sample: bytes) -> str:
+    """Detects the most common record separator. CR+LF is used if the
+    sample has no record separators.
+    """
+    crlf = sample.count(b'\r\n')
+    counts = {'CR+LF': crlf,
+              'LF': sample.count(b'\n') - crlf,
+              'CR': sample.count(b'\r') - crlf}
+    return max(counts, key=lambda separator: (
+        counts[separator], separator == 'CR+LF'))
+
+
+def _sniff_field_separator(records: list[bytes]) -> str:
+    """Detects the field separator that occurs most consistently the
+    same number of times in each record.
+    """
+    best = FIELD_SEPARATORS[0]
+    best_score = (0.0, 0)
+    for field_separator in FIELD_SEPARATORS:
+        separator = field_separator.encode()
+        counts = Counter(record.count(separator) for record in records)
+        if not counts:
+            break
+        count, frequency = counts.most_common(1)[0]
+        score = (frequency / len(records), count)
+        if count and score > best_score:
+            best, best_score = field_separator, score
+    return best
+
+
+def _sniff_or_error(
+    path: str, sample_size: int, samples: int
+) -> tuple[SniffResult | None, str | None]:
+    """Detects the format of a flat file, returning the error message
+    instead of raising it. Run in a worker process.
+    """
+    try:
+        return sniff_flatfile(path, sample_size, samples), None
+    except (OSError, ValueError) as exception:
+        return None, str(exception)
+
+
+def sniff_flatfiles(
+    paths: Iterable[str],
+    max_workers: int | None = None,
+    sample_size: int = 65536,
+    samples: int = 4,
+) -> tuple[dict[str, SniffResult], dict[str, str]]:
+    """Detects the formats of many flat files in a pool of worker
+    processes, see :func:`sniff_flatfile`.
+
+    :param paths: Paths of the flat files
+    :param max_workers: Number of worker processes (default=number of
+                        processors)
+    :param sample_size: Size of each sample in bytes
+    :param samples: Number of samples between the first and last bytes
+    :returns: Tuple of a dict mapping the paths to the detected formats
+              and a dict mapping the paths of the files whose format
+              could not be detected to error messages
+    """
+    paths = list(paths)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(paths)))
+    chunksize = max(1, len(paths) // (max_workers * 4))
+
+    results = {}
+    errors = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        outcomes = executor.map(
+            functools.partial(_sniff_or_error, sample_size=sample_size,
+                              samples=samples),
+            paths, chunksize=chunksize)
+        for path, (result, error) in zip(paths, outcomes):
+            if error is None:
+                results[path] = result
+            else:
+                errors[path] = error
+    return results, errors
+
+
+def sniff_directory(
+    directory: str,
+    patterns: Iterable[str] = ('*.csv', '*.tsv', '*.txt'),
+    max_workers: int | None = None,
+    sample_size: int = 65536,
+    samples: int = 4,
+) -> tuple[dict[str, SniffResult], dict[str, str]]:
+    """Detects the formats of the flat files in a directory tree like
+    :func:`sniff_flatfiles`.
+
+    :param directory: Directory to search
+    :param patterns: Shell-style patterns of the flat file names
+    :param max_workers: Number of worker processes (default=number of
+                        processors)
+    :param sample_size: Size of each sample in bytes
+    :param samples: Number of samples between the first and last bytes
+    :returns: Tuple of dicts like sniff_flatfiles, keyed by the paths
+              relative to the directory with '/' as the separator
+    """
+    patterns = list(patterns)
+    relpaths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        relpath = os.path.relpath(dirpath, directory)
+        for filename in sorted(filenames):
+            if any(fnmatch.fnmatch(filename, pattern)
+                   for pattern in patterns):
+                relpaths.append(os.path.normpath(
+                    os.path.join(relpath, filename)))
+    if not relpaths:
+        return {}, {}
+
+    results, errors = sniff_flatfiles(
+        [os.path.join(directory, relpath) for relpath in relpaths],
+        max_workers=max_workers, sample_size=sample_size, samples=samples)
+    names = {os.path.join(directory, relpath): relpath.replace(os.sep, '/')
+             for relpath in relpaths}
+    return ({names[path]: result for path, result in results.items()},
+            {names[path]: error for path, error in errors.items()})
+
+
+def sniffed_addml(results: Mapping[str, SniffResult]) -> ET._Element:
+    """Creates ADDML data for flat files with detected formats. Each
+    distinct format gets a flatFileType and a flatFileDefinition, which
+    the flatFiles of that format refer to. The recordDefinitions of the
+    flatFileDefinitions are left for the caller to add.
+
+    :param results: Dict mapping flatFile names to detected formats, as
+                    returned by :func:`sniff_directory`
+    :returns: ADDML root element
+    """
+    formats: dict[SniffResult, int] = {}
+    flatfiles = []
+    for name, result in results.items():
+        number = formats.setdefault(result, len(formats) + 1)
+        flatfiles.append(definition_elems(
+            'flatFile', name, reference=f'definition{number}'))
+
+    flatfiledefinitions = [
+        definition_elems('flatFileDefinition', f'definition{number}',
+                         reference=f'type{number}')
+        for number in formats.values()]
+    flatfiletypes = [result.flatfiletype(f'type{number}')
+                     for result, number in formats.items()]
+
+    flatfiles.append(
+        wrapper_elems('flatFileDefinitions', flatfiledefinitions))
+    flatfiles.append(wrapper_elems('structureTypes', [
+        wrapper_elems('flatFileTypes', flatfiletypes)]))
+    return addml(child_elements=[wrapper_elems('flatFiles', flatfiles)])
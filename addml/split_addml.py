@@ -3,60 +3,403 @@
 from __future__ import annotations
 
 import copy
+import fnmatch
 import os
-from collections.abc import Generator
+import tempfile
+from array import array
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal
 
 import lxml.etree as ET
 from xml_helpers.utils import readfile
 
 from addml.base import (
+    AddmlIndex,
+    _clear_section,
     addml,
+    addml_ns,
     find_section_by_name,
     iter_sections,
+    iterparse_sections,
     parse_name,
     parse_reference,
 )
+from addml.cache import cache_enabled, read_index
 from addml.flatfiles import (
-    flatfiledefinition_count,
-    iter_flatfiledefinitions,
-    iter_flatfiles,
     parse_charset,
     wrapper_elems,
 )
+from addml.formats import resolve_flatfiles, resolve_flatfiletype
 
 
-def parse_flatfiledefinitions(path: str) -> Generator[ET._Element]:
+def parse_flatfiledefinitions(
+    path: str, stream: bool = False
+) -> Generator[ET._Element]:
     """Parses ADDML data and splits the data into new ADDML data
     files for each flatFileDefinition in the original data file.
     Returns the ADDML data for each created file.
+
+    In streaming mode the original data file is read incrementally and
+    never kept in memory as a whole. See
+    :func:`stream_flatfiledefinitions`.
     """
-    root = readfile(path).getroot()
-    addmldata = root
-    count = flatfiledefinition_count(root)
+    if stream:
+        yield from stream_flatfiledefinitions(path)
+        return
 
-    for flatfiledef in iter_flatfiledefinitions(root):
-        if count > 1:
-            addmldata = create_new_addml(root, flatfiledef)
+    index = _read_index(path)
 
+    for addmldata in split_flatfiledefinitions(index):
+        if addmldata is index.root and cache_enabled():
+            # Do not hand out the cached tree for modification
+            addmldata = copy.deepcopy(addmldata)
         yield addmldata
 
 
-def parse_flatfilenames(path: str, reference: str) -> Generator[str | None]:
+def stream_flatfiledefinitions(path: str) -> Generator[ET._Element]:
+    """Splits the ADDML data file into new ADDML data for each
+    flatFileDefinition like :func:`parse_flatfiledefinitions`, but
+    reads the file incrementally with two iterparse passes.
+
+    The first pass buffers the flatFileTypes, recordTypes and fieldTypes
+    shared by the created ADDML data. The second pass streams the
+    flatFiles and flatFileDefinitions. The flatFiles precede the
+    flatFileDefinitions in ADDML, so they are spooled in serialized form
+    to a temporary file until the ADDML data for their
+    flatFileDefinition is created, see :class:`_FlatFileSpool`.
+    Processed elements are cleared from the parsed tree as the parsing
+    proceeds.
+    """
+    types = {}
+    fieldtypes_list = []
+    count = 0
+    for section in iterparse_sections(
+            path, ['flatFile', 'flatFileDefinition', 'flatFileType',
+                   'recordType', 'fieldTypes']):
+        tag = ET.QName(section).localname
+        if tag == 'flatFile':
+            continue
+        if tag == 'flatFileDefinition':
+            count += 1
+        elif tag == 'fieldTypes':
+            fieldtypes_list.append(copy.deepcopy(section))
+        else:
+            types.setdefault((tag, parse_name(section)),
+                             copy.deepcopy(section))
+
+    if count == 1:
+        yield readfile(path).getroot()
+        return
+
+    with _FlatFileSpool() as flatfiles:
+        for section in iterparse_sections(
+                path, ['flatFile', 'flatFileDefinition']):
+            if ET.QName(section).localname == 'flatFile':
+                flatfiles.add(section)
+                continue
+
+            count -= 1
+            yield _new_addml(
+                flatfiles.pop(parse_name(section)),
+                section,
+                lambda tag, name: types.get((tag, name)),
+                fieldtypes_list)
+            if not count:
+                break
+
+
+class _FlatFileSpool:
+    """Temporary file of serialized flatFile sections grouped by their
+    @definitionReference. Only the offsets and lengths of the sections
+    are kept in memory, as arrays of integers, so the memory use grows
+    slowly with the number of flatFiles. The spool is a context manager
+    that closes the temporary file.
+    """
+
+    def __init__(self) -> None:
+        self._file = tempfile.TemporaryFile()
+        # Offset, length and length with the tail of each flatFile
+        self._positions: dict[str | None, array] = {}
+
+    def __enter__(self) -> _FlatFileSpool:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+    def add(self, flatfile: ET._Element) -> None:
+        """Spool a flatFile section with its tail text."""
+        data = ET.tostring(flatfile, with_tail=False)
+        tail = (flatfile.tail or '').encode()
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(data + tail)
+
+        positions = self._positions.get(parse_reference(flatfile))
+        if positions is None:
+            positions = self._positions[parse_reference(flatfile)] = \
+                array('Q')
+        positions.extend((offset, len(data), len(tail)))
+
+    def keep(self, references: Iterable[str | None]) -> None:
+        """Forget the flatFiles that refer to other flatFileDefinitions
+        than the given ones.
+        """
+        self._positions = {reference: self._positions[reference]
+                           for reference in references
+                           if reference in self._positions}
+
+    def pop(self, reference: str | None) -> list[ET._Element]:
+        """Return the parsed flatFiles that refer to the given
+        flatFileDefinition in the order they were added, and forget
+        them.
+        """
+        positions = self._positions.pop(reference, array('Q'))
+        flatfiles = []
+        for index in range(0, len(positions), 3):
+            offset, length, tail_length = positions[index:index + 3]
+            self._file.seek(offset)
+            data = self._file.read(length + tail_length)
+            flatfiles.append(_fromstring(
+                data[:length],
+                data[length:].decode() if tail_length else None))
+        return flatfiles
+
+
+def split_flatfiledefinitions(
+    root: ET._Element | AddmlIndex,
+) -> Generator[ET._Element]:
+    """Splits ADDML data into new ADDML data for each flatFileDefinition
+    in the original data. If there is only one flatFileDefinition, the
+    original data is returned as such.
+
+    The sections of the original data are indexed in a single traversal
+    and each flatFile and type reference is then resolved with a
+    constant time lookup, so that the total cost of the split is linear
+    to the size of the data and the created ADDML data.
+    """
+    if not isinstance(root, AddmlIndex):
+        root = AddmlIndex(root)
+    count = root.count('flatFileDefinition')
+
+    for flatfiledef in root.iter_sections('flatFileDefinition'):
+        if count > 1:
+            yield create_new_addml(root, flatfiledef)
+        else:
+            yield root.root
+
+
+def select_flatfiledefinitions(
+    path: str | AddmlIndex,
+    definitions: Iterable[str] = (),
+    flatfilenames: Iterable[str] = (),
+    stream: bool = False,
+) -> Generator[ET._Element]:
+    """Creates new ADDML data like :func:`create_new_addml` only for the
+    selected flatFileDefinitions, in the order of the original data.
+    The flatFileDefinitions are selected by their @name attribute or by
+    the @name of the flatFiles that refer to them. Names that are not
+    found are ignored. Unlike in :func:`parse_flatfiledefinitions`, new
+    ADDML data is created even if the original data has only one
+    flatFileDefinition.
+
+    In streaming mode the original data file is read incrementally in
+    one pass, which stops once the selected flatFileDefinitions and the
+    types they refer to have been read. See
+    :func:`stream_selected_flatfiledefinitions`.
+
+    :param path: Path of the ADDML data file, or an AddmlIndex of it if
+                 not streaming
+    :param definitions: @name attributes of the flatFileDefinitions
+    :param flatfilenames: @name attributes of the flatFiles whose
+                          flatFileDefinitions are selected
+    :param stream: Read the data file incrementally
+    """
+    if stream:
+        yield from stream_selected_flatfiledefinitions(path, definitions,
+                                                       flatfilenames)
+        return
+
+    index = _read_index(path)
+    selected = set(definitions)
+    for filename in flatfilenames:
+        flatfile = index.find('flatFile', filename)
+        if flatfile is not None:
+            selected.add(parse_reference(flatfile))
+
+    for flatfiledef in index.iter_sections('flatFileDefinition'):
+        if not selected:
+            break
+        name = parse_name(flatfiledef)
+        if name in selected:
+            # Only the first flatFileDefinition of each name is found
+            # by the references
+            selected.discard(name)
+            yield create_new_addml(index, flatfiledef)
+
+
+def stream_selected_flatfiledefinitions(
+    path: str,
+    definitions: Iterable[str] = (),
+    flatfilenames: Iterable[str] = (),
+) -> Generator[ET._Element]:
+    """Creates new ADDML data for the selected flatFileDefinitions like
+    :func:`select_flatfiledefinitions`, but reads the data file
+    incrementally in one pass.
+
+    Only the flatFiles, flatFileDefinitions and types of the selected
+    flatFileDefinitions are kept. If flatFiles are selected by name, the
+    other flatFiles are spooled to a temporary file until the
+    flatFileDefinitions are reached, since the flatFiles referring to
+    the same flatFileDefinition may precede the selected flatFile. The
+    parsing stops at the end of the structureTypes section once the
+    selected flatFileDefinitions and the flatFileTypes and recordTypes
+    they refer to have been read.
+    """
+    with _FlatFileSpool() as flatfiles:
+        yield from _stream_selected(path, set(definitions),
+                                    set(flatfilenames), flatfiles)
+
+
+def _stream_selected(
+    path: str,
+    selected: set[str],
+    flatfilenames: set[str],
+    flatfiles: _FlatFileSpool,
+) -> Generator[ET._Element]:
+    """Creates the selected ADDML data for
+    :func:`stream_selected_flatfiledefinitions` with the flatFiles
+    spooled to the given spool.
+    """
+    flatfiledefs = {}
+    needed = set()
+    types = {}
+    fieldtypes_list = []
+    for section in _iterparse_structures(
+            path, ['flatFile', 'flatFileDefinition', 'flatFileType',
+                   'recordType', 'fieldTypes']):
+        if section is None:
+            # The end of structureTypes, after which there are no types
+            if len(flatfiledefs) == len(selected) and \
+                    len(types) == len(needed):
+                break
+            continue
+
+        tag = ET.QName(section).localname
+        if tag == 'flatFile':
+            reference = parse_reference(section)
+            if parse_name(section) in flatfilenames:
+                selected.add(reference)
+            if flatfilenames or reference in selected:
+                flatfiles.add(section)
+        elif tag == 'flatFileDefinition':
+            if flatfilenames:
+                # All flatFiles have been read
+                flatfilenames = set()
+                flatfiles.keep(selected)
+            name = parse_name(section)
+            if name in selected and name not in flatfiledefs:
+                flatfiledefs[name] = copy.deepcopy(section)
+                needed.add(('flatFileType', parse_reference(section)))
+                needed.update(
+                    ('recordType', parse_reference(recorddefinition))
+                    for recorddefinition
+                    in iter_sections(section, 'recordDefinition')
+                    if parse_reference(recorddefinition))
+        elif tag == 'fieldTypes':
+            fieldtypes_list.append(copy.deepcopy(section))
+        elif (tag, parse_name(section)) in needed:
+            types.setdefault((tag, parse_name(section)),
+                             copy.deepcopy(section))
+
+    for name, flatfiledef in flatfiledefs.items():
+        yield _new_addml(
+            flatfiles.pop(name),
+            flatfiledef,
+            lambda tag, name: types.get((tag, name)),
+            fieldtypes_list)
+
+
+def _iterparse_structures(
+    source: str, sections: Iterable[str]
+) -> Generator[ET._Element | None]:
+    """Iterate the sections like :func:`addml.base.iterparse_sections`,
+    and yield None at the end of each structureTypes section. The
+    sections within the structureTypes section are yielded before it.
+    """
+    structuretypes = addml_ns('structureTypes')
+    context = ET.iterparse(
+        source, events=('end',),
+        tag=[addml_ns(tag) for tag in sections] + [structuretypes])
+    pending = None
+    for _, elem in context:
+        if pending is not None:
+            yield pending
+            _clear_section(pending)
+            pending = None
+        if elem.tag == structuretypes:
+            yield None
+        else:
+            pending = elem
+
+    if pending is not None:
+        yield pending
+        _clear_section(pending)
+
+
+def _fromstring(text: bytes, tail: str | None) -> ET._Element:
+    """Parses a serialized section and restores its tail text."""
+    section = ET.fromstring(text)
+    section.tail = tail
+    return section
+
+
+def _read_index(path: str | AddmlIndex) -> AddmlIndex:
+    """Returns an index of the ADDML file in the given path. If an
+    index is given instead of a path, it is returned as such. The
+    parsed file is shared through :mod:`addml.cache` if caching is
+    enabled.
+    """
+    if isinstance(path, AddmlIndex):
+        return path
+    return read_index(path)
+
+
+def _read_root(path: str | AddmlIndex) -> ET._Element | AddmlIndex:
+    """Returns the index of the ADDML file in the given path if one is
+    given or cached, and otherwise the parsed root element. Building an
+    index for a single lookup costs more than searching the tree for the
+    first matching sections.
+    """
+    if isinstance(path, AddmlIndex) or cache_enabled():
+        return _read_index(path)
+    return readfile(path).getroot()
+
+
+def parse_flatfilenames(
+    path: str | AddmlIndex, reference: str
+) -> Generator[str | None]:
     """Returns the @name attribute for each flatFile whose
     @definitionReference attribute value matches the supplied value.
+    An already built :class:`AddmlIndex` can be given in place of the
+    path.
     """
-    root = readfile(path).getroot()
+    root = _read_root(path)
+    if isinstance(root, AddmlIndex):
+        flatfiles = root.referring('flatFile', reference)
+    else:
+        flatfiles = (flatfile for flatfile in iter_sections(root, 'flatFile')
+                     if parse_reference(flatfile) == reference)
 
-    for flatfile in iter_flatfiles(root):
-        if parse_reference(flatfile) == reference:
-            flatfilename = parse_name(flatfile)
+    for flatfile in flatfiles:
+        flatfilename = parse_name(flatfile)
 
-            yield flatfilename
+        yield flatfilename
 
 
 def create_new_addml(
-    root: ET._Element, flatfiledefinition: ET._Element
+    root: ET._Element | AddmlIndex, flatfiledefinition: ET._Element
 ) -> ET._Element:
     """Creates new addml metadata for each flatFileDefinition in the
     original addml metadata. Only the relevant sections from flatFiles,
@@ -64,13 +407,34 @@ def create_new_addml(
     as well as the fieldTypes section. The sections relevance is derived
     from reading the corresponding @typeReference and @name attributes
     from each section starting from the <flatFileDefinition> element.
+
+    The sections are looked up from an :class:`AddmlIndex` that can be
+    given in place of the root element. Pass the same index for each
+    flatFileDefinition to avoid scanning the whole tree on every call.
     """
-    flatfiles_list = []
+    if not isinstance(root, AddmlIndex):
+        root = AddmlIndex(root)
+
+    return _new_addml(
+        root.referring('flatFile', parse_name(flatfiledefinition)),
+        flatfiledefinition,
+        root.find,
+        root.iter_sections('fieldTypes'))
+
 
-    namereference = parse_name(flatfiledefinition)
-    for flatfile in iter_flatfiles(root):
-        if parse_reference(flatfile) == namereference:
-            flatfiles_list.append(copy.deepcopy(flatfile))
+def _new_addml(
+    flatfiles: Iterable[ET._Element],
+    flatfiledefinition: ET._Element,
+    find_type: Callable[[str, str], ET._Element | None],
+    fieldtypes_list: Iterable[ET._Element],
+) -> ET._Element:
+    """Creates new addml metadata from copies of the given flatFiles,
+    flatFileDefinition and fieldTypes sections. The flatFileType and
+    recordType sections referenced from the flatFileDefinition are
+    looked up with the `find_type` function, called with the tag and
+    @name attribute value of the section.
+    """
+    flatfiles_list = [copy.deepcopy(flatfile) for flatfile in flatfiles]
 
     typereference = parse_reference(flatfiledefinition)
     flatfiledefinitions = wrapper_elems(
@@ -80,7 +444,7 @@ def create_new_addml(
 
     structuretypes_list = []
 
-    flatfiletype = find_section_by_name(root, 'flatFileType', typereference)
+    flatfiletype = find_type('flatFileType', typereference)
     flatfiletypes = wrapper_elems(
         'flatFileTypes', child_elements=[copy.deepcopy(flatfiletype)])
     structuretypes_list.append(flatfiletypes)
@@ -88,13 +452,13 @@ def create_new_addml(
     for recorddefinition in iter_sections(flatfiledefinitions,
                                           'recordDefinition'):
         if parse_reference(recorddefinition):
-            recordtype = find_section_by_name(
-                root, 'recordType', parse_reference(recorddefinition))
+            recordtype = find_type(
+                'recordType', parse_reference(recorddefinition))
             recordtypes = wrapper_elems(
                 'recordTypes', child_elements=[copy.deepcopy(recordtype)])
             structuretypes_list.append(recordtypes)
 
-    for fieldtypes in iter_sections(root, 'fieldTypes'):
+    for fieldtypes in fieldtypes_list:
         structuretypes_list.append(copy.deepcopy(fieldtypes))
 
     structuretypes = wrapper_elems('structureTypes',
@@ -113,37 +477,164 @@ def check_addml_relpath(
     relative path of the ADDML file if one is found, otherwise returns
     False.
     """
+    return scan_addml_relpath(path)
+
+
+def scan_addml_relpath(
+    path: str,
+    max_depth: int | None = None,
+    skip_dirs: Iterable[str] | None = None,
+) -> tuple[str, str] | tuple[Literal[False], Literal[False]]:
+    """Finds the first ADDML file within the package like
+    :func:`os.walk` would, but stops scanning as soon as the file is
+    found. The directories are scanned top-down in the order
+    :func:`os.scandir` lists them, and symbolic links to directories are
+    not followed.
 
+    :param path: Path of the package
+    :param max_depth: Maximum depth of the scanned subdirectories, where
+                      0 scans only the package directory itself
+                      (default=no limit)
+    :param skip_dirs: Glob patterns of directory names that are not
+                      scanned
+    :returns: Tuple of the relative path of the directory of the ADDML
+              file and the path of the ADDML file, or (False, False) if
+              no ADDML file was found
+    """
     addml_filename = 'addml.xml'
+    skip_dirs = list(skip_dirs or [])
+
+    stack = [(path, 0)]
+    while stack:
+        root, depth = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
 
-    for root, _, files in os.walk(path):
-        for filename in files:
-            if filename == addml_filename:
-                addml_relpath = os.path.relpath(root, path)
-                if addml_relpath == '.':
-                    addml_relpath = ''
-                addml_path = os.path.join(path, addml_relpath, addml_filename)
+                    if not is_dir:
+                        if entry.name == addml_filename:
+                            addml_relpath = os.path.relpath(root, path)
+                            if addml_relpath == '.':
+                                addml_relpath = ''
+                            addml_path = os.path.join(
+                                path, addml_relpath, addml_filename)
+                            return addml_relpath, addml_path
+                    elif _scan_subdir(entry, depth, max_depth, skip_dirs):
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+
+        stack.extend((subdir, depth + 1) for subdir in reversed(subdirs))
 
-                return addml_relpath, addml_path
     return False, False
 
 
-def get_charset_with_filename(path: str, filename: str) -> str | None:
+def _scan_subdir(
+    entry: os.DirEntry,
+    depth: int,
+    max_depth: int | None,
+    skip_dirs: list[str],
+) -> bool:
+    """Returns True if the directory entry should be scanned."""
+    if max_depth is not None and depth >= max_depth:
+        return False
+    try:
+        if entry.is_symlink():
+            return False
+    except OSError:
+        pass
+    return not any(fnmatch.fnmatchcase(entry.name, pattern)
+                   for pattern in skip_dirs)
+
+
+def scan_addml_relpaths(
+    paths: Iterable[str],
+    max_depth: int | None = None,
+    skip_dirs: Iterable[str] | None = None,
+    max_workers: int | None = None,
+) -> dict[str, tuple[str, str] | tuple[Literal[False], Literal[False]]]:
+    """Finds the ADDML files within many packages concurrently with a
+    pool of threads. See :func:`scan_addml_relpath`.
+
+    :param paths: Paths of the packages
+    :param max_depth: Maximum depth of the scanned subdirectories
+    :param skip_dirs: Glob patterns of directory names that are not
+                      scanned
+    :param max_workers: Number of threads
+    :returns: Dict mapping each package path to the result of
+              :func:`scan_addml_relpath` for it
+    """
+    paths = list(paths)
+    skip_dirs = list(skip_dirs or [])
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda path: scan_addml_relpath(path, max_depth, skip_dirs),
+            paths)
+        return dict(zip(paths, results))
+
+
+def get_charset_with_filename(
+    path: str | AddmlIndex, filename: str
+) -> str | None:
     """Returns the charset from the ADDML data for a given file. The
     filename is matched against the @name attribute for each flatFile
     element and the correct charset is returned from the correct
-    flatFileType section that matches the flatFile.
-    """
-    root = readfile(path).getroot()
-    for flatfile in iter_flatfiles(root):
-        if parse_name(flatfile) == filename:
-            def_reference = parse_reference(flatfile)
-            definition = find_section_by_name(root, 'flatFileDefinition',
-                                              def_reference)
-            type_reference = parse_reference(definition)
-            flatfiletype = find_section_by_name(root, 'flatFileType',
-                                                type_reference)
-            charset = f'charset={parse_charset(flatfiletype)}'
-
-            return charset
-    return None
+    flatFileType section that matches the flatFile. An already built
+    :class:`AddmlIndex` can be given in place of the path.
+    """
+    root = _read_root(path)
+    flatfile = find_section_by_name(root, 'flatFile', filename)
+    if flatfile is None:
+        return None
+
+    def_reference = parse_reference(flatfile)
+    definition = find_section_by_name(root, 'flatFileDefinition',
+                                      def_reference)
+    type_reference = parse_reference(definition)
+    flatfiletype = find_section_by_name(root, 'flatFileType',
+                                        type_reference)
+    charset = f'charset={parse_charset(flatfiletype)}'
+
+    return charset
+
+
+def get_charsets_with_filenames(
+    path: str | AddmlIndex, filenames: Iterable[str] | None = None
+) -> tuple[dict[str, str | None], dict[str, str]]:
+    """Returns the charsets from the ADDML data for all files, or for
+    the given filenames, in one pass. Each charset is resolved like in
+    :func:`get_charset_with_filename`, but the flatFileDefinition and
+    flatFileType of each flatFile are resolved only once.
+
+    Broken references do not stop the resolution. Instead, the files
+    whose charset could not be resolved are reported separately.
+
+    :param path: Path of the ADDML data file or an AddmlIndex of it
+    :param filenames: Filenames to resolve (default=all flatFiles)
+    :returns: A tuple of two dicts. The first maps filenames to charset
+              strings, or to None for the given filenames that have no
+              flatFile. The second maps filenames to an error message
+              for the files whose references could not be resolved.
+    """
+    index = _read_index(path)
+    return resolve_flatfiles(
+        index, filenames,
+        lambda def_reference: _resolve_charset(index, def_reference))
+
+
+def _resolve_charset(
+    index: AddmlIndex, def_reference: str
+) -> tuple[str | None, str | None]:
+    """Resolves the charset for the flatFileDefinition with the given
+    name. Returns a tuple of the charset string and an error message,
+    one of which is None.
+    """
+    sections, error = resolve_flatfiletype(index, def_reference)
+    if error:
+        return None, error
+    return f'charset={sections[2]}', None
@@ -0,0 +1,296 @@
+"""Functions for writing split ADDML data to files.
+"""
+from __future__ import annotations
+
+import copy
+import os
+import re
+from collections.abc import Generator, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO
+
+import lxml.etree as ET
+import xml_helpers.utils as h
+
+from addml.base import (
+    NAMESPACES,
+    SCHEMA_LOCATION,
+    AddmlIndex,
+    addml,
+    addml_ns,
+    iter_sections,
+    iterparse_sections,
+    parse_name,
+    parse_reference,
+)
+from addml.cache import enable_cache, read_index
+
+_START_TAG = re.compile(rb'<[^\s/>]+')
+_NAMESPACE_DECLARATION = re.compile(rb'\s+xmlns(?::([^\s=]+))?="([^"]*)"')
+
+
+def write_flatfiledefinitions(
+    path: str,
+    directory: str,
+    template: str = '{name}.xml',
+    max_workers: int | None = None,
+) -> dict[str, str]:
+    """Splits the ADDML data file like
+    :func:`addml.split_addml.parse_flatfiledefinitions` and writes the
+    ADDML data created for each flatFileDefinition to a file in the
+    given directory.
+
+    The flatFileDefinitions are divided between a pool of worker
+    processes, each of which parses the ADDML data file once and writes
+    its share of the files. Each file is written to a temporary file
+    first and then renamed, so that incomplete files are never visible
+    in the directory.
+
+    :param path: Path of the ADDML data file
+    :param directory: Directory for the created files
+    :param template: Filename template, formatted with `name`, the @name
+                     of the flatFileDefinition, and `index`, the position
+                     of the flatFileDefinition in the ADDML data
+    :param max_workers: Number of worker processes (default=number of
+                        processors)
+    :returns: Dict mapping flatFileDefinition names to the paths of the
+              created files
+    :raises ValueError: If the flatFileDefinition names are not unique
+                        or the template gives invalid or clashing
+                        filenames
+    """
+    names = [parse_name(section) for section in iterparse_sections(
+        path, ['flatFile', 'flatFileDefinition'])
+        if ET.QName(section).localname == 'flatFileDefinition']
+    if len(set(names)) != len(names):
+        raise ValueError('flatFileDefinition names are not unique')
+
+    outputs = []
+    for position, name in enumerate(names):
+        filename = template.format(name=name, index=position)
+        if not filename or os.path.basename(filename) != filename \
+                or filename in (os.curdir, os.pardir):
+            raise ValueError(f'Invalid output filename: {filename!r}')
+        outputs.append(os.path.join(directory, filename))
+    if len(set(outputs)) != len(outputs):
+        raise ValueError('Output filenames are not unique')
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(names)))
+    # Use a few tasks per worker to even out the differences in the
+    # sizes of the flatFileDefinitions.
+    chunk_size = max(1, -(-len(names) // (max_workers * 4)))
+    tasks = [list(range(start, min(start + chunk_size, len(names))))
+             for start in range(0, len(names), chunk_size)]
+
+    os.makedirs(directory, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             initializer=enable_cache,
+                             initargs=(1,)) as executor:
+        futures = [
+            executor.submit(_write_split_files, path,
+                            [(position, outputs[position])
+                             for position in positions])
+            for positions in tasks]
+        for future in futures:
+            future.result()
+
+    return dict(zip(names, outputs))
+
+
+def _write_split_files(
+    path: str, outputs: Iterable[tuple[int, str]]
+) -> None:
+    """Writes the split ADDML data for the flatFileDefinitions in the
+    given positions to the given output paths. Run in a worker process.
+    """
+    index = read_index(path)
+    writer = SplitWriter(index)
+    definitions = list(index.iter_sections('flatFileDefinition'))
+    for position, output in outputs:
+        with _atomic_output(output) as outfile:
+            if len(definitions) > 1:
+                writer.write(definitions[position], outfile)
+            else:
+                _write_tree(index.root, outfile)
+
+
+def write_addml(addmldata: ET._Element, path: str) -> None:
+    """Writes ADDML data to a file atomically. The data is written to a
+    temporary file in the same directory, which is then renamed to the
+    given path.
+
+    :param addmldata: ADDML root element
+    :param path: Path of the created file
+    """
+    with _atomic_output(path) as outfile:
+        _write_tree(addmldata, outfile)
+
+
+def _write_tree(addmldata: ET._Element, outfile: BinaryIO) -> None:
+    """Serializes ADDML data with an XML declaration."""
+    ET.ElementTree(addmldata).write(
+        outfile, xml_declaration=True, encoding='UTF-8')
+
+
+@contextmanager
+def _atomic_output(path: str) -> Generator[BinaryIO]:
+    """Opens a temporary file for writing, and renames it to the given
+    path when the context is exited without errors.
+    """
+    directory, filename = os.path.split(path)
+    temp_path = os.path.join(directory, f'.{filename}.{os.getpid()}.tmp')
+    try:
+        with open(temp_path, 'wb') as outfile:
+            yield outfile
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def write_new_addml(
+    root: ET._Element | AddmlIndex,
+    flatfiledefinition: ET._Element,
+    output: str | BinaryIO,
+) -> None:
+    """Writes the ADDML data that
+    :func:`addml.split_addml.create_new_addml` creates for the
+    flatFileDefinition, without building it in memory. The sections
+    are copied from the original data to the output one by one with
+    :class:`lxml.etree.xmlfile`.
+
+    The output is identical to the output of :func:`write_addml` for
+    the ADDML data returned by create_new_addml. Use a
+    :class:`SplitWriter` to write the data for several
+    flatFileDefinitions of the same original data.
+
+    :param root: Original ADDML root element or an AddmlIndex of it
+    :param flatfiledefinition: flatFileDefinition in the original data
+    :param output: Path or binary file object to write to
+    """
+    SplitWriter(root).write(flatfiledefinition, output)
+
+
+class SplitWriter:
+    """Writes split ADDML data for the flatFileDefinitions of the
+    original ADDML data, like :func:`write_new_addml`.
+
+    The flatFileType, recordType and fieldTypes sections are shared by
+    the split data of many flatFileDefinitions. The writer serializes
+    each of them only once and writes the same bytes to every output.
+    The original data must not be modified while the writer is used.
+    """
+
+    def __init__(self, root: ET._Element | AddmlIndex) -> None:
+        """Create the writer.
+
+        :param root: Original ADDML root element or an AddmlIndex of it
+        """
+        if not isinstance(root, AddmlIndex):
+            root = AddmlIndex(root)
+        self.index = root
+        self._types: dict[tuple[str, str], bytes] = {}
+        self._fieldtypes: bytes | None = None
+
+    def write(
+        self, flatfiledefinition: ET._Element, output: str | BinaryIO
+    ) -> None:
+        """Write the split ADDML data for the flatFileDefinition.
+
+        :param flatfiledefinition: flatFileDefinition in the original data
+        :param output: Path or binary file object to write to
+        """
+        if isinstance(output, str):
+            with open(output, 'wb') as outfile:
+                self._write(flatfiledefinition, outfile)
+        else:
+            self._write(flatfiledefinition, output)
+
+    def _type_section(self, tag: str, name: str) -> bytes:
+        """Return the serialized type section with the given tag and
+        @name attribute value.
+        """
+        key = (tag, name)
+        if key not in self._types:
+            self._types[key] = serialize_section(self.index.find(tag, name))
+        return self._types[key]
+
+    def _fieldtypes_sections(self) -> bytes:
+        """Return the serialized fieldTypes sections."""
+        if self._fieldtypes is None:
+            self._fieldtypes = b''.join(
+                serialize_section(fieldtypes) for fieldtypes
+                in self.index.iter_sections('fieldTypes'))
+        return self._fieldtypes
+
+    def _write(
+        self, flatfiledefinition: ET._Element, outfile: BinaryIO
+    ) -> None:
+        """Write the split ADDML data for the flatFileDefinition to an
+        open binary file object.
+        """
+        def write_raw(data):
+            xf.flush()
+            outfile.write(data)
+
+        with ET.xmlfile(outfile, encoding='UTF-8') as xf:
+            xf.write_declaration()
+            with xf.element(addml_ns('addml'),
+                            {h.xsi_ns('schemaLocation'): SCHEMA_LOCATION},
+                            nsmap=NAMESPACES), \
+                    xf.element(addml_ns('dataset')), \
+                    xf.element(addml_ns('flatFiles')):
+                for flatfile in self.index.referring(
+                        'flatFile', parse_name(flatfiledefinition)):
+                    write_raw(serialize_section(flatfile))
+
+                with xf.element(addml_ns('flatFileDefinitions')):
+                    write_raw(serialize_section(flatfiledefinition))
+
+                with xf.element(addml_ns('structureTypes')):
+                    with xf.element(addml_ns('flatFileTypes')):
+                        write_raw(self._type_section(
+                            'flatFileType',
+                            parse_reference(flatfiledefinition)))
+
+                    for recorddefinition in iter_sections(
+                            flatfiledefinition, 'recordDefinition'):
+                        if parse_reference(recorddefinition):
+                            with xf.element(addml_ns('recordTypes')):
+                                write_raw(self._type_section(
+                                    'recordType',
+                                    parse_reference(recorddefinition)))
+
+                    write_raw(self._fieldtypes_sections())
+            xf.flush()
+
+
+def serialize_section(section: ET._Element) -> bytes:
+    """Serializes an ADDML section, including its tail text, as it is
+    serialized within ADDML data created with :func:`addml.base.addml`.
+    The namespace declarations that the ADDML root element already has
+    are left out from the start tag of the section.
+    """
+    if section.nsmap.items() <= NAMESPACES.items():
+        text = ET.tostring(section, encoding='UTF-8')
+    else:
+        # Let lxml map the namespaces of the section to the ones of the
+        # ADDML root element, like it does when building the data.
+        section_copy = copy.deepcopy(section)
+        addml().append(section_copy)
+        text = ET.tostring(section_copy, encoding='UTF-8')
+    start = _START_TAG.match(text).end()
+    position = start
+    declarations = []
+    while match := _NAMESPACE_DECLARATION.match(text, position):
+        prefix, uri = match.groups()
+        if prefix is None or \
+                NAMESPACES.get(prefix.decode()) != uri.decode():
+            declarations.append(match.group())
+        position = match.end()
+
+    return b''.join([text[:start], *declarations, text[position:]])
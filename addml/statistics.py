@@ -0,0 +1,217 @@
+"""Record statistics of flat files for the properties of flatFiles.
+
+The flat files are memory-mapped and their record separators are
+counted in large blocks with bulk byte searches. The records can
+therefore be counted only in charsets that encode the separators and
+the quoting character like ASCII.
+"""
+from __future__ import annotations
+
+import codecs
+import mmap
+import operator
+import os
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import lxml.etree as ET
+
+from addml.base import AddmlIndex, addml_ns, find_section_by_name
+from addml.flatfiles import (
+    RECORD_SEPARATORS,
+    addml_basic_elem,
+    definition_elems,
+    wrapper_elems,
+)
+from addml.formats import resolve_flatfile_formats
+from addml.inference import python_codec
+
+RECORDS_PROPERTY = 'numberOfRecords'
+SIZE_PROPERTY = 'fileSize'
+
+_BLOCK_SIZE = 1 << 20
+
+
+class FileStatistics(NamedTuple):
+    """Statistics of a flat file."""
+    size: int
+    records: int
+
+
+def count_records(
+    path: str,
+    record_separator: str = 'CR+LF',
+    quoting_char: str | None = None,
+    block_size: int = _BLOCK_SIZE,
+    charset: str | None = None,
+) -> int:
+    """Counts the records of a flat file. Record separators within
+    quoted fields are not counted, and the last record is counted even
+    if it is not followed by a record separator.
+
+    :param path: Path of the flat file
+    :param record_separator: ADDML recordSeparator of the file
+    :param quoting_char: Quoting character of the fields, if any
+    :param block_size: Size of the blocks searched at a time in bytes
+    :param charset: ADDML charset of the file (default=ASCII compatible)
+    :returns: Number of records
+    :raises ValueError: If the record separator is not supported, or
+                        the charset does not encode the separator and
+                        the quoting character like ASCII
+    """
+    separator = RECORD_SEPARATORS.get(record_separator)
+    if separator is None:
+        raise ValueError(f'Unsupported recordSeparator: {record_separator}')
+    try:
+        quote = quoting_char.encode('ascii') if quoting_char else None
+    except UnicodeError:
+        raise ValueError(
+            f'Unsupported quotingChar: {quoting_char!r}') from None
+    if charset is not None:
+        _check_charset(charset, separator + (quote or b''))
+    count_separators = operator.methodcaller('count', separator)
+
+    with open(path, 'rb') as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if size == 0:
+            return 0
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            records = 0
+            in_quotes = False
+            for start in range(0, size, block_size):
+                block = data[start:start + block_size]
+                if quote is None:
+                    records += block.count(separator)
+                else:
+                    # The parts between the quoting characters are
+                    # alternately outside and inside quoted fields
+                    parts = block.split(quote)
+                    records += sum(map(count_separators,
+                                       parts[in_quotes::2]))
+                    in_quotes ^= len(parts) % 2 == 0
+                # Count a separator split between two blocks
+                end = start + block_size
+                if len(separator) > 1 and end < size and not in_quotes \
+                        and data[end - 1:end + 1] == separator:
+                    records += 1
+            if data[-len(separator):] != separator:
+                records += 1
+    return records
+
+
+def _check_charset(charset: str, characters: bytes) -> None:
+    """Checks that the charset encodes the characters like ASCII, so
+    that they can be searched at byte level.
+
+    :raises ValueError: If the charset is unknown or encodes the
+                        characters differently
+    """
+    try:
+        codec = python_codec(charset)
+        codecs.lookup(codec)
+    except LookupError:
+        raise ValueError(f'Unknown charset {charset!r}') from None
+    try:
+        ascii_compatible = characters.decode(codec) == \
+            characters.decode('ascii')
+    except UnicodeError:
+        ascii_compatible = False
+    if not ascii_compatible:
+        raise ValueError(f'Records can not be counted in charset '
+                         f'{charset!r}')
+
+
+def flatfile_statistics(
+    path: str,
+    record_separator: str = 'CR+LF',
+    quoting_char: str | None = None,
+    charset: str | None = None,
+) -> FileStatistics:
+    """Returns the size and the number of records of a flat file, see
+    :func:`count_records`.
+    """
+    return FileStatistics(
+        os.path.getsize(path),
+        count_records(path, record_separator, quoting_char,
+                      charset=charset))
+
+
+def statistics_properties(statistics: FileStatistics) -> list[ET._Element]:
+    """Creates the property sections for the statistics of a flat file::
+
+        <addml:property name="numberOfRecords">
+            <addml:value>100</addml:value>
+        </addml:property>
+    """
+    return [
+        definition_elems('property', name, child_elements=[
+            addml_basic_elem('value', str(value))])
+        for name, value in [(RECORDS_PROPERTY, statistics.records),
+                            (SIZE_PROPERTY, statistics.size)]]
+
+
+def add_flatfile_statistics(
+    addml_el: ET._Element | AddmlIndex,
+    directory: str,
+    filenames: Iterable[str] | None = None,
+    max_workers: int | None = None,
+) -> tuple[dict[str, FileStatistics], dict[str, str]]:
+    """Computes the statistics of the flat files described in the ADDML
+    data in a thread pool, and adds them to the properties of the
+    flatFiles. Existing statistics properties are replaced.
+
+    :param addml_el: ADDML root element or an AddmlIndex of it
+    :param directory: Directory of the flat files, which are found by
+                      their flatFile @name relative to it
+    :param filenames: Filenames to process (default=all flatFiles)
+    :param max_workers: Number of threads (default=chosen by
+                        :class:`concurrent.futures.ThreadPoolExecutor`)
+    :returns: Tuple of a dict mapping the filenames to their statistics
+              and a dict mapping the filenames that could not be
+              processed to error messages
+    """
+    index = addml_el if isinstance(addml_el, AddmlIndex) \
+        else AddmlIndex(addml_el)
+    formats, errors = resolve_flatfile_formats(index, filenames)
+    for filename, flatfile_format in formats.items():
+        if flatfile_format is None:
+            errors[filename] = 'flatFile not found'
+    formats = {filename: flatfile_format for filename, flatfile_format
+               in formats.items() if flatfile_format is not None}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            filename: executor.submit(
+                flatfile_statistics, os.path.join(directory, filename),
+                flatfile_format.record_separator,
+                flatfile_format.quoting_char, flatfile_format.charset)
+            for filename, flatfile_format in formats.items()}
+
+    results = {}
+    for filename, future in futures.items():
+        try:
+            results[filename] = future.result()
+        except (OSError, ValueError) as exception:
+            errors[filename] = str(exception)
+            continue
+        _set_properties(find_section_by_name(index, 'flatFile', filename),
+                        statistics_properties(results[filename]))
+    return results, errors
+
+
+def _set_properties(
+    section: ET._Element, properties: list[ET._Element]
+) -> None:
+    """Adds the property sections to the properties of the section,
+    replacing the existing properties with the same names.
+    """
+    wrapper = section.find(addml_ns('properties'))
+    if wrapper is None:
+        wrapper = wrapper_elems('properties')
+        section.append(wrapper)
+    names = {prop.get('name') for prop in properties}
+    for prop in wrapper.findall(addml_ns('property')):
+        if prop.get('name') in names:
+            wrapper.remove(prop)
+    wrapper.extend(properties)
@@ -0,0 +1,418 @@
+"""Validation of delimited flat files against their ADDML descriptions.
+
+The files are checked at byte level: the records are split at the
+record separators outside quoted fields and the fields of each record
+are counted, and the bytes are decoded with the charset of the file.
+Large files are split into chunks at record boundaries, which are
+checked in a pool of worker processes.
+"""
+from __future__ import annotations
+
+import codecs
+import itertools
+import mmap
+import operator
+import os
+import re
+from collections.abc import Iterable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import NamedTuple
+
+from addml.base import AddmlIndex
+from addml.flatfiles import RECORD_SEPARATORS
+from addml.formats import FlatFileFormat, resolve_flatfile_formats
+from addml.inference import python_codec
+
+_CHUNK_SIZE = 1 << 25
+_DECODE_SIZE = 1 << 20
+
+
+class ValidationError(NamedTuple):
+    """Error found in a flat file.
+
+    The offset is the byte offset of the erroneous record or byte in the
+    file, and record is the number of the record counted from 1, or None
+    if the error does not concern a record.
+    """
+    offset: int
+    record: int | None
+    message: str
+
+
+def validate_flatfile(
+    path: str,
+    flatfile_format: FlatFileFormat,
+    max_workers: int | None = None,
+    chunk_size: int = _CHUNK_SIZE,
+    max_errors: int = 100,
+) -> list[ValidationError]:
+    """Validates a delimited flat file against its format. The file must
+    be decodable with its charset, its records must have as many fields
+    as one of its recordDefinitions and its quoted fields must be
+    terminated.
+
+    The records are checked only if the charset encodes the separators
+    and the quoting character as single ASCII bytes. Otherwise only the
+    charset is checked.
+
+    :param path: Path of the flat file
+    :param flatfile_format: Format of the flat file, see
+                            :func:`addml.formats.resolve_flatfile_format`
+    :param max_workers: Number of worker processes (default=number of
+                        processors)
+    :param chunk_size: Approximate size of the chunks of the file
+                       checked in parallel, in bytes
+    :param max_errors: Maximum number of errors reported
+    :returns: List of the errors ordered by offset
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return _validate(executor, path, flatfile_format, chunk_size,
+                         max_errors)
+
+
+def validate_flatfiles(
+    path: str | AddmlIndex,
+    directory: str,
+    filenames: Iterable[str] | None = None,
+    max_workers: int | None = None,
+    chunk_size: int = _CHUNK_SIZE,
+    max_errors: int = 100,
+) -> dict[str, list[ValidationError]]:
+    """Validates the flat files described in the ADDML data like
+    :func:`validate_flatfile`, sharing one pool of worker processes.
+
+    :param path: Path of the ADDML data file or an AddmlIndex of it
+    :param directory: Directory of the flat files, which are found by
+                      their flatFile @name relative to it
+    :param filenames: Filenames to validate (default=all flatFiles)
+    :param max_workers: Number of worker processes (default=number of
+                        processors)
+    :param chunk_size: Approximate size of the chunks of the files
+                       checked in parallel, in bytes
+    :param max_errors: Maximum number of errors reported for each file
+    :returns: Dict mapping the filenames to lists of errors. Files
+              without a flatFile or with broken references get a single
+              error.
+    """
+    formats, errors = resolve_flatfile_formats(path, filenames)
+    results = {filename: [ValidationError(0, None, error)]
+               for filename, error in errors.items()}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Submit the work of all files before waiting for the results,
+        # so that also many small files are checked in parallel
+        jobs = {}
+        for filename, flatfile_format in formats.items():
+            if flatfile_format is None:
+                results[filename] = [
+                    ValidationError(0, None, 'flatFile not found')]
+                continue
+            job = _start(executor, os.path.join(directory, filename),
+                         flatfile_format, chunk_size)
+            if isinstance(job, _Job):
+                jobs[filename] = job
+            else:
+                results[filename] = job
+        futures = {filename: _submit(executor, job, max_errors)
+                   for filename, job in jobs.items()}
+        for filename, chunk_futures in futures.items():
+            results[filename] = _collect(chunk_futures, max_errors)
+    return {filename: results[filename] for filename
+            in itertools.chain(errors, formats)}
+
+
+class _Job(NamedTuple):
+    """Flat file being validated: the bounds of its chunks, the codec
+    and syntax it is checked with, and the futures of the numbers of the
+    quoting characters in the chunks, if they are counted.
+    """
+    path: str
+    bounds: list[int]
+    codec: str
+    syntax: tuple[bytes, bytes, bytes | None, frozenset[int]] | None
+    quote_counts: list[Future]
+
+
+def _validate(
+    executor: Executor,
+    path: str,
+    flatfile_format: FlatFileFormat,
+    chunk_size: int,
+    max_errors: int,
+) -> list[ValidationError]:
+    """Validates a flat file with the given executor. The quoting
+    characters of the chunks are counted first to know whether each
+    chunk starts within a quoted field, and then the chunks are checked.
+    """
+    job = _start(executor, path, flatfile_format, chunk_size)
+    if not isinstance(job, _Job):
+        return job
+    return _collect(_submit(executor, job, max_errors), max_errors)
+
+
+def _start(
+    executor: Executor,
+    path: str,
+    flatfile_format: FlatFileFormat,
+    chunk_size: int,
+) -> _Job | list[ValidationError]:
+    """Splits a flat file into chunks and submits the counting of the
+    quoting characters of the chunks. Returns the job, or the error if
+    the file can not be validated.
+    """
+    try:
+        size = os.path.getsize(path)
+    except OSError as exception:
+        return [ValidationError(0, None, str(exception))]
+    try:
+        codec = python_codec(flatfile_format.charset)
+        codecs.lookup(codec)
+    except LookupError:
+        return [ValidationError(
+            0, None, f'Unknown charset {flatfile_format.charset!r}')]
+
+    syntax = _syntax(flatfile_format, codec)
+    if syntax is None:
+        # Without the separators the chunks can not be aligned with the
+        # characters
+        bounds = [0, size]
+    else:
+        bounds = list(range(0, size, max(1, chunk_size))) + [size]
+    quote = syntax[2] if syntax else None
+
+    quote_counts = []
+    if quote and len(bounds) > 2:
+        quote_counts = [
+            executor.submit(_count_quotes, path, chunk_start, chunk_end,
+                            quote)
+            for chunk_start, chunk_end in zip(bounds[:-2], bounds[1:-1])]
+    return _Job(path, bounds, codec, syntax, quote_counts)
+
+
+def _submit(
+    executor: Executor, job: _Job, max_errors: int
+) -> list[Future]:
+    """Submits the validation of the chunks of a flat file once its
+    quoting characters have been counted.
+    """
+    in_quotes = [False] * (len(job.bounds) - 1)
+    counts = (future.result() for future in job.quote_counts)
+    for position, count in enumerate(itertools.accumulate(counts),
+                                     start=1):
+        in_quotes[position] = count % 2 == 1
+
+    return [
+        executor.submit(_validate_chunk, job.path, job.bounds[position],
+                        job.bounds[position + 1], in_quotes[position],
+                        in_quotes[position + 1]
+                        if position + 1 < len(in_quotes) else False,
+                        job.codec, job.syntax, max_errors)
+        for position in range(len(job.bounds) - 1)]
+
+
+def _collect(futures: list[Future], max_errors: int) -> list[ValidationError]:
+    """Combines the results of the chunks of a flat file, numbering the
+    records from the start of the file.
+    """
+    errors = []
+    records = 0
+    for future in futures:
+        chunk_records, chunk_errors = future.result()
+        errors.extend(
+            error if error.record is None
+            else error._replace(record=error.record + records)
+            for error in chunk_errors)
+        records += chunk_records
+    errors.sort(key=operator.itemgetter(0))
+    return errors[:max_errors]
+
+
+def _syntax(
+    flatfile_format: FlatFileFormat, codec: str
+) -> tuple[bytes, bytes, bytes | None, frozenset[int]] | None:
+    """Returns the record separator, field separator and quoting
+    character as bytes and the valid numbers of fields, or None if the
+    records can not be checked at byte level.
+    """
+    record_separator = RECORD_SEPARATORS.get(
+        flatfile_format.record_separator)
+    if record_separator is None or not flatfile_format.field_separator:
+        return None
+    try:
+        field_separator = flatfile_format.field_separator.encode('ascii')
+        quote = flatfile_format.quoting_char.encode('ascii') \
+            if flatfile_format.quoting_char else None
+        characters = record_separator + field_separator + (quote or b'')
+        # The separators can be found at byte level only if the charset
+        # encodes them like ASCII
+        ascii_compatible = characters.decode(codec) == \
+            characters.decode('ascii')
+    except UnicodeError:
+        return None
+    if not ascii_compatible or len(field_separator) != 1 or \
+            (quote is not None and len(quote) != 1):
+        return None
+
+    field_counts = frozenset(len(record.fields) for record
+                             in flatfile_format.records if record.fields)
+    return record_separator, field_separator, quote, field_counts
+
+
+def _count_quotes(path: str, start: int, end: int, quote: bytes) -> int:
+    """Counts the quoting characters in a part of the file. Run in a
+    worker process.
+    """
+    with open(path, 'rb') as infile, \
+            mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return data[start:end].count(quote)
+
+
+def _record_boundary(
+    data: mmap.mmap,
+    position: int,
+    in_quotes: bool,
+    record_separator: bytes,
+    quote: bytes | None,
+) -> int:
+    """Returns the offset after the first record separator at or after
+    the given position that is outside quoted fields, or the size of the
+    file if there is none. The chunks before and after the position
+    agree on the boundary, since both compute it the same way.
+    """
+    if position == 0:
+        return 0
+    while True:
+        found = data.find(record_separator, position)
+        if found == -1:
+            return len(data)
+        if quote is not None:
+            in_quotes ^= data[position:found].count(quote) % 2 == 1
+        if not in_quotes:
+            return found + len(record_separator)
+        position = found + len(record_separator)
+
+
+def _validate_chunk(
+    path: str,
+    start: int,
+    end: int,
+    in_quotes_start: bool,
+    in_quotes_end: bool,
+    codec: str,
+    syntax: tuple[bytes, bytes, bytes | None, frozenset[int]] | None,
+    max_errors: int,
+) -> tuple[int, list[ValidationError]]:
+    """Validates the records that start in the given part of the file.
+    Run in a worker process.
+
+    :returns: Tuple of the number of records in the chunk and the errors
+              found, with the records numbered within the chunk
+    """
+    with open(path, 'rb') as infile:
+        if os.fstat(infile.fileno()).st_size == 0:
+            return 0, []
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if syntax is None:
+                chunk_start, chunk_end = start, end
+            else:
+                chunk_start = _record_boundary(
+                    data, start, in_quotes_start, syntax[0], syntax[2])
+                chunk_end = _record_boundary(
+                    data, end, in_quotes_end, syntax[0], syntax[2]) \
+                    if end < len(data) else end
+            errors = _decode_errors(data, chunk_start, chunk_end, codec,
+                                    max_errors)
+            if syntax is None:
+                return 0, errors
+            chunk = data[chunk_start:chunk_end]
+
+    if not chunk:
+        return 0, errors
+
+    record_separator, field_separator, quote, field_counts = syntax
+    if quote is not None:
+        # Replace the quoted fields with filler of the same length, so
+        # that their separators are not counted and the offsets stay
+        # the same. The quotes that are left are not terminated.
+        escaped = re.escape(quote)
+        chunk = re.sub(
+            escaped + b'(?:[^' + escaped + b']|' + escaped * 2 + b')*' +
+            escaped, lambda match: b'_' * len(match.group()), chunk)
+
+    records = chunk.split(record_separator)
+    if not records[-1]:
+        del records[-1]
+    ends = list(itertools.accumulate(map(len, records)))
+
+    def record_offset(record):
+        if record == 0:
+            return chunk_start
+        return chunk_start + ends[record - 1] + \
+            record * len(record_separator)
+
+    if quote is not None:
+        position = chunk.find(quote)
+        while position != -1 and len(errors) < max_errors:
+            record = _record_at(ends, position, len(record_separator))
+            errors.append(ValidationError(
+                chunk_start + position, record + 1,
+                'Quoted field is not terminated'))
+            position = chunk.find(quote, position + 1)
+
+    if field_counts:
+        counts = map(operator.methodcaller('count', field_separator),
+                     records)
+        invalid = itertools.compress(
+            itertools.count(),
+            map(operator.not_, map(field_counts.__contains__,
+                                   map((1).__add__, counts))))
+        expected = ' or '.join(str(count) for count in sorted(field_counts))
+        for record in itertools.islice(invalid, max_errors):
+            fields = records[record].count(field_separator) + 1
+            errors.append(ValidationError(
+                record_offset(record), record + 1,
+                f'Record has {fields} fields, expected {expected}'))
+
+    errors.sort(key=operator.itemgetter(0))
+    return len(records), errors[:max_errors]
+
+
+def _record_at(ends: list[int], position: int, separator_len: int) -> int:
+    """Returns the index of the record that contains the position of the
+    chunk, given the end offsets of the records without the separators.
+    """
+    low, high = 0, len(ends)
+    while low < high:
+        middle = (low + high) // 2
+        if ends[middle] + middle * separator_len <= position:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def _decode_errors(
+    data: mmap.mmap, start: int, end: int, codec: str, max_errors: int
+) -> list[ValidationError]:
+    """Returns the errors of decoding a part of the file with the codec.
+    The part is decoded in blocks with an incremental decoder, so that
+    the decoded text is never kept in memory as a whole.
+    """
+    errors = []
+    position = start
+    decoder = codecs.getincrementaldecoder(codec)()
+    while position < end and len(errors) < max_errors:
+        block_end = min(position + _DECODE_SIZE, end)
+        # The bytes of an incomplete character kept by the decoder from
+        # the previous block precede the block
+        buffered = len(decoder.getstate()[0])
+        try:
+            decoder.decode(data[position:block_end], final=block_end == end)
+            position = block_end
+        except UnicodeDecodeError as exception:
+            errors.append(ValidationError(
+                position - buffered + exception.start, None,
+                f'Data is not valid in the charset: {exception.reason}'))
+            position += exception.end - buffered
+            decoder.reset()
+    return errors
@@ -0,0 +1,7 @@
+"""Benchmarks for the ADDML library.
+
+Run all scenarios with::
+
+    python -m benchmarks --output results.json
+
+"""
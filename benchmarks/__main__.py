@@ -0,0 +1,99 @@
+"""Command line interface for running the benchmarks.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import lxml.etree as ET
+
+import addml
+from benchmarks.generator import generate_addml, write_addml
+from benchmarks.scenarios import SCENARIOS, run_scenario
+
+SIZES = {
+    'small': {'flatfiles': 100, 'definitions': 10, 'recordtypes': 5,
+              'fielddefinitions': 10, 'flatfiletypes': 3},
+    'medium': {'flatfiles': 10000, 'definitions': 200, 'recordtypes': 20,
+               'fielddefinitions': 50, 'flatfiletypes': 10},
+    'large': {'flatfiles': 100000, 'definitions': 1000,
+              'recordtypes': 50, 'fielddefinitions': 100,
+              'flatfiletypes': 20},
+}
+
+
+def parse_arguments(arguments: list[str]) -> argparse.Namespace:
+    """Parse the command line arguments."""
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Run the ADDML library benchmarks and print the '
+                    'results as JSON.')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small',
+                        help='Size of the generated ADDML data')
+    for param in SIZES['small']:
+        parser.add_argument(f'--{param}', type=int,
+                            help=f'Override the number of {param}')
+    parser.add_argument('--scenario', action='append',
+                        choices=sorted(SCENARIOS),
+                        help='Scenario to run (default=all)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timed runs of each scenario')
+    parser.add_argument('--output', help='Write the results to a file')
+    parser.add_argument('--compare',
+                        help='Results file of an earlier run to compare '
+                             'the median timings with')
+    return parser.parse_args(arguments)
+
+
+def compare(results: dict, baseline: dict) -> dict[str, float]:
+    """Return the ratio of the median timings of the scenarios to the
+    median timings of the same scenarios in the baseline results.
+    """
+    ratios = {}
+    for name, result in results['results'].items():
+        if name in baseline['results']:
+            ratios[name] = result['median'] / \
+                baseline['results'][name]['median']
+    return ratios
+
+
+def main(arguments: list[str] | None = None) -> int:
+    """Run the benchmarks."""
+    args = parse_arguments(sys.argv[1:] if arguments is None else arguments)
+    params = dict(SIZES[args.size])
+    for param in params:
+        if getattr(args, param) is not None:
+            params[param] = getattr(args, param)
+
+    results = {
+        'addml': addml.__version__,
+        'python': platform.python_version(),
+        'lxml': '.'.join(str(part) for part in ET.LXML_VERSION),
+        'parameters': params,
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'addml.xml')
+        write_addml(generate_addml(**params), path)
+        for name in args.scenario or SCENARIOS:
+            results['results'][name] = run_scenario(
+                name, params, path, args.repeat)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as infile:
+            results['compare'] = compare(results, json.load(infile))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as outfile:
+            outfile.write(output + '\n')
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Deterministic generator of synthetic ADDML data for benchmarks.
+"""
+from __future__ import annotations
+
+import lxml.etree as ET
+
+from addml.base import addml
+from addml.flatfiles import (
+    DefinitionTemplate,
+    addml_basic_elem,
+    definition_elems,
+    delimfileformat,
+    wrapper_elems,
+)
+
+FIELDTYPES = [('String', 'string'), ('Integer', 'integer'),
+              ('Float', 'float'), ('Date', 'date'), ('Boolean', 'boolean')]
+CHARSETS = ['UTF-8', 'ISO-8859-15', 'ASCII']
+
+
+def generate_addml(
+    flatfiles: int = 100,
+    definitions: int = 10,
+    recordtypes: int = 5,
+    fielddefinitions: int = 10,
+    flatfiletypes: int = 3,
+    templates: bool = False,
+) -> ET._Element:
+    """Generates ADDML data with the given number of sections. The same
+    parameters always give identical data.
+
+    The flatFiles are divided evenly between the flatFileDefinitions,
+    which use the flatFileTypes and recordTypes in turn. Each
+    flatFileDefinition has one recordDefinition with the given number of
+    fieldDefinitions.
+
+    :param flatfiles: Number of flatFiles
+    :param definitions: Number of flatFileDefinitions
+    :param recordtypes: Number of recordTypes
+    :param fielddefinitions: Number of fieldDefinitions in each
+                             flatFileDefinition
+    :param flatfiletypes: Number of flatFileTypes
+    :param templates: Build the flatFiles, fieldDefinitions and
+                      flatFileTypes with
+                      :class:`addml.flatfiles.DefinitionTemplate`
+    :returns: ADDML root element
+    """
+    if templates:
+        flatfile = DefinitionTemplate('flatFile')
+        fielddefinition = DefinitionTemplate('fieldDefinition')
+    else:
+        def flatfile(name, reference):
+            return definition_elems('flatFile', name, reference=reference)
+
+        def fielddefinition(name, reference):
+            return definition_elems('fieldDefinition', name,
+                                    reference=reference)
+
+    flatfiles_list = [
+        flatfile(f'file{i}.csv', f'definition{i % definitions}')
+        for i in range(flatfiles)]
+
+    flatfiledefinitions = []
+    for i in range(definitions):
+        fields = [
+            fielddefinition(f'field{j}', FIELDTYPES[j % len(FIELDTYPES)][0])
+            for j in range(fielddefinitions)]
+        recorddefinition = definition_elems(
+            'recordDefinition', f'record{i}',
+            reference=f'recordtype{i % recordtypes}',
+            child_elements=[wrapper_elems('fieldDefinitions', fields)])
+        flatfiledefinitions.append(definition_elems(
+            'flatFileDefinition', f'definition{i}',
+            reference=f'flatfiletype{i % flatfiletypes}',
+            child_elements=[wrapper_elems('recordDefinitions',
+                                          [recorddefinition])]))
+    flatfiles_list.append(
+        wrapper_elems('flatFileDefinitions', flatfiledefinitions))
+
+    flatfiletypes_list = generate_flatfiletypes(flatfiletypes, templates)
+    recordtypes_list = [definition_elems('recordType', f'recordtype{i}')
+                        for i in range(recordtypes)]
+    fieldtypes_list = [
+        definition_elems('fieldType', name, child_elements=[
+            addml_basic_elem('dataType', datatype)])
+        for name, datatype in FIELDTYPES]
+    flatfiles_list.append(wrapper_elems('structureTypes', [
+        wrapper_elems('flatFileTypes', flatfiletypes_list),
+        wrapper_elems('recordTypes', recordtypes_list),
+        wrapper_elems('fieldTypes', fieldtypes_list)]))
+
+    return addml(child_elements=[wrapper_elems('flatFiles', flatfiles_list)])
+
+
+def generate_flatfiletypes(
+    count: int, templates: bool = False
+) -> list[ET._Element]:
+    """Generates flatFileTypes with a charset and a delimFileFormat.
+
+    :param count: Number of flatFileTypes
+    :param templates: Build the flatFileTypes with
+                      :class:`addml.flatfiles.DefinitionTemplate`
+    :returns: List of flatFileType elements
+    """
+    if templates:
+        template = DefinitionTemplate('flatFileType', child_elements=[
+            addml_basic_elem('charset', CHARSETS[0]),
+            delimfileformat('CR+LF', ';', quotingchar='"')])
+        return [template(f'flatfiletype{i}',
+                         charset=CHARSETS[i % len(CHARSETS)])
+                for i in range(count)]
+    return [
+        definition_elems('flatFileType', f'flatfiletype{i}', child_elements=[
+            addml_basic_elem('charset', CHARSETS[i % len(CHARSETS)]),
+            delimfileformat('CR+LF', ';', quotingchar='"')])
+        for i in range(count)]
+
+
+def write_addml(root: ET._Element, path: str) -> None:
+    """Writes the generated ADDML data to a file."""
+    ET.ElementTree(root).write(path, xml_declaration=True, encoding='UTF-8')
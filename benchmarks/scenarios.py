@@ -0,0 +1,133 @@
+"""Timed benchmark scenarios.
+
+Each scenario is a function that takes the benchmark parameters and the
+path of a generated ADDML data file, and returns a function to time.
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from statistics import mean, median
+
+import xml_helpers.utils as h
+
+from addml.base import sections_count
+from addml.integrity import check_integrity
+from addml.model import load_model
+from addml.split_addml import (
+    get_charset_with_filename,
+    parse_flatfiledefinitions,
+)
+from benchmarks.generator import generate_addml, generate_flatfiletypes
+
+SCENARIOS: dict[str, Callable[[dict[str, int], str], Callable[[], object]]] \
+    = {}
+
+
+def scenario(
+    func: Callable[[dict[str, int], str], Callable[[], object]]
+) -> Callable[[dict[str, int], str], Callable[[], object]]:
+    """Registers a benchmark scenario by its function name."""
+    SCENARIOS[func.__name__] = func
+    return func
+
+
+@scenario
+def construct(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Build the ADDML data with the element factories."""
+    return lambda: generate_addml(**params)
+
+
+@scenario
+def construct_template(
+    params: dict[str, int], path: str
+) -> Callable[[], object]:
+    """Build the ADDML data with definition templates."""
+    return lambda: generate_addml(**params, templates=True)
+
+
+@scenario
+def construct_flatfiletypes(
+    params: dict[str, int], path: str
+) -> Callable[[], object]:
+    """Build as many flatFileTypes as flatFiles with the element
+    factories.
+    """
+    return lambda: generate_flatfiletypes(params['flatfiles'])
+
+
+@scenario
+def construct_flatfiletypes_template(
+    params: dict[str, int], path: str
+) -> Callable[[], object]:
+    """Build as many flatFileTypes as flatFiles with a definition
+    template, which copies the charset and delimFileFormat instead of
+    building them.
+    """
+    return lambda: generate_flatfiletypes(params['flatfiles'],
+                                          templates=True)
+
+
+@scenario
+def split(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Split the ADDML data file into data for each flatFileDefinition."""
+    return lambda: sum(1 for _ in parse_flatfiledefinitions(path))
+
+
+@scenario
+def split_stream(
+    params: dict[str, int], path: str
+) -> Callable[[], object]:
+    """Split the ADDML data file in streaming mode."""
+    return lambda: sum(1 for _ in parse_flatfiledefinitions(path,
+                                                            stream=True))
+
+
+@scenario
+def charset(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Look up the charset of ten files, one call per file."""
+    step = max(1, params['flatfiles'] // 10)
+    filenames = [f'file{i}.csv' for i
+                 in range(0, params['flatfiles'], step)][:10]
+    return lambda: [get_charset_with_filename(path, filename)
+                    for filename in filenames]
+
+
+@scenario
+def count(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Count the sections of each type in the parsed ADDML data."""
+    root = h.readfile(path).getroot()
+    sections = ['flatFile', 'flatFileDefinition', 'recordDefinition',
+                'fieldDefinition', 'flatFileType', 'recordType',
+                'fieldType']
+    return lambda: [sections_count(root, section) for section in sections]
+
+
+@scenario
+def integrity(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Check the references of the ADDML data file."""
+    return lambda: check_integrity(path)
+
+
+@scenario
+def model(params: dict[str, int], path: str) -> Callable[[], object]:
+    """Load the ADDML data file into the compact model."""
+    return lambda: load_model(path)
+
+
+def run_scenario(
+    name: str, params: dict[str, int], path: str, repeat: int
+) -> dict[str, float | int]:
+    """Times the scenario and returns the statistics of the timings in
+    seconds.
+    """
+    func = SCENARIOS[name](params, path)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {'repeat': repeat,
+            'min': min(timings),
+            'median': median(timings),
+            'mean': mean(timings)}
@@ -8,7 +8,8 @@ def main():
     """Install premis"""
     setup(
         name='addml',
-        packages=find_packages(exclude=['tests', 'tests.*']),
+        packages=find_packages(exclude=['tests', 'tests.*',
+                                        'benchmarks', 'benchmarks.*']),
         include_package_data=True,
         version=get_version(),
         install_requires=[
@@ -0,0 +1,99 @@
+"""Test for the persistent index of the flat files of ADDML data."""
+
+import os
+import shutil
+
+import lxml.etree as ET
+import pytest
+
+import addml.archive as ar
+import addml.base as a
+
+
+@pytest.fixture
+def addml_paths(tmp_path):
+    """Copies of the complex ADDML test data in two packages."""
+    paths = []
+    for package in ['package1', 'package2']:
+        (tmp_path / package).mkdir()
+        path = str(tmp_path / package / 'addml.xml')
+        shutil.copy('tests/data/addml_complex.xml', path)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Archive index in a temporary database file."""
+    with ar.ArchiveIndex(str(tmp_path / 'index.sqlite')) as index:
+        yield index
+
+
+def test_update_and_lookup(index, addml_paths):
+    """Tests that the flat files are indexed and looked up."""
+    result = index.update(addml_paths, batch_size=1)
+    assert result.added == addml_paths
+    assert not result.updated and not result.unchanged and not result.errors
+
+    assert index.lookup(addml_paths[0], 'csvfile6.csv') == ar.FlatFileEntry(
+        addml_paths[0], 'csvfile6.csv', 'testdef2', 'testtype2',
+        'ISO-8859-15', 'CR+LF', ';', '"', None)
+    assert index.get_charset_with_filename(
+        addml_paths[1], 'csvfile1.csv') == 'charset=UTF-8'
+    assert index.lookup(addml_paths[0], 'missing.csv') is None
+    assert index.get_charset_with_filename('missing.xml', 'x.csv') is None
+    assert [entry.addml_path for entry in index.find('csvfile3.csv')] == \
+        addml_paths
+    assert len(list(index.iter_entries())) == 12
+    assert len(list(index.iter_entries(addml_paths[1]))) == 6
+    assert index.addml_paths() == addml_paths
+
+
+def test_update_incremental(index, addml_paths):
+    """Tests that only the changed ADDML data files are parsed again."""
+    index.update(addml_paths)
+    result = index.update(addml_paths)
+    assert result.unchanged == addml_paths
+
+    # Same contents with a new modification time
+    os.utime(addml_paths[0], ns=(0, 0))
+    root = ET.parse(addml_paths[1]).getroot()
+    a.find_section_by_name(root, 'flatFile', 'csvfile2.csv').set(
+        'definitionReference', 'missing')
+    ET.ElementTree(root).write(addml_paths[1])
+    os.utime(addml_paths[1], ns=(1, 1))
+
+    result = index.update(addml_paths)
+    assert result.unchanged == [addml_paths[0]]
+    assert result.updated == [addml_paths[1]]
+    entry = index.lookup(addml_paths[1], 'csvfile2.csv')
+    assert entry.error == "flatFileDefinition 'missing' not found"
+    assert entry.charset is None
+    assert index.update(addml_paths).unchanged == addml_paths
+
+
+def test_update_errors(index, addml_paths, tmp_path):
+    """Tests that unreadable ADDML data files are reported and the
+    removed files are dropped from the index.
+    """
+    invalid = tmp_path / 'invalid.xml'
+    invalid.write_text('<addml')
+    result = index.update(addml_paths +
+                          [str(invalid), str(tmp_path / 'missing.xml')])
+    assert set(result.errors) == {str(invalid), str(tmp_path / 'missing.xml')}
+    assert result.added == addml_paths
+
+    index.remove([addml_paths[0]])
+    assert index.addml_paths() == [addml_paths[1]]
+    assert index.lookup(addml_paths[0], 'csvfile1.csv') is None
+
+
+def test_persistence(tmp_path, addml_paths):
+    """Tests that the index is kept in the database file."""
+    database = str(tmp_path / 'index.sqlite')
+    with ar.ArchiveIndex(database) as index:
+        index.update(addml_paths)
+    with ar.ArchiveIndex(database) as index:
+        assert index.update(addml_paths).unchanged == addml_paths
+        assert index.lookup(addml_paths[0], 'csvfile3.csv').field_separator \
+            == ','
@@ -3,6 +3,7 @@
 import addml.base as a
 import addml.flatfiles as f
 import lxml.etree as ET
+import pytest
 import xml_helpers.utils as h
 
 
@@ -145,3 +146,123 @@ def test_find_section_by_name_fail():
 
     ffile = a.find_section_by_name(xml, 'flatFile', 'filer4')
     assert ffile is None
+
+
+def test_addml_index():
+    """Test AddmlIndex by asserting that sections are found by their
+    name and reference attributes and iterated in document order.
+    """
+    file1 = f.definition_elems('flatFile', 'file1', reference='def1')
+    file2 = f.definition_elems('flatFile', 'file2', reference='def2')
+    file3 = f.definition_elems('flatFile', 'file3', reference='def1')
+    def1 = f.definition_elems('flatFileDefinition', 'def1', reference='type1')
+    xml = a.addml(child_elements=[file1, file2, file3, def1])
+    index = a.AddmlIndex(xml)
+
+    assert index.find('flatFile', 'file2') is file2
+    assert index.find('flatFileDefinition', 'def1') is def1
+    assert index.find('flatFileDefinition', 'file1') is None
+    assert index.referring('flatFile', 'def1') == [file1, file3]
+    assert index.referring('flatFileDefinition', 'type1') == [def1]
+    assert index.referring('flatFile', 'def3') == []
+    assert index.count('flatFile') == 3
+    assert index.count('addml') == 0
+    assert [a.parse_name(ffile) for ffile in index.iter_sections(
+        'flatFile')] == ['file1', 'file2', 'file3']
+
+
+def test_addml_index_lookups():
+    """Test that iter_sections and find_section_by_name give the same
+    results for an AddmlIndex as for the indexed element.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    index = a.AddmlIndex(root)
+
+    for section in ['flatFile', 'flatFileDefinition', 'fieldDefinition',
+                    'flatFileType', 'recordType', 'fieldTypes']:
+        assert list(a.iter_sections(index, section)) == \
+            list(a.iter_sections(root, section))
+        for elem in a.iter_sections(root, section):
+            assert a.find_section_by_name(
+                index, section, a.parse_name(elem)) is \
+                a.find_section_by_name(root, section, a.parse_name(elem))
+
+
+def test_iterparse_sections():
+    """Test iterparse_sections by asserting that the sections are
+    iterated in document order with their contents and tail text, and
+    that the processed sections are cleared from the parsed tree.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    expected = [(ET.tostring(elem), elem.tail) for elem
+                in a.iter_sections(root, 'flatFileType')]
+    sections = []
+    for section in a.iterparse_sections('tests/data/addml_complex.xml',
+                                        ['flatFileType']):
+        previous = section.getprevious()
+        assert previous is None or len(previous) == 0
+        sections.append((ET.tostring(section), section.tail))
+    assert sections == expected
+
+
+def test_sections_count_tree():
+    """Test that sections_count counts the same sections from an
+    element, an element tree and an AddmlIndex.
+    """
+    tree = h.readfile('tests/data/addml_complex.xml')
+    index = a.AddmlIndex(tree)
+    for section in ['addml', 'flatFile', 'fieldDefinition', 'fieldType',
+                    'flatFyle']:
+        count = len(tree.findall('.//' + a.addml_ns(section)))
+        assert a.sections_count(tree, section) == count
+        assert a.sections_count(tree.getroot(), section) == count
+        assert a.sections_count(index, section) == count
+
+
+def test_census():
+    """Test census by asserting that it gives the same counts as
+    sections_count for every section tag.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    counts = a.census(root)
+    assert list(counts)[:4] == \
+        ['dataset', 'description', 'reference', 'flatFiles']
+    assert counts['flatFile'] == 6
+    assert counts['fieldDefinition'] == 8
+    assert 'addml' not in counts
+    for tag, count in counts.items():
+        assert a.sections_count(root, tag) == count
+    assert a.census(a.AddmlIndex(root)) == counts
+    assert a.census(h.readfile('tests/data/addml_complex.xml')) == counts
+
+
+def test_addml_ns_prefix():
+    """Test that addml_ns returns the same tags for repeated calls with
+    and without a prefix.
+    """
+    assert a.addml_ns('type', 'flatFile') == \
+        '{http://www.arkivverket.no/standarder/addml}flatFileType'
+    assert a.addml_ns('type', 'flatFile') is a.addml_ns('type', 'flatFile')
+
+
+def test_addml_xpath():
+    """Test that the registered XPath queries can be evaluated and that
+    new queries can be registered with an expression or a compiled
+    ETXPath object.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    assert a.addml_xpath('charset')(root) == \
+        ['UTF-8', 'ISO-8859-15', 'ASCII']
+    assert a.addml_xpath('quotingChar')(root) == ['"', '"']
+
+    query = a.register_xpath('test_names', './/addml:flatFile/@name')
+    assert a.addml_xpath('test_names') is query
+    assert query(root)[:2] == ['csvfile1.csv', 'csvfile2.csv']
+
+    query = a.register_xpath('test_types', ET.ETXPath(
+        'descendant::' + a.addml_ns('fieldType')))
+    assert [a.parse_name(elem) for elem in a.addml_xpath('test_types')(
+        root)] == ['String', 'Integer']
+
+    with pytest.raises(KeyError):
+        a.addml_xpath('test_missing')
@@ -0,0 +1,69 @@
+"""Test for the benchmark suite."""
+
+import json
+
+import lxml.etree as ET
+
+import addml.base as a
+import addml.split_addml as s
+from benchmarks.__main__ import main
+from benchmarks.generator import (
+    generate_addml,
+    generate_flatfiletypes,
+    write_addml,
+)
+
+
+def test_generate_addml(tmp_path):
+    """Tests that the generated ADDML data has the requested number of
+    sections, is deterministic and can be split.
+    """
+    root = generate_addml(flatfiles=20, definitions=4, recordtypes=2,
+                          fielddefinitions=3, flatfiletypes=2)
+    assert a.sections_count(root, 'flatFile') == 20
+    assert a.sections_count(root, 'flatFileDefinition') == 4
+    assert a.sections_count(root, 'recordType') == 2
+    assert a.sections_count(root, 'fieldDefinition') == 12
+    assert a.sections_count(root, 'flatFileType') == 2
+    assert ET.tostring(root) == ET.tostring(generate_addml(
+        flatfiles=20, definitions=4, recordtypes=2, fielddefinitions=3,
+        flatfiletypes=2))
+    assert ET.tostring(root) == ET.tostring(generate_addml(
+        flatfiles=20, definitions=4, recordtypes=2, fielddefinitions=3,
+        flatfiletypes=2, templates=True))
+
+    path = str(tmp_path / 'addml.xml')
+    write_addml(root, path)
+    assert len(list(s.parse_flatfiledefinitions(path))) == 4
+    assert s.get_charset_with_filename(path, 'file5.csv') == \
+        'charset=ISO-8859-15'
+
+
+def test_generate_flatfiletypes():
+    """Tests that the flatFileTypes built with a template are the same
+    as the ones built with the element factories.
+    """
+    flatfiletypes = generate_flatfiletypes(5)
+    assert [a.parse_name(flatfiletype) for flatfiletype in flatfiletypes] \
+        == [f'flatfiletype{i}' for i in range(5)]
+    assert [ET.tostring(flatfiletype) for flatfiletype in flatfiletypes] == \
+        [ET.tostring(flatfiletype) for flatfiletype
+         in generate_flatfiletypes(5, templates=True)]
+
+
+def test_benchmark_main(tmp_path, capsys):
+    """Tests that the benchmarks write their results as JSON."""
+    output = str(tmp_path / 'results.json')
+    assert main(['--flatfiles', '10', '--repeat', '1', '--scenario',
+                 'split', '--scenario', 'count', '--output', output]) == 0
+    with open(output, encoding='utf-8') as infile:
+        results = json.load(infile)
+    assert json.loads(capsys.readouterr().out) == results
+    assert sorted(results['results']) == ['count', 'split']
+    assert results['parameters']['flatfiles'] == 10
+    assert results['results']['split']['repeat'] == 1
+
+    assert main(['--flatfiles', '10', '--repeat', '1', '--scenario',
+                 'split', '--compare', output]) == 0
+    assert list(json.loads(capsys.readouterr().out)['compare']) == \
+        ['split']
@@ -0,0 +1,114 @@
+"""Test for the streaming ADDML writer."""
+
+import io
+import uuid
+
+import lxml.etree as ET
+import pytest
+
+import addml.base as a
+import addml.builder as b
+import addml.flatfiles as f
+
+
+def _write_tree(root):
+    """Serialize ADDML data like AddmlWriter writes it."""
+    output = io.BytesIO()
+    ET.ElementTree(root).write(output, xml_declaration=True,
+                               encoding='UTF-8')
+    return output.getvalue()
+
+
+def test_addml_writer():
+    """Tests that AddmlWriter writes the same data as serializing the
+    ADDML data built with the element factories.
+    """
+    fields = [f.definition_elems('fieldDefinition', f'field{i}',
+                                 reference='String') for i in range(3)]
+    record = f.definition_elems(
+        'recordDefinition', 'record1', reference='rectype1',
+        child_elements=[f.wrapper_elems('fieldDefinitions', fields)])
+    definition = f.definition_elems(
+        'flatFileDefinition', 'def1', reference='type1',
+        child_elements=[f.wrapper_elems('recordDefinitions', [record])])
+    flatfiletype = f.definition_elems('flatFileType', 'type1', child_elements=[
+        f.addml_basic_elem('charset', 'UTF-8'),
+        f.delimfileformat('CR+LF', ';')])
+    root = a.addml(child_elements=[f.wrapper_elems('flatFiles', [
+        f.definition_elems('flatFile', 'file1.csv', reference='def1'),
+        f.definition_elems('flatFile', 'file2.csv', reference='def1'),
+        f.wrapper_elems('flatFileDefinitions', [definition]),
+        f.wrapper_elems('structureTypes', [
+            f.wrapper_elems('flatFileTypes', [flatfiletype])])])])
+
+    output = io.BytesIO()
+    with b.AddmlWriter(output) as writer:
+        with writer.wrapper('flatFiles'):
+            writer.definition('flatFile', 'file1.csv', 'def1')
+            writer.definition('flatFile', 'file2.csv', 'def1')
+            with writer.wrapper('flatFileDefinitions'), \
+                    writer.open_definition('flatFileDefinition', 'def1',
+                                           'type1'), \
+                    writer.wrapper('recordDefinitions'), \
+                    writer.open_definition('recordDefinition', 'record1',
+                                           'rectype1'), \
+                    writer.wrapper('fieldDefinitions'):
+                for i in range(3):
+                    writer.definition('fieldDefinition', f'field{i}',
+                                      'String')
+            with writer.wrapper('structureTypes'), \
+                    writer.wrapper('flatFileTypes'), \
+                    writer.open_definition('flatFileType', 'type1'):
+                writer.basic('charset', 'UTF-8')
+                writer.write(f.delimfileformat('CR+LF', ';'))
+
+    assert output.getvalue() == _write_tree(root)
+
+
+def test_addml_writer_references(tmp_path):
+    """Tests that the missing references are generated with the
+    reference factory and that the data is written to the given path.
+    """
+    path = str(tmp_path / 'addml.xml')
+    with b.AddmlWriter(path, b.counter_references('id')) as writer:
+        with writer.wrapper('flatFiles'):
+            writer.definition('flatFile', 'file1.csv')
+            with writer.open_definition('flatFile', 'file2.csv'):
+                pass
+            writer.definition('flatFile', 'file3.csv', 'def1')
+            writer.definition('flatFileType', 'type1', 'def1')
+
+    root = ET.parse(path).getroot()
+    assert [(a.parse_name(elem), a.parse_reference(elem)) for elem
+            in a.iter_sections(root, 'flatFile')] == [
+        ('file1.csv', 'id1'), ('file2.csv', 'id2'), ('file3.csv', 'def1')]
+    assert a.parse_reference(
+        a.find_section_by_name(root, 'flatFileType', 'type1')) is None
+
+
+def test_reference_factories():
+    """Tests the counter and UUID5 reference factories."""
+    counter = b.counter_references()
+    assert [counter('flatFile', 'file1'), counter('flatFile', 'file1')] == \
+        ['ref1', 'ref2']
+
+    namespace = uuid.UUID('12345678-1234-5678-1234-567812345678')
+    references = b.uuid5_references(namespace)
+    assert references('flatFile', 'file1') == \
+        references('flatFile', 'file1') == \
+        str(uuid.uuid5(namespace, 'flatFile/file1'))
+    assert references('flatFile', 'file2') != \
+        references('flatFile', 'file1')
+
+
+@pytest.mark.parametrize('method', [
+    lambda writer: writer.definition('flatFyle', 'file1'),
+    lambda writer: writer.open_definition('flatFyle', 'file1').__enter__(),
+    lambda writer: writer.wrapper('flatFyles').__enter__(),
+    lambda writer: writer.basic('test', 'test'),
+])
+def test_addml_writer_invalid_tags(method):
+    """Tests that unsupported tags are refused."""
+    with b.AddmlWriter(io.BytesIO()) as writer:
+        with pytest.raises(ValueError):
+            method(writer)
@@ -0,0 +1,129 @@
+"""Test for the ADDML data file cache."""
+
+import os
+import shutil
+import threading
+
+import pytest
+
+import addml.cache as c
+import addml.split_addml as s
+
+
+@pytest.fixture(autouse=True)
+def reset_cache():
+    """Disable the cache after each test."""
+    yield
+    c.disable_cache()
+
+
+@pytest.fixture
+def addml_path(tmp_path):
+    """Copy of the complex ADDML test data that can be modified."""
+    path = str(tmp_path / 'addml.xml')
+    shutil.copy('tests/data/addml_complex.xml', path)
+    return path
+
+
+def test_cache_disabled(addml_path):
+    """Tests that files are not cached unless the cache is enabled."""
+    assert not c.cache_enabled()
+    assert c.read_index(addml_path) is not c.read_index(addml_path)
+    assert c.cache_info() == (0, 0, 0, 0)
+
+
+def test_cache_hits(addml_path):
+    """Tests that the path based helpers share the cached file and that
+    the hits and misses are counted.
+    """
+    c.enable_cache(maxsize=4)
+    assert s.get_charset_with_filename(addml_path, 'csvfile1.csv') == \
+        'charset=UTF-8'
+    assert s.get_charset_with_filename(addml_path, 'csvfile3.csv') == \
+        'charset=ASCII'
+    assert list(s.parse_flatfilenames(addml_path, 'testdef2')) == \
+        ['csvfile2.csv', 'csvfile6.csv']
+    assert len(list(s.parse_flatfiledefinitions(addml_path))) == 3
+    assert c.cache_info() == (3, 1, 4, 1)
+
+    c.clear_cache()
+    assert c.cache_info() == (0, 0, 4, 0)
+
+
+def test_cache_invalidation(addml_path):
+    """Tests that a cached file is parsed again when it changes."""
+    c.enable_cache()
+    index = c.read_index(addml_path)
+    assert c.read_index(addml_path) is index
+
+    with open(addml_path, 'rb') as infile:
+        data = infile.read()
+    with open(addml_path, 'wb') as outfile:
+        outfile.write(data.replace(b'>UTF-8<', b'>UTF-16<'))
+    assert s.get_charset_with_filename(addml_path, 'csvfile1.csv') == \
+        'charset=UTF-16'
+
+    stat = os.stat(addml_path)
+    index = c.read_index(addml_path)
+    os.utime(addml_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert c.read_index(addml_path) is not index
+    assert c.cache_info().misses == 3
+
+
+def test_cache_eviction(tmp_path):
+    """Tests that the least recently used file is evicted when the
+    cache is full.
+    """
+    paths = []
+    for name in ['simple', 'medium', 'complex']:
+        path = str(tmp_path / f'{name}.xml')
+        shutil.copy(f'tests/data/addml_{name}.xml', path)
+        paths.append(path)
+
+    c.enable_cache(maxsize=2)
+    first = c.read_index(paths[0])
+    c.read_index(paths[1])
+    assert c.read_index(paths[0]) is first
+    c.read_index(paths[2])
+    assert c.cache_info().currsize == 2
+    assert c.read_index(paths[0]) is first
+    c.read_index(paths[1])
+    assert c.cache_info() == (2, 4, 2, 2)
+
+
+def test_cache_size():
+    """Tests that the cache size must be positive."""
+    with pytest.raises(ValueError):
+        c.enable_cache(maxsize=0)
+
+
+def test_cache_threads(addml_path):
+    """Tests that the cache can be used from several threads."""
+    c.enable_cache()
+    results = []
+
+    def worker():
+        for _ in range(20):
+            results.append(
+                s.get_charset_with_filename(addml_path, 'csvfile2.csv'))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['charset=ISO-8859-15'] * 160
+    info = c.cache_info()
+    assert info.hits + info.misses == 160
+    assert info.currsize == 1
+
+
+def test_parse_flatfiledefinitions_cached_copy():
+    """Tests that parse_flatfiledefinitions does not return the cached
+    tree when the file has only one flatFileDefinition.
+    """
+    c.enable_cache()
+    addml = 'tests/data/addml_simple.xml'
+    index = c.read_index(addml)
+    assert list(s.parse_flatfiledefinitions(addml))[0] is not index.root
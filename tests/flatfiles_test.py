@@ -1,5 +1,7 @@
 """Test for the ADDML flatFiles class."""
 
+import pytest
+
 import addml.base as a
 import addml.flatfiles as f
 import lxml.etree as ET
@@ -109,6 +111,32 @@ def test_delimfileformat():
     assert h.compare_trees(ET.fromstring(xml), charset) is True
 
 
+def test_fixedfileformat():
+    """Tests the fixedfileformat function with and without a record
+    separator.
+    """
+    xml = """<addml:fixedFileFormat
+    xmlns:addml="http://www.arkivverket.no/standarder/addml"
+    ><addml:recordSeparator>LF</addml:recordSeparator
+    ></addml:fixedFileFormat>"""
+    assert h.compare_trees(ET.fromstring(xml),
+                           f.fixedfileformat('LF')) is True
+    assert len(f.fixedfileformat()) == 0
+
+
+def test_fixedwidth_fielddefinition():
+    """Tests that the fieldDefinition of a fixed-width flat file has the
+    start position and the length of the field.
+    """
+    xml = """<addml:fieldDefinition
+    xmlns:addml="http://www.arkivverket.no/standarder/addml"
+    name="field1" typeReference="String"
+    ><addml:startPos>3</addml:startPos
+    ><addml:fixedLength>10</addml:fixedLength></addml:fieldDefinition>"""
+    fielddefinition = f.fixedwidth_fielddefinition('field1', 'String', 3, 10)
+    assert h.compare_trees(ET.fromstring(xml), fielddefinition) is True
+
+
 def test_iter_flatfiles():
     """Test iter_flatfiles by asserting that only the
     relevant sections are iterated through from the testdata.
@@ -178,3 +206,53 @@ def test_parse_charset():
     xml = a.addml(child_elements=[fftype])
 
     assert f.parse_charset(xml) == 'UTF-8'
+
+
+def test_definition_template():
+    """Tests that the DefinitionTemplate creates the same elements as
+    definition_elems, with the child element texts patched in.
+    """
+    template = f.DefinitionTemplate('flatFileType', child_elements=[
+        f.addml_basic_elem('charset', 'UTF-8'),
+        f.delimfileformat('CR+LF', ';')])
+    fftype1 = template('type1', charset='ISO-8859-15',
+                       fieldSeparatingChar=',')
+    fftype2 = template('type2', reference='ignored')
+    assert ET.tostring(fftype1) == ET.tostring(f.definition_elems(
+        'flatFileType', 'type1', child_elements=[
+            f.addml_basic_elem('charset', 'ISO-8859-15'),
+            f.delimfileformat('CR+LF', ',')]))
+    assert ET.tostring(fftype2) == ET.tostring(f.definition_elems(
+        'flatFileType', 'type2', child_elements=[
+            f.addml_basic_elem('charset', 'UTF-8'),
+            f.delimfileformat('CR+LF', ';')]))
+
+    template = f.DefinitionTemplate('recordDefinition')
+    assert ET.tostring(template('record1')) == ET.tostring(
+        f.definition_elems('recordDefinition', 'record1'))
+    assert ET.tostring(template('record1', 'type1')) == ET.tostring(
+        f.definition_elems('recordDefinition', 'record1', 'type1'))
+
+
+def test_definition_template_references():
+    """Tests that the DefinitionTemplate generates the mandatory
+    references with the reference factory.
+    """
+    template = f.DefinitionTemplate(
+        'flatFile', reference_factory=lambda tag, name: f'{tag}-{name}')
+    assert template('file1').get('definitionReference') == 'flatFile-file1'
+    assert template('file1', 'def1').get('definitionReference') == 'def1'
+    assert f.DefinitionTemplate('fieldDefinition')('field1').get(
+        'typeReference')
+
+
+def test_definition_template_fail():
+    """Tests that the DefinitionTemplate refuses unsupported tags and
+    texts of child elements that the prototype does not have.
+    """
+    with pytest.raises(ValueError):
+        f.DefinitionTemplate('flatFyle')
+    template = f.DefinitionTemplate('fieldType', child_elements=[
+        f.addml_basic_elem('dataType', 'string')])
+    with pytest.raises(ValueError):
+        template('String', charset='UTF-8')
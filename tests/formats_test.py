@@ -0,0 +1,78 @@
+"""Test for resolving the formats of flat files from ADDML data."""
+
+import lxml.etree as ET
+import pytest
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.formats as fm
+
+
+def test_resolve_flatfile_format():
+    """Tests that the format of a flat file is resolved from the chain
+    of sections it refers to.
+    """
+    assert fm.resolve_flatfile_format('tests/data/addml_complex.xml',
+                                      'csvfile6.csv') == fm.FlatFileFormat(
+        name='csvfile6.csv', definition='testdef2',
+        flatfiletype='testtype2', charset='ISO-8859-15',
+        record_separator='CR+LF', field_separator=';', quoting_char='"',
+        records=(fm.RecordFormat('testrecord2', (
+            fm.FieldFormat('test1', 'string'),
+            fm.FieldFormat('test2', 'integer'))),))
+    assert fm.resolve_flatfile_format('tests/data/addml_complex.xml',
+                                      'missing.csv') is None
+
+
+def test_resolve_flatfile_formats():
+    """Tests that the formats of all flat files are resolved and the
+    broken references are reported.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    a.find_section_by_name(root, 'flatFile', 'csvfile2.csv').set(
+        'definitionReference', 'missing')
+    a.find_section_by_name(root, 'fieldDefinition', 'test3').set(
+        'typeReference', 'Missing')
+
+    formats, errors = fm.resolve_flatfile_formats(a.AddmlIndex(root))
+    assert list(formats) == ['csvfile1.csv', 'csvfile3.csv', 'csvfile4.csv',
+                             'csvfile5.csv', 'csvfile6.csv']
+    assert formats['csvfile1.csv'].records[0].fields[2] == \
+        fm.FieldFormat('test3', None)
+    assert formats['csvfile3.csv'].quoting_char == '"'
+    assert formats['csvfile1.csv'].quoting_char is None
+    assert errors == {
+        'csvfile2.csv': "flatFileDefinition 'missing' not found"}
+
+    a.find_section_by_name(root, 'flatFileType', 'testtype1').remove(
+        root.find('.//' + a.addml_ns('charset')))
+    with pytest.raises(ValueError):
+        fm.resolve_flatfile_format(a.AddmlIndex(root), 'csvfile1.csv')
+
+
+def test_resolve_fixed_width():
+    """Tests that the start positions and lengths of the fields of
+    fixed-width flat files are resolved.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    flatfiletype = a.find_section_by_name(root, 'flatFileType', 'testtype2')
+    delimfileformat = flatfiletype.find(a.addml_ns('delimFileFormat'))
+    flatfiletype.replace(delimfileformat, f.fixedfileformat('CR+LF'))
+    for fielddefinition in a.find_section_by_name(
+            root, 'recordDefinition', 'testrecord2').iter(
+                a.addml_ns('fieldDefinition')):
+        fielddefinition.append(f.addml_basic_elem('fixedLength', '4'))
+    fielddefinition.append(f.addml_basic_elem('startPos', '5'))
+
+    flatfile_format = fm.resolve_flatfile_format(a.AddmlIndex(root),
+                                                 'csvfile6.csv')
+    assert flatfile_format.fixed_width
+    assert flatfile_format.field_separator is None
+    assert flatfile_format.records[0].fields == (
+        fm.FieldFormat('test1', 'string', None, 4),
+        fm.FieldFormat('test2', 'integer', 5, 4))
+
+    fielddefinition.find(a.addml_ns('startPos')).text = 'x'
+    formats, errors = fm.resolve_flatfile_formats(a.AddmlIndex(root))
+    assert errors['csvfile6.csv'] == \
+        "fieldDefinition 'test2' has an invalid startPos: 'x'"
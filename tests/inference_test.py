@@ -0,0 +1,121 @@
+"""Test for inferring the fieldDefinitions of delimited flat files."""
+
+import pytest
+import xml_helpers.utils as h
+
+import addml.flatfiles as f
+import addml.inference as i
+from addml.sniffer import SniffResult
+
+DATA = (
+    'id;price;date;flag;name\r\n'
+    '1;1.5;2020-01-01;true;"a;b"\r\n'
+    '-2;3;2020-01-02;FALSE;\r\n'
+    '3;;2020-01-03;false;ä\r\n'
+    '4;2e3;2020-1-4;true;cde;extra\r\n'
+)
+
+
+@pytest.fixture
+def flatfile(tmp_path):
+    """Delimited flat file with a header record."""
+    path = tmp_path / 'file.csv'
+    path.write_bytes(DATA.encode('utf-8'))
+    return str(path)
+
+
+@pytest.mark.parametrize('block_records', [1, 2, 10000])
+def test_infer_fields(flatfile, block_records):
+    """Tests that the dataTypes, maximum lengths and empty values of the
+    fields are inferred regardless of the block size.
+    """
+    assert i.infer_fields(flatfile, header=True,
+                          block_records=block_records) == [
+        i.FieldInfo('id', 'integer', 2, 0),
+        i.FieldInfo('price', 'float', 3, 1),
+        i.FieldInfo('date', 'string', 10, 0),
+        i.FieldInfo('flag', 'boolean', 5, 0),
+        i.FieldInfo('name', 'string', 3, 1),
+        i.FieldInfo('field6', 'string', 5, 3)]
+
+
+def test_infer_fields_sample(flatfile):
+    """Tests that only the sampled records are read in sampling mode,
+    and that the fields are numbered without a header.
+    """
+    assert i.infer_fields(flatfile, sample=2, block_records=1) == [
+        i.FieldInfo('field1', 'string', 2, 0),
+        i.FieldInfo('field2', 'string', 5, 0),
+        i.FieldInfo('field3', 'string', 10, 0),
+        i.FieldInfo('field4', 'string', 4, 0),
+        i.FieldInfo('field5', 'string', 4, 0)]
+    assert i.infer_fields(flatfile, header=True, sample=2)[2] == \
+        i.FieldInfo('date', 'date', 10, 0)
+
+
+def test_infer_fields_format(tmp_path):
+    """Tests that the given format is used to read the file and that
+    empty fields get the string dataType.
+    """
+    path = tmp_path / 'file.csv'
+    path.write_bytes('é,\n1,\n'.encode('iso-8859-15'))
+    assert i.infer_fields(
+        str(path), SniffResult('ISO-8859-15', 'LF', ',', None)) == [
+        i.FieldInfo('field1', 'string', 1, 0),
+        i.FieldInfo('field2', 'string', 0, 2)]
+
+
+def test_infer_fields_non_numeric_last(tmp_path):
+    """Tests that a long numeric column ending in a non-numeric value is
+    rejected quickly as a number, without catastrophic backtracking.
+    """
+    path = tmp_path / 'file.csv'
+    path.write_text(''.join(f'{number}\n' for number in range(10000))
+                    + 'N/A\n')
+    assert i.infer_fields(
+        str(path), SniffResult('UTF-8', 'LF', ',', None)) == [
+        i.FieldInfo('field1', 'string', 4, 0)]
+    for value in ('1' * 30 + 'x', '12.34e', '.', '+'):
+        assert i.DATATYPES['float'].fullmatch(value) is None
+    for value in ('1', '1.', '.5', '-1.5e+3', '2E3'):
+        assert i.DATATYPES['float'].fullmatch(value)
+
+
+def test_transpose_records():
+    """Tests that records are transposed to columns and that missing
+    values of short records are empty.
+    """
+    assert i.transpose_records([['a', 'b'], ['c', 'd']]) == \
+        [['a', 'c'], ['b', 'd']]
+    assert [list(column) for column in i.transpose_records(
+        [['a'], ['b', 'c']])] == [['a', 'b'], ['', 'c']]
+
+
+def test_recorddefinition():
+    """Tests that the recordDefinition and fieldTypes are created for
+    the inferred fields.
+    """
+    fields = [i.FieldInfo('id', 'integer', 2, 0),
+              i.FieldInfo('name', 'string', 3, 1),
+              i.FieldInfo('count', 'integer', 4, 0)]
+
+    recorddefinition = i.recorddefinition('record1', fields, 'rectype1')
+    expected = f.definition_elems(
+        'recordDefinition', 'record1', 'rectype1', child_elements=[
+            f.wrapper_elems('fieldDefinitions', [
+                f.definition_elems(
+                    'fieldDefinition', field.name,
+                    reference=reference, child_elements=[
+                        f.addml_basic_elem('maxLength', length)])
+                for field, reference, length in zip(
+                    fields, ['Integer', 'String', 'Integer'],
+                    ['2', '3', '4'])])])
+    assert h.compare_trees(recorddefinition, expected) is True
+    assert len(i.fielddefinitions(fields, max_length=False)[0]) == 0
+
+    expected = f.wrapper_elems('fieldTypes', [
+        f.definition_elems('fieldType', name, child_elements=[
+            f.addml_basic_elem('dataType', datatype)])
+        for name, datatype in [('Integer', 'integer'),
+                               ('String', 'string')]])
+    assert h.compare_trees(i.fieldtypes(fields), expected) is True
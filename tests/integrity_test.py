@@ -0,0 +1,70 @@
+"""Test for checking the integrity of the references in ADDML data."""
+
+import io
+
+import lxml.etree as ET
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.integrity as i
+
+
+def test_check_integrity_valid():
+    """Tests that valid ADDML data has no issues, although the names of
+    the fieldDefinitions repeat in different recordDefinitions.
+    """
+    assert i.check_integrity('tests/data/addml_complex.xml') == []
+
+
+def test_check_integrity(tmp_path):
+    """Tests that the issues are reported with the source lines of the
+    sections.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    a.find_section_by_name(root, 'flatFile', 'csvfile2.csv').set(
+        'definitionReference', 'missing')
+    a.find_section_by_name(root, 'flatFile', 'csvfile6.csv').set(
+        'name', 'csvfile1.csv')
+    a.find_section_by_name(root, 'flatFile', 'csvfile3.csv').set(
+        'definitionReference', 'testdef1')
+    fielddefinition = a.find_section_by_name(root, 'fieldDefinition',
+                                             'test2')
+    fielddefinition.set('name', 'test1')
+    del fielddefinition.attrib['typeReference']
+    a.find_section_by_name(root, 'fieldType', 'Integer').addnext(
+        f.definition_elems('fieldType', 'Unused'))
+    path = str(tmp_path / 'addml.xml')
+    ET.ElementTree(root).write(path)
+
+    root = ET.parse(path).getroot()
+    lines = {}
+    for elem in root.iter(a.addml_ns('*')):
+        lines.setdefault((ET.QName(elem).localname, elem.get('name')),
+                         []).append(elem.sourceline)
+    issues = i.check_integrity(path)
+    assert [issue[:4] for issue in issues] == [
+        ('dangling_reference', 'flatFileDefinition', 'missing',
+         lines['flatFile', 'csvfile2.csv'][0]),
+        ('duplicate_name', 'flatFile', 'csvfile1.csv',
+         lines['flatFile', 'csvfile1.csv'][1]),
+        ('duplicate_name', 'fieldDefinition', 'test1',
+         lines['fieldDefinition', 'test1'][1]),
+        ('missing_reference', 'fieldDefinition', 'test1',
+         lines['fieldDefinition', 'test1'][1]),
+        ('unused_definition', 'flatFileDefinition', 'testdef3',
+         lines['flatFileDefinition', 'testdef3'][0]),
+        ('orphan_type', 'fieldType', 'Unused',
+         lines['fieldType', 'Unused'][0])]
+    assert issues[0].message == \
+        f"flatFile on line {issues[0].line} refers to missing " \
+        f"flatFileDefinition 'missing'"
+
+
+def test_check_integrity_one_line():
+    """Tests that duplicate names are found on the same line."""
+    data = ET.tostring(a.addml(child_elements=[f.wrapper_elems(
+        'flatFiles', [f.definition_elems('flatFile', 'file1', 'def1'),
+                      f.definition_elems('flatFile', 'file1', 'def1')])]))
+    issues = i.check_integrity(io.BytesIO(data))
+    assert [issue.kind for issue in issues] == [
+        'duplicate_name', 'dangling_reference', 'dangling_reference']
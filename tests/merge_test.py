@@ -0,0 +1,103 @@
+"""Test for merging ADDML data files."""
+
+import io
+
+import lxml.etree as ET
+
+import addml.base as a
+import addml.formats as fm
+import addml.integrity as i
+import addml.merge as mg
+
+
+def test_merge_addml(tmp_path):
+    """Tests that the merged ADDML data has the flat files of all input
+    files with the same formats and the types deduplicated.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    for flatfile in a.iter_sections(root, 'flatFile'):
+        flatfile.set('name', 'other_' + a.parse_name(flatfile))
+    # A different type with a clashing name
+    charset = root.find('.//' + a.addml_ns('charset'))
+    charset.text = 'UTF-16'
+    other = io.BytesIO(ET.tostring(root))
+
+    output = str(tmp_path / 'merged.xml')
+    result = mg.merge_addml(['tests/data/addml_complex.xml', other], output)
+    assert result == mg.MergeResult(flatfiles=12, flatfiledefinitions=6,
+                                    types=7, duplicates=9, renamed=4,
+                                    collisions=[])
+
+    formats, errors = fm.resolve_flatfile_formats(output)
+    assert not errors
+    expected, _ = fm.resolve_flatfile_formats('tests/data/addml_complex.xml')
+    for name, flatfile_format in expected.items():
+        merged = formats[name]
+        other_merged = formats['other_' + name]
+        assert merged.charset == flatfile_format.charset
+        assert merged.records[0].fields == flatfile_format.records[0].fields
+        assert other_merged.definition == flatfile_format.definition + '-2'
+        assert other_merged.field_separator == \
+            flatfile_format.field_separator
+    assert formats['other_csvfile1.csv'].charset == 'UTF-16'
+    assert formats['other_csvfile1.csv'].flatfiletype == 'testtype1-2'
+    assert formats['other_csvfile2.csv'].flatfiletype == 'testtype2'
+
+    # The identical recordTypes are merged into the first one
+    assert [issue.kind for issue in i.check_integrity(output)] == []
+    merged_root = ET.parse(output).getroot()
+    assert a.sections_count(merged_root, 'recordType') == 1
+    assert a.sections_count(merged_root, 'fieldTypes') == 1
+
+
+def test_merge_addml_flatfile_collisions(tmp_path):
+    """Tests that the flatFiles with the same name as a flatFile of an
+    earlier input file are left out and reported, together with the
+    flatFileDefinitions only they refer to.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    charset = root.find('.//' + a.addml_ns('charset'))
+    charset.text = 'UTF-16'
+    other = io.BytesIO(ET.tostring(root))
+
+    output = str(tmp_path / 'merged.xml')
+    result = mg.merge_addml(['tests/data/addml_complex.xml', other], output)
+    expected, _ = fm.resolve_flatfile_formats('tests/data/addml_complex.xml')
+    assert result.flatfiles == len(expected)
+    assert sorted(result.collisions) == sorted(expected)
+
+    formats, errors = fm.resolve_flatfile_formats(output)
+    assert not errors
+    assert formats['csvfile1.csv'].charset == \
+        expected['csvfile1.csv'].charset
+    assert result.flatfiledefinitions == 3
+    assert result.renamed == 0
+    assert i.check_integrity(output) == []
+
+    # The flatFileDefinition is kept for a flatFile that does not collide
+    a.find_section_by_name(root, 'flatFile', 'csvfile1.csv').set(
+        'name', 'other.csv')
+    other = io.BytesIO(ET.tostring(root))
+    result = mg.merge_addml(['tests/data/addml_complex.xml', other], output)
+    assert len(result.collisions) == len(expected) - 1
+    assert result.flatfiledefinitions == 4
+    formats, errors = fm.resolve_flatfile_formats(output)
+    assert formats['other.csv'].charset == 'UTF-16'
+    assert i.check_integrity(output) == []
+
+
+def test_type_digest():
+    """Tests that the digest of a type section does not depend on its
+    name or the whitespace in it.
+    """
+    first = ET.fromstring(
+        f'<addml:fieldType xmlns:addml="{a.ADDML_NS}" name="a">\n'
+        f'  <addml:dataType>string</addml:dataType>\n</addml:fieldType>')
+    second = ET.fromstring(
+        f'<x:fieldType xmlns:x="{a.ADDML_NS}" name="b"><x:dataType>'
+        f'string</x:dataType></x:fieldType>')
+    third = ET.fromstring(
+        f'<x:fieldType xmlns:x="{a.ADDML_NS}" name="a"><x:dataType>'
+        f'integer</x:dataType></x:fieldType>')
+    assert mg.type_digest(first) == mg.type_digest(second)
+    assert mg.type_digest(first) != mg.type_digest(third)
@@ -0,0 +1,88 @@
+"""Test for the compact read-only model of ADDML data."""
+
+import io
+
+import lxml.etree as ET
+import pytest
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.model as m
+
+
+@pytest.fixture
+def model():
+    """Model of the complex ADDML test data."""
+    return m.load_model('tests/data/addml_complex.xml')
+
+
+def test_load_model(model):
+    """Tests that the sections are loaded and their references are
+    resolved.
+    """
+    assert model.count('flatFile') == 6
+    assert model.count('flatFileDefinition') == 3
+    assert model.count('flatFileType') == 3
+
+    flatfile = model.find('flatFile', 'csvfile6.csv')
+    definition = flatfile.definition
+    assert definition is model.find('flatFileDefinition', 'testdef2')
+    assert definition.flatfiletype is model.find('flatFileType',
+                                                 'testtype2')
+    record = definition.records[0]
+    assert record.name == 'testrecord2'
+    assert record.recordtype is model.find('recordType', 'testrectype2')
+    assert [(field.name, field.fieldtype.datatype)
+            for field in record.fields] == [('test1', 'string'),
+                                            ('test2', 'integer')]
+
+    flatfiletype = model.flatfiletype('csvfile6.csv')
+    assert (flatfiletype.charset, flatfiletype.record_separator,
+            flatfiletype.field_separator, flatfiletype.quoting_char,
+            flatfiletype.fixed_width) == ('ISO-8859-15', 'CR+LF', ';', '"',
+                                          False)
+    assert model.flatfiletype('missing.csv') is None
+
+
+def test_parse_functions(model):
+    """Tests that the parse functions work with the sections like with
+    the elements.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    for tag in ['flatFile', 'flatFileDefinition', 'flatFileType']:
+        for section, elem in zip(model.iter_sections(tag),
+                                 a.iter_sections(root, tag), strict=True):
+            assert a.parse_name(section) == a.parse_name(elem)
+            assert a.parse_reference(section) == a.parse_reference(elem)
+    for section, elem in zip(model.iter_sections('flatFileType'),
+                             a.iter_sections(root, 'flatFileType')):
+        assert f.parse_charset(section) == f.parse_charset(elem)
+    with pytest.raises(IndexError):
+        f.parse_charset(model.find('flatFile', 'csvfile1.csv'))
+
+
+def test_compact_sections(model):
+    """Tests that the sections have no instance dicts and that the
+    references shared by many sections are stored once.
+    """
+    fields = [field for definition
+              in model.iter_sections('flatFileDefinition')
+              for record in definition.records for field in record.fields]
+    assert not any(hasattr(field, '__dict__') for field in fields)
+    references = {id(field.reference) for field in fields
+                  if field.reference == 'String'}
+    assert len(references) == 1
+
+
+def test_broken_references():
+    """Tests that broken references are resolved to None and that the
+    model can be loaded from a file-like object.
+    """
+    root = ET.parse('tests/data/addml_complex.xml').getroot()
+    a.find_section_by_name(root, 'flatFile', 'csvfile2.csv').set(
+        'definitionReference', 'missing')
+    model = m.load_model(io.BytesIO(ET.tostring(root)))
+    flatfile = model.find('flatFile', 'csvfile2.csv')
+    assert flatfile.reference == 'missing'
+    assert flatfile.definition is None
+    assert model.flatfiletype('csvfile2.csv') is None
@@ -0,0 +1,184 @@
+"""Test for reading the records of flat files described in ADDML."""
+
+import datetime
+
+import pytest
+import xml_helpers.utils as h
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.reader as r
+
+
+@pytest.fixture
+def root():
+    """ADDML data where csvfile1.csv has integer, float and boolean
+    fields.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    fieldtypes = a.find_section_by_name(root, 'fieldType', 'String')
+    for datatype in ['float', 'boolean', 'date']:
+        fieldtypes.addnext(f.definition_elems(
+            'fieldType', datatype.capitalize(), child_elements=[
+                f.addml_basic_elem('dataType', datatype)]))
+    fielddefinitions = a.find_section_by_name(
+        root, 'fieldDefinition', 'test1').getparent()
+    for fielddefinition, name in zip(fielddefinitions,
+                                     ['Integer', 'Float', 'Boolean']):
+        fielddefinition.set('typeReference', name)
+    return root
+
+
+def write_records(directory, data):
+    """Writes the records of csvfile1.csv."""
+    (directory / 'csvfile1.csv').write_bytes(data.encode('utf-8'))
+
+
+def test_records(root, tmp_path):
+    """Tests reading the records as strings and as typed values."""
+    write_records(tmp_path, '1;2.5;true\r\n-2;;FALSE\r\n')
+    reader = r.FlatFileReader(root, 'csvfile1.csv', str(tmp_path))
+    assert [field.datatype for field in reader.fields] == \
+        ['integer', 'float', 'boolean']
+    assert list(reader.records()) == [('1', '2.5', 'true'),
+                                      ('-2', '', 'FALSE')]
+    assert list(reader.records(typed=True, block_records=1)) == [
+        (1, 2.5, True), (-2, None, False)]
+
+
+def test_batches(root, tmp_path):
+    """Tests reading the records in batches of columns."""
+    write_records(tmp_path, ''.join(f'{i};{i / 2};true\r\n'
+                                    for i in range(5)))
+    reader = r.FlatFileReader(root, 'csvfile1.csv', str(tmp_path))
+    assert [batch[0] for batch in reader.batches(2, typed=True)] == \
+        [[0, 1], [2, 3], [4]]
+    assert list(reader.batches(10))[0][1] == \
+        ['0.0', '0.5', '1.0', '1.5', '2.0']
+
+
+def test_records_quoted(tmp_path):
+    """Tests that quoted fields and the charset of the flat file are
+    read.
+    """
+    (tmp_path / 'csvfile2.csv').write_bytes(
+        '"ä;\r\nb";1\r\n"c""";2\r\n'.encode('iso-8859-15'))
+    reader = r.FlatFileReader('tests/data/addml_complex.xml',
+                              'csvfile2.csv', str(tmp_path))
+    assert list(reader.records(typed=True)) == [('ä;\r\nb', 1),
+                                                ('c"', 2)]
+
+
+def test_dates(root, tmp_path):
+    """Tests converting dates and strings."""
+    fielddefinitions = a.find_section_by_name(
+        root, 'fieldDefinition', 'test1').getparent()
+    fielddefinitions[0].set('typeReference', 'Date')
+    fielddefinitions[1].set('typeReference', 'String')
+    write_records(tmp_path, '2020-01-31;;true\r\n')
+    reader = r.FlatFileReader(root, 'csvfile1.csv', str(tmp_path))
+    assert list(reader.records(typed=True)) == [
+        (datetime.date(2020, 1, 31), '', True)]
+
+
+@pytest.mark.parametrize(('data', 'message'), [
+    ('1;2;true\r\n1;2\r\n', 'Record 2 has 2 fields, expected 3'),
+    ('1;2;true\r\nx;2;true\r\n',
+     "Record 2 has an invalid integer value 'x' in field 'test1'"),
+    ('1;2;yes\r\n',
+     "Record 1 has an invalid boolean value 'yes' in field 'test3'"),
+])
+def test_records_invalid(root, tmp_path, data, message):
+    """Tests that invalid records are reported with the record number.
+    """
+    write_records(tmp_path, data)
+    reader = r.FlatFileReader(root, 'csvfile1.csv', str(tmp_path))
+    with pytest.raises(ValueError, match=message):
+        list(reader.records(typed=True))
+
+
+def test_reader_invalid():
+    """Tests that the flat file must be described in the ADDML data."""
+    with pytest.raises(ValueError):
+        r.FlatFileReader('tests/data/addml_complex.xml', 'missing.csv')
+
+
+@pytest.fixture
+def fixed_root(root):
+    """ADDML data where csvfile1.csv is a fixed-width flat file with
+    fields of 3, 4 and 5 bytes and a gap of one byte.
+    """
+    flatfiletype = a.find_section_by_name(root, 'flatFileType', 'testtype1')
+    delimfileformat = flatfiletype.find(a.addml_ns('delimFileFormat'))
+    delimfileformat.getparent().replace(delimfileformat,
+                                        f.fixedfileformat('LF'))
+    fielddefinitions = a.find_section_by_name(
+        root, 'fieldDefinition', 'test1').getparent()
+    for fielddefinition, startpos, fixedlength in zip(
+            fielddefinitions, [1, 4, 9], [3, 4, 5]):
+        fielddefinition.append(f.addml_basic_elem('startPos', str(startpos)))
+        fielddefinition.append(f.addml_basic_elem('fixedLength',
+                                                  str(fixedlength)))
+    return root
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+def test_records_fixed_width(fixed_root, tmp_path, monkeypatch, use_numpy):
+    """Tests reading the records of a fixed-width flat file with and
+    without NumPy. The padding of whitespace and trailing NULs is
+    stripped, and the last record may lack the record separator.
+    """
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(r, 'numpy', None)
+    write_records(tmp_path,
+                  '  1 2.5xtrue\x00\n-20     false\n300   1 TRUE ')
+    reader = r.FlatFileReader(fixed_root, 'csvfile1.csv', str(tmp_path))
+    assert reader.format.fixed_width
+    assert list(reader.records()) == [('1', '2.5', 'true'),
+                                      ('-20', '', 'false'),
+                                      ('300', '1', 'TRUE')]
+    assert list(reader.records(typed=True, block_records=2)) == [
+        (1, 2.5, True), (-20, None, False), (300, 1.0, True)]
+
+
+@pytest.mark.parametrize('codec', ['utf-8', 'utf-16-le', 'utf-16-be'])
+def test_decode_column(codec):
+    """Tests that the fixed-width values of a column are decoded in
+    multi-byte charsets too.
+    """
+    values = [value.encode(codec) for value in [' a', 'ä\x00', '\u4e00 ']]
+    assert r._decode_column(values, codec) == ['a', 'ä', '\u4e00']
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+@pytest.mark.parametrize(('data', 'message'), [
+    ('  1 2.5 true \n-20 false', 'File size 23 is not a multiple'),
+    ('  1 2.5 true \n-20     false\r', 'Record 2 is not followed'),
+    ('  x 2.5 true \n', "invalid integer value 'x' in field 'test1'"),
+])
+def test_records_fixed_width_invalid(
+        fixed_root, tmp_path, monkeypatch, use_numpy, data, message):
+    """Tests that the size and the record separators of fixed-width flat
+    files are checked.
+    """
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(r, 'numpy', None)
+    write_records(tmp_path, data)
+    reader = r.FlatFileReader(fixed_root, 'csvfile1.csv', str(tmp_path))
+    with pytest.raises(ValueError, match=message):
+        list(reader.records(typed=True))
+
+
+def test_reader_fixed_width_invalid(fixed_root):
+    """Tests that the fields of fixed-width flat files must have a
+    fixedLength.
+    """
+    fielddefinition = a.find_section_by_name(fixed_root, 'fieldDefinition',
+                                             'test2')
+    fielddefinition.remove(fielddefinition.find(a.addml_ns('fixedLength')))
+    with pytest.raises(ValueError, match="'test2' has no fixedLength"):
+        r.FlatFileReader(fixed_root, 'csvfile1.csv')
@@ -0,0 +1,97 @@
+"""Test for detecting the format of delimited flat files."""
+
+import pytest
+import xml_helpers.utils as h
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.sniffer as sn
+import addml.split_addml as s
+
+
+@pytest.mark.parametrize(('data', 'expected'), [
+    (b'a;b;c\r\n1;2;3\r\n4;5;6\r\n',
+     sn.SniffResult('UTF-8', 'CR+LF', ';', None)),
+    (b'a,b,c\n1,2,3\n4,5,6\n',
+     sn.SniffResult('UTF-8', 'LF', ',', None)),
+    (b'a\tb\rc\td\r',
+     sn.SniffResult('UTF-8', 'CR', '\t', None)),
+    (b'"a;1",b|c\r\n"d\r\ne",f|g\r\n',
+     sn.SniffResult('UTF-8', 'CR+LF', ',', '"')),
+    ("'ä';b\n'c';d\n".encode('iso-8859-15'),
+     sn.SniffResult('ISO-8859-15', 'LF', ';', "'")),
+    ('﻿ä|b\n'.encode('utf-8'),
+     sn.SniffResult('UTF-8', 'LF', '|', None)),
+    ('a\tb\r\nc\td\r\n'.encode('utf-16'),
+     sn.SniffResult('UTF-16', 'CR+LF', '\t', None)),
+    (b'single', sn.SniffResult('UTF-8', 'CR+LF', ';', None)),
+])
+def test_sniff_flatfile(tmp_path, data, expected):
+    """Tests that the format of the flat file is detected."""
+    path = tmp_path / 'file.csv'
+    path.write_bytes(data)
+    assert sn.sniff_flatfile(str(path)) == expected
+
+
+def test_sniff_flatfile_samples(tmp_path):
+    """Tests that the charset is detected from the samples of a file
+    larger than the samples, and that the last incomplete record of the
+    sample does not affect the detection.
+    """
+    path = tmp_path / 'file.csv'
+    record = 'abc;déf;ghi\r\n'.encode('utf-8')
+    path.write_bytes(record * 10000)
+    assert sn.sniff_flatfile(str(path), sample_size=100, samples=3) == \
+        sn.SniffResult('UTF-8', 'CR+LF', ';', None)
+
+    path.write_bytes(record * 5000 + b'\xe9' + record * 5000)
+    assert sn.sniff_flatfile(str(path), sample_size=100, samples=0) == \
+        sn.SniffResult('UTF-8', 'CR+LF', ';', None)
+    assert sn.sniff_flatfile(str(path), sample_size=100, samples=1) == \
+        sn.SniffResult('ISO-8859-15', 'CR+LF', ';', None)
+
+
+def test_sniff_flatfile_empty(tmp_path):
+    """Tests that the format of an empty file can not be detected."""
+    path = tmp_path / 'file.csv'
+    path.write_bytes(b'')
+    with pytest.raises(ValueError):
+        sn.sniff_flatfile(str(path))
+
+
+def test_sniff_directory(tmp_path):
+    """Tests that the flat files of a directory tree are detected and
+    the errors are reported.
+    """
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'file1.csv').write_bytes(b'a;b\r\n')
+    (tmp_path / 'sub' / 'file2.tsv').write_bytes(b'a\tb\n')
+    (tmp_path / 'sub' / 'file3.csv').write_bytes(b'')
+    (tmp_path / 'addml.xml').write_bytes(b'<addml/>')
+
+    results, errors = sn.sniff_directory(str(tmp_path), max_workers=2)
+    assert results == {
+        'file1.csv': sn.SniffResult('UTF-8', 'CR+LF', ';', None),
+        'sub/file2.tsv': sn.SniffResult('UTF-8', 'LF', '\t', None)}
+    assert list(errors) == ['sub/file3.csv']
+    assert sn.sniff_directory(str(tmp_path / 'sub' / 'missing')) == ({}, {})
+
+
+def test_sniffed_addml():
+    """Tests that the ADDML data created for the detected formats links
+    the flatFiles to flatFileTypes with the detected formats.
+    """
+    format1 = sn.SniffResult('UTF-8', 'CR+LF', ';', '"')
+    format2 = sn.SniffResult('ISO-8859-15', 'LF', ',', None)
+    root = sn.sniffed_addml({'file1.csv': format1, 'file2.csv': format2,
+                             'file3.csv': format1})
+
+    assert a.sections_count(root, 'flatFileDefinition') == 2
+    assert s.get_charsets_with_filenames(a.AddmlIndex(root)) == ({
+        'file1.csv': 'charset=UTF-8', 'file2.csv': 'charset=ISO-8859-15',
+        'file3.csv': 'charset=UTF-8'}, {})
+    assert h.compare_trees(
+        a.find_section_by_name(root, 'flatFileType', 'type1'),
+        f.definition_elems('flatFileType', 'type1', child_elements=[
+            f.addml_basic_elem('charset', 'UTF-8'),
+            f.delimfileformat('CR+LF', ';', '"')])) is True
@@ -1,9 +1,16 @@
 """Test for the ADDML flatFiles class."""
 
+import os
+import tracemalloc
+
+import pytest
+
 import addml.base as a
 import addml.flatfiles as f
 import addml.split_addml as s
+import lxml.etree as ET
 import xml_helpers.utils as h
+from benchmarks.generator import generate_addml, write_addml
 
 
 def test_parse_flatfiledefinitions_simple():
@@ -79,6 +86,117 @@ def test_parse_flatfiledefinitions_complex():
     assert i == 3
 
 
+def test_parse_flatfiledefinitions_stream():
+    """Tests that the parse_flatfiledefinitions function returns the
+    same ADDML data in streaming mode as when the whole file is parsed.
+    """
+    for addml in ['tests/data/addml_simple.xml',
+                  'tests/data/addml_medium.xml',
+                  'tests/data/addml_complex.xml']:
+        expected = [ET.tostring(addmls) for addmls
+                    in s.parse_flatfiledefinitions(addml)]
+        assert [ET.tostring(addmls) for addmls in
+                s.parse_flatfiledefinitions(addml, stream=True)] == expected
+
+
+def test_stream_flatfiledefinitions_memory(tmp_path):
+    """Tests that the flatFiles waiting for their flatFileDefinition are
+    not kept in memory when streaming, so that the peak memory use grows
+    only slowly with the number of flatFiles.
+    """
+    peaks = []
+    for flatfiles in (2000, 8000):
+        path = str(tmp_path / f'addml{flatfiles}.xml')
+        write_addml(generate_addml(flatfiles=flatfiles,
+                                   definitions=flatfiles // 20,
+                                   fielddefinitions=1), path)
+        tracemalloc.start()
+        for _ in s.stream_flatfiledefinitions(path):
+            pass
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    assert (peaks[1] - peaks[0]) / 6000 < 100
+
+
+def test_split_flatfiledefinitions():
+    """Tests the split_flatfiledefinitions function by asserting that
+    it returns the same ADDML data as create_new_addml for each
+    flatFileDefinition, and the original data when there is only one
+    flatFileDefinition.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    index = a.AddmlIndex(root)
+    splits = list(s.split_flatfiledefinitions(index))
+    assert len(splits) == 3
+    for ffdef, addmls in zip(f.iter_flatfiledefinitions(root), splits):
+        assert ET.tostring(addmls) == \
+            ET.tostring(s.create_new_addml(root, ffdef))
+    assert [ET.tostring(addmls) for addmls in
+            s.parse_flatfiledefinitions('tests/data/addml_complex.xml')] \
+        == [ET.tostring(addmls) for addmls in splits]
+
+    root = h.readfile('tests/data/addml_simple.xml').getroot()
+    assert list(s.split_flatfiledefinitions(root)) == [root]
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_select_flatfiledefinitions(stream):
+    """Tests that ADDML data is created only for the flatFileDefinitions
+    selected by name or by the names of their flatFiles, in the order of
+    the original data.
+    """
+    addml = 'tests/data/addml_complex.xml'
+    expected = {a.parse_name(next(f.iter_flatfiledefinitions(addmls))):
+                ET.tostring(addmls)
+                for addmls in s.parse_flatfiledefinitions(addml)}
+
+    selected = list(s.select_flatfiledefinitions(
+        addml, definitions=['testdef3', 'missing'],
+        flatfilenames=['csvfile5.csv', 'missing.csv'], stream=stream))
+    assert [ET.tostring(addmls) for addmls in selected] == \
+        [expected['testdef1'], expected['testdef3']]
+
+    selected = list(s.select_flatfiledefinitions(
+        addml, flatfilenames=['csvfile6.csv'], stream=stream))
+    assert [ET.tostring(addmls) for addmls in selected] == \
+        [expected['testdef2']]
+    assert f.flatfile_count(selected[0]) == 2
+
+    assert list(s.select_flatfiledefinitions(addml, stream=stream)) == []
+
+
+def test_stream_selected_stops_early(tmp_path):
+    """Tests that the streaming selection stops reading the data file
+    once the selected flatFileDefinitions and their types have been
+    read.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    root[0].append(ET.Comment('x' * 1000000))
+    path = tmp_path / 'addml.xml'
+    ET.ElementTree(root).write(str(path))
+
+    class Source:
+        """File-like object that counts the bytes read."""
+
+        def __init__(self):
+            self.infile = open(path, 'rb')
+            self.count = 0
+
+        def read(self, size=-1):
+            data = self.infile.read(size)
+            self.count += len(data)
+            return data
+
+    source = Source()
+    selected = list(s.stream_selected_flatfiledefinitions(
+        source, definitions=['testdef2']))
+    source.infile.close()
+    assert len(selected) == 1
+    assert a.sections_count(selected[0], 'flatFileType') == 1
+    assert a.sections_count(selected[0], 'recordType') == 1
+    assert source.count < 500000
+
+
 def test_parse_flatfilenames():
     """Tests the parse_flatfilenames function by asserting that the function
     returns the name attribute for each flatFile according to the
@@ -95,6 +213,15 @@ def test_parse_flatfilenames():
     assert i == 3
 
 
+def test_parse_flatfilenames_index():
+    """Tests that the parse_flatfilenames function accepts an AddmlIndex
+    in place of the path.
+    """
+    index = a.AddmlIndex(h.readfile('tests/data/addml_complex.xml'))
+    assert list(s.parse_flatfilenames(index, 'testdef2')) == \
+        ['csvfile2.csv', 'csvfile6.csv']
+
+
 def test_create_new_addml_simple():
     """Tests the create_new_addml function by supplying testdata to the
     function and asserting that the correct number of ADDML sections are
@@ -143,6 +270,44 @@ def test_get_charset_with_filename():
     assert charset == 'charset=ASCII'
 
 
+def test_single_lookup_without_index(monkeypatch):
+    """Tests that a single lookup from a path searches the parsed tree
+    instead of building an AddmlIndex of the whole document, unless
+    caching is enabled.
+    """
+    def no_index(*args):
+        raise AssertionError('AddmlIndex built for a single lookup')
+
+    monkeypatch.setattr(a.AddmlIndex, '__init__', no_index)
+    addml = 'tests/data/addml_complex.xml'
+    assert s.get_charset_with_filename(addml, 'csvfile3.csv') == \
+        'charset=ASCII'
+    assert s.get_charset_with_filename(addml, 'missing.csv') is None
+    assert list(s.parse_flatfilenames(addml, 'testdef2')) == \
+        ['csvfile2.csv', 'csvfile6.csv']
+
+
+def test_create_new_addml_index():
+    """Tests that create_new_addml gives the same result when the
+    sections are looked up from an AddmlIndex.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    index = a.AddmlIndex(root)
+    for ffdef in f.iter_flatfiledefinitions(root):
+        assert ET.tostring(s.create_new_addml(index, ffdef)) == \
+            ET.tostring(s.create_new_addml(root, ffdef))
+
+
+def test_get_charset_with_filename_index():
+    """Tests that get_charset_with_filename accepts an AddmlIndex in
+    place of the path.
+    """
+    index = a.AddmlIndex(h.readfile('tests/data/addml_complex.xml'))
+    assert s.get_charset_with_filename(index, 'csvfile2.csv') == \
+        'charset=ISO-8859-15'
+    assert s.get_charset_with_filename(index, 'csvfile7.csv') is None
+
+
 def test_get_charset_with_filename_nofile():
     """Tests that the get_charset_with_filename returns None if no
     flatfile was found with the supplied filename.
@@ -150,3 +315,116 @@ def test_get_charset_with_filename_nofile():
     addml = 'tests/data/addml_complex.xml'
     charset = s.get_charset_with_filename(addml, 'csvfile7.csv')
     assert charset is None
+
+
+def test_get_charsets_with_filenames():
+    """Asserts that the function get_charsets_with_filenames returns the
+    same charsets as get_charset_with_filename for all files or for the
+    given files.
+    """
+    addml = 'tests/data/addml_complex.xml'
+    charsets, errors = s.get_charsets_with_filenames(addml)
+    assert charsets == {
+        f'csvfile{i}.csv': s.get_charset_with_filename(
+            addml, f'csvfile{i}.csv') for i in range(1, 7)}
+    assert errors == {}
+
+    charsets, errors = s.get_charsets_with_filenames(
+        addml, ['csvfile3.csv', 'csvfile7.csv'])
+    assert charsets == {'csvfile3.csv': 'charset=ASCII',
+                        'csvfile7.csv': None}
+    assert errors == {}
+
+
+def test_get_charsets_with_filenames_dangling():
+    """Asserts that the function get_charsets_with_filenames reports
+    the files with broken references and still resolves the others.
+    """
+    file1 = f.definition_elems('flatFile', 'file1', reference='def1')
+    file2 = f.definition_elems('flatFile', 'file2', reference='def2')
+    file3 = f.definition_elems('flatFile', 'file3', reference='def3')
+    file4 = f.definition_elems('flatFile', 'file4', reference='def4')
+    def1 = f.definition_elems('flatFileDefinition', 'def1', reference='type1')
+    def2 = f.definition_elems('flatFileDefinition', 'def2', reference='type2')
+    def3 = f.definition_elems('flatFileDefinition', 'def3', reference='type3')
+    type1 = f.definition_elems('flatFileType', 'type1', child_elements=[
+        f.addml_basic_elem('charset', 'UTF-8')])
+    type3 = f.definition_elems('flatFileType', 'type3')
+    index = a.AddmlIndex(a.addml(child_elements=[
+        file1, file2, file3, file4, def1, def2, def3, type1, type3]))
+
+    charsets, errors = s.get_charsets_with_filenames(index)
+    assert charsets == {'file1': 'charset=UTF-8'}
+    assert errors == {
+        'file2': "flatFileType 'type2' not found",
+        'file3': "flatFileType 'type3' has no charset",
+        'file4': "flatFileDefinition 'def4' not found"}
+
+
+def _walk_addml_relpath(path):
+    """Finds the ADDML file with os.walk like check_addml_relpath used
+    to do, for comparing the results.
+    """
+    for root, _, files in os.walk(path):
+        if 'addml.xml' in files:
+            addml_relpath = os.path.relpath(root, path)
+            if addml_relpath == '.':
+                addml_relpath = ''
+            return addml_relpath, os.path.join(path, addml_relpath,
+                                               'addml.xml')
+    return False, False
+
+
+@pytest.fixture
+def package(tmp_path):
+    """Package directory with ADDML files in nested directories."""
+    for dirname in ['data/a', 'data/b/c', 'metadata/d', 'linked']:
+        os.makedirs(tmp_path / dirname)
+    for filename in ['data/file.csv', 'data/b/c/addml.xml',
+                     'metadata/d/addml.xml', 'linked/addml.xml']:
+        (tmp_path / filename).write_text('')
+    os.mkdir(tmp_path / 'data/a/addml.xml')
+    os.symlink(tmp_path / 'linked', tmp_path / 'data/link')
+    return str(tmp_path)
+
+
+def test_check_addml_relpath(package):
+    """Tests that check_addml_relpath finds the same ADDML file as
+    os.walk and that None is returned when there is no ADDML file.
+    """
+    result = s.check_addml_relpath(package)
+    assert result == _walk_addml_relpath(package)
+    assert result[1] == os.path.join(package, result[0], 'addml.xml')
+    assert os.path.isfile(result[1])
+
+    for subdir in ['data', 'data/a', 'data/b', 'metadata']:
+        path = os.path.join(package, subdir)
+        assert s.check_addml_relpath(path) == _walk_addml_relpath(path)
+
+    assert s.check_addml_relpath(os.path.join(package, 'data/a')) == \
+        (False, False)
+    assert s.check_addml_relpath(os.path.join(package, 'linked')) == \
+        ('', os.path.join(package, 'linked', 'addml.xml'))
+
+
+def test_scan_addml_relpath_options(package):
+    """Tests the maximum depth and skipped directories of
+    scan_addml_relpath.
+    """
+    data = os.path.join(package, 'data')
+    assert s.scan_addml_relpath(data, max_depth=1) == (False, False)
+    assert s.scan_addml_relpath(data, max_depth=2) == \
+        ('b/c', os.path.join(data, 'b/c', 'addml.xml'))
+    assert s.scan_addml_relpath(data, skip_dirs=['?']) == (False, False)
+    assert s.scan_addml_relpath(package, skip_dirs=['da*', 'linked']) == \
+        ('metadata/d', os.path.join(package, 'metadata/d', 'addml.xml'))
+
+
+def test_scan_addml_relpaths(package):
+    """Tests that scan_addml_relpaths returns the result of
+    scan_addml_relpath for each package.
+    """
+    paths = [os.path.join(package, subdir) for subdir
+             in ['data', 'data/a', 'metadata', 'linked', 'missing']]
+    assert s.scan_addml_relpaths(paths, max_workers=2) == {
+        path: s.scan_addml_relpath(path) for path in paths}
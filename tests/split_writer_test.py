@@ -0,0 +1,155 @@
+"""Test for writing split ADDML data to files."""
+
+import io
+import os
+
+import lxml.etree as ET
+import pytest
+import xml_helpers.utils as h
+
+import addml.base as a
+import addml.split_addml as s
+import addml.split_writer as w
+
+
+def test_write_flatfiledefinitions(tmp_path):
+    """Tests that write_flatfiledefinitions writes the same ADDML data
+    as parse_flatfiledefinitions returns, one file per
+    flatFileDefinition, and returns the manifest of the files.
+    """
+    addml = 'tests/data/addml_complex.xml'
+    directory = str(tmp_path / 'out')
+    manifest = w.write_flatfiledefinitions(addml, directory, max_workers=2)
+
+    assert manifest == {
+        f'testdef{i}': os.path.join(directory, f'testdef{i}.xml')
+        for i in range(1, 4)}
+    assert sorted(os.listdir(directory)) == \
+        ['testdef1.xml', 'testdef2.xml', 'testdef3.xml']
+    for name, addmldata in zip(manifest, s.parse_flatfiledefinitions(addml)):
+        written = ET.parse(manifest[name]).getroot()
+        assert ET.tostring(written) == ET.tostring(addmldata)
+
+
+def test_write_flatfiledefinitions_template(tmp_path):
+    """Tests that the output filenames are formatted from the template
+    and that the data of a single flatFileDefinition is written as such.
+    """
+    addml = 'tests/data/addml_simple.xml'
+    manifest = w.write_flatfiledefinitions(
+        addml, str(tmp_path), template='split-{index}-{name}.xml',
+        max_workers=1)
+    assert list(manifest.values()) == [
+        str(tmp_path / 'split-0-testdef.xml')]
+    assert ET.tostring(ET.parse(manifest['testdef']).getroot()) == \
+        ET.tostring(next(s.parse_flatfiledefinitions(addml)))
+
+
+@pytest.mark.parametrize('template', ['split.xml', '../{name}.xml', ''])
+def test_write_flatfiledefinitions_invalid(tmp_path, template):
+    """Tests that clashing or invalid output filenames are refused
+    before anything is written.
+    """
+    with pytest.raises(ValueError):
+        w.write_flatfiledefinitions('tests/data/addml_complex.xml',
+                                    str(tmp_path / 'out'),
+                                    template=template)
+    assert not os.path.exists(tmp_path / 'out')
+
+
+def test_write_addml(tmp_path):
+    """Tests that write_addml writes the ADDML data with an XML
+    declaration and leaves no temporary files behind.
+    """
+    addmldata = next(s.parse_flatfiledefinitions(
+        'tests/data/addml_simple.xml'))
+    path = str(tmp_path / 'addml.xml')
+    w.write_addml(addmldata, path)
+
+    with open(path, 'rb') as infile:
+        assert infile.read().startswith(
+            b"<?xml version='1.0' encoding='UTF-8'?>")
+    assert os.listdir(tmp_path) == ['addml.xml']
+
+
+def _complex_data(default_namespace):
+    """Returns the complex ADDML test data, optionally rewritten to use
+    the ADDML namespace as the default namespace.
+    """
+    with open('tests/data/addml_complex.xml', 'rb') as infile:
+        data = infile.read()
+    if default_namespace:
+        data = data.replace(b'addml:', b'').replace(b'xmlns:addml=',
+                                                    b'xmlns=')
+    return ET.fromstring(data)
+
+
+@pytest.mark.parametrize('default_namespace', [False, True])
+def test_write_new_addml(default_namespace):
+    """Tests that write_new_addml writes the same bytes as write_addml
+    writes for the ADDML data created by create_new_addml.
+    """
+    root = _complex_data(default_namespace)
+    index = a.AddmlIndex(root)
+    for ffdef in index.iter_sections('flatFileDefinition'):
+        expected = io.BytesIO()
+        ET.ElementTree(s.create_new_addml(index, ffdef)).write(
+            expected, xml_declaration=True, encoding='UTF-8')
+        output = io.BytesIO()
+        w.write_new_addml(root, ffdef, output)
+        assert output.getvalue() == expected.getvalue()
+
+
+def test_write_new_addml_path(tmp_path):
+    """Tests that write_new_addml writes to a file in the given path."""
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    ffdef = a.find_section_by_name(root, 'flatFileDefinition', 'testdef3')
+    path = str(tmp_path / 'testdef3.xml')
+    w.write_new_addml(root, ffdef, path)
+    assert ET.tostring(ET.parse(path).getroot()) == \
+        ET.tostring(s.create_new_addml(root, ffdef))
+
+
+def test_serialize_section():
+    """Tests that serialize_section leaves out the namespace
+    declarations of the ADDML root element.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    flatfile = a.find_section_by_name(root, 'flatFile', 'csvfile1.csv')
+    assert w.serialize_section(flatfile) == (
+        b'<addml:flatFile name="csvfile1.csv" '
+        b'definitionReference="testdef1"/>\n\t\t\t')
+
+
+def test_split_writer(monkeypatch):
+    """Tests that SplitWriter writes the same data as write_new_addml
+    and serializes each shared type section only once.
+    """
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    ffdefs = list(a.iter_sections(root, 'flatFileDefinition'))
+    expected = []
+    for ffdef in ffdefs:
+        output = io.BytesIO()
+        w.write_new_addml(root, ffdef, output)
+        expected.append(output.getvalue())
+
+    serialized = []
+    original = w.serialize_section
+
+    def serialize_section(section):
+        serialized.append(ET.QName(section).localname)
+        return original(section)
+
+    monkeypatch.setattr(w, 'serialize_section', serialize_section)
+    writer = w.SplitWriter(root)
+    for _ in range(2):
+        for ffdef, data in zip(ffdefs, expected):
+            output = io.BytesIO()
+            writer.write(ffdef, output)
+            assert output.getvalue() == data
+
+    assert serialized.count('fieldTypes') == 1
+    assert serialized.count('flatFileType') == 3
+    assert serialized.count('recordType') == 3
+    assert serialized.count('flatFile') == 12
+    assert serialized.count('flatFileDefinition') == 6
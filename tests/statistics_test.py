@@ -0,0 +1,96 @@
+"""Test for the record statistics of flat files."""
+
+import pytest
+import xml_helpers.utils as h
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.statistics as st
+
+
+@pytest.mark.parametrize(('data', 'separator', 'quoting_char', 'records'), [
+    (b'', 'CR+LF', None, 0),
+    (b'a;b\r\nc;d\r\n', 'CR+LF', None, 2),
+    (b'a;b\r\nc;d', 'CR+LF', None, 2),
+    (b'a\nb\r\nc\r\n', 'CR+LF', None, 2),
+    (b'a\nb\r\nc\r\n', 'LF', None, 3),
+    (b'a\rb\r', 'CR', None, 2),
+    (b'"a\r\n";b\r\n"c""\r\n"\r\n', 'CR+LF', '"', 2),
+    (b'"a\r\n";b\r\n"c""\r\n"\r\n', 'CR+LF', None, 4),
+])
+@pytest.mark.parametrize('block_size', [1, 2, 3, 1000])
+def test_count_records(tmp_path, data, separator, quoting_char, records,
+                       block_size):
+    """Tests that the records are counted regardless of the block size,
+    including separators split between blocks and quoted separators.
+    """
+    path = tmp_path / 'file.csv'
+    path.write_bytes(data)
+    assert st.count_records(str(path), separator, quoting_char,
+                            block_size=block_size) == records
+
+
+def test_count_records_unsupported(tmp_path):
+    """Tests that unsupported record separators are refused."""
+    path = tmp_path / 'file.csv'
+    path.write_bytes(b'a')
+    with pytest.raises(ValueError):
+        st.count_records(str(path), 'NL')
+
+
+@pytest.mark.parametrize(('charset', 'records'), [
+    ('UTF-8', 3), ('ISO-8859-15', 3), ('UTF-16', None), ('UTF-16LE', None),
+    ('unknown', None),
+])
+def test_count_records_charset(tmp_path, charset, records):
+    """Tests that the records are counted only in charsets that encode
+    the separators like ASCII.
+    """
+    path = tmp_path / 'file.csv'
+    codec = 'utf-8' if charset == 'unknown' else charset
+    path.write_bytes('a;ä\r\nb\r\nc\r\n'.encode(codec))
+    if records is None:
+        with pytest.raises(ValueError, match='charset'):
+            st.count_records(str(path), 'CR+LF', '"', charset=charset)
+    else:
+        assert st.count_records(str(path), 'CR+LF', '"',
+                                charset=charset) == records
+
+
+def test_add_flatfile_statistics(tmp_path):
+    """Tests that the statistics are added to the properties of the
+    flatFiles and replace the old statistics.
+    """
+    (tmp_path / 'csvfile1.csv').write_bytes(b'a;b;c\r\nd;e;f\r\n')
+    (tmp_path / 'csvfile3.csv').write_bytes(b'"a\r\n",b,c\r\n')
+    root = h.readfile('tests/data/addml_complex.xml').getroot()
+    flatfile = a.find_section_by_name(root, 'flatFile', 'csvfile1.csv')
+    flatfile.append(f.wrapper_elems('properties', [
+        f.definition_elems('property', 'other'),
+        f.definition_elems('property', st.RECORDS_PROPERTY)]))
+
+    results, errors = st.add_flatfile_statistics(
+        root, str(tmp_path), ['csvfile1.csv', 'csvfile3.csv',
+                              'csvfile4.csv', 'missing.csv'])
+    assert results == {'csvfile1.csv': st.FileStatistics(14, 2),
+                       'csvfile3.csv': st.FileStatistics(11, 1)}
+    assert sorted(errors) == ['csvfile4.csv', 'missing.csv']
+
+    # The charset of the flatFileType is used
+    (tmp_path / 'csvfile1.csv').write_bytes(
+        'a;b;c\r\nd;e;f\r\ng;h;i\r\n'.encode('utf-16'))
+    charset = a.find_section_by_name(root, 'flatFileType', 'testtype1') \
+        .find('.//' + a.addml_ns('charset'))
+    charset.text = 'UTF-16'
+    results, errors = st.add_flatfile_statistics(root, str(tmp_path),
+                                                 ['csvfile1.csv'])
+    assert results == {}
+    assert "charset 'UTF-16'" in errors['csvfile1.csv']
+
+    expected = f.wrapper_elems('properties', [
+        f.definition_elems('property', 'other'),
+        *st.statistics_properties(st.FileStatistics(14, 2))])
+    assert h.compare_trees(flatfile[0], expected) is True
+    assert [a.parse_name(prop) for prop in a.iter_sections(
+        a.find_section_by_name(root, 'flatFile', 'csvfile3.csv'),
+        'property')] == ['numberOfRecords', 'fileSize']
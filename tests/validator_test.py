@@ -0,0 +1,120 @@
+"""Test for validating flat files against their ADDML descriptions."""
+
+import pytest
+
+import addml.base as a
+import addml.flatfiles as f
+import addml.formats as fm
+import addml.validator as v
+
+VALID = (b'a;b;c\r\n'
+         b'"d;\r\n""e";f;g\r\n'
+         b'1;;3\r\n')
+
+
+def flatfile_format(**kwargs):
+    """Format of a flat file with three fields."""
+    fields = tuple(fm.FieldFormat(f'field{i}', 'string') for i in range(3))
+    values = {'name': 'file.csv', 'definition': 'def1',
+              'flatfiletype': 'type1', 'charset': 'UTF-8',
+              'record_separator': 'CR+LF', 'field_separator': ';',
+              'quoting_char': '"',
+              'records': (fm.RecordFormat('record1', fields),)}
+    values.update(kwargs)
+    return fm.FlatFileFormat(**values)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1000])
+def test_validate_flatfile(tmp_path, chunk_size):
+    """Tests that the errors are found with their offsets and record
+    numbers regardless of how the file is split into chunks.
+    """
+    path = tmp_path / 'file.csv'
+    path.write_bytes(VALID + b'h;i\r\n' + b'j;\xff;k\r\n' + b'"l;m;n\r\n')
+    assert v.validate_flatfile(str(path), flatfile_format(), max_workers=2,
+                               chunk_size=chunk_size) == [
+        v.ValidationError(28, 4, 'Record has 2 fields, expected 3'),
+        v.ValidationError(35, None, 'Data is not valid in the charset: '
+                                    'invalid start byte'),
+        v.ValidationError(40, 6, 'Quoted field is not terminated')]
+
+    path.write_bytes(VALID)
+    assert v.validate_flatfile(str(path), flatfile_format(), max_workers=2,
+                               chunk_size=chunk_size) == []
+
+
+def test_validate_flatfile_max_errors(tmp_path):
+    """Tests that the number of reported errors is limited."""
+    path = tmp_path / 'file.csv'
+    path.write_bytes(b'a\r\n' * 100)
+    errors = v.validate_flatfile(str(path), flatfile_format(),
+                                 max_workers=2, chunk_size=30, max_errors=5)
+    assert [error.record for error in errors] == [1, 2, 3, 4, 5]
+
+
+def test_validate_flatfile_charset_only(tmp_path):
+    """Tests that only the charset is checked when the separators can
+    not be found at byte level.
+    """
+    path = tmp_path / 'file.csv'
+    path.write_bytes('a;b\r\n'.encode('utf-16'))
+    assert v.validate_flatfile(str(path), flatfile_format(charset='UTF-16'),
+                               max_workers=1) == []
+    path.write_bytes('a;b\r\n'.encode('utf-16') + b'\x00')
+    assert v.validate_flatfile(
+        str(path), flatfile_format(charset='UTF-16'),
+        max_workers=1)[0].offset == 12
+
+
+@pytest.mark.parametrize('block_size', [1, 3, 1000])
+def test_decode_errors_blocks(block_size, monkeypatch):
+    """Tests that the charset errors are found at the same offsets when
+    the characters and the errors span the decoded blocks.
+    """
+    monkeypatch.setattr(v, '_DECODE_SIZE', block_size)
+    data = 'aä€'.encode('utf-8') + b'\xe2\x82b\xff' + 'ö'.encode('utf-8')
+    assert v._decode_errors(data, 0, len(data), 'utf-8', 10) == [
+        v.ValidationError(6, None, 'Data is not valid in the charset: '
+                                   'invalid continuation byte'),
+        v.ValidationError(9, None, 'Data is not valid in the charset: '
+                                   'invalid start byte')]
+    assert v._decode_errors(data, 10, len(data) - 1, 'utf-8', 10) == [
+        v.ValidationError(10, None, 'Data is not valid in the charset: '
+                                    'unexpected end of data')]
+
+
+def test_validate_flatfiles(tmp_path):
+    """Tests that the flat files described in the ADDML data are
+    validated and the files that can not be validated are reported.
+    """
+    (tmp_path / 'file1.csv').write_bytes(b'a;b;c\r\n')
+    (tmp_path / 'file2.csv').write_bytes(b'a;b\r\n')
+    fields = [f.definition_elems('fieldDefinition', f'field{i}', 'String')
+              for i in range(3)]
+    root = a.addml(child_elements=[f.wrapper_elems('flatFiles', [
+        f.definition_elems('flatFile', 'file1.csv', 'def1'),
+        f.definition_elems('flatFile', 'file2.csv', 'def1'),
+        f.definition_elems('flatFile', 'file3.csv', 'def1'),
+        f.definition_elems('flatFile', 'file4.csv', 'def2'),
+        f.wrapper_elems('flatFileDefinitions', [
+            f.definition_elems('flatFileDefinition', 'def1', 'type1', [
+                f.wrapper_elems('recordDefinitions', [
+                    f.definition_elems('recordDefinition', 'record1', None, [
+                        f.wrapper_elems('fieldDefinitions', fields)])])])]),
+        f.wrapper_elems('structureTypes', [
+            f.wrapper_elems('flatFileTypes', [
+                f.definition_elems('flatFileType', 'type1', None, [
+                    f.addml_basic_elem('charset', 'UTF-8'),
+                    f.delimfileformat('CR+LF', ';')])])])])])
+
+    results = v.validate_flatfiles(a.AddmlIndex(root), str(tmp_path),
+                                   max_workers=2)
+    assert results['file1.csv'] == []
+    assert results['file2.csv'] == [
+        v.ValidationError(0, 1, 'Record has 2 fields, expected 3')]
+    assert results['file3.csv'][0].record is None
+    assert results['file4.csv'] == [v.ValidationError(
+        0, None, "flatFileDefinition 'def2' not found")]
+    assert v.validate_flatfiles(a.AddmlIndex(root), str(tmp_path),
+                                ['file5.csv']) == {
+        'file5.csv': [v.ValidationError(0, None, 'flatFile not found')]}